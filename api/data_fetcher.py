@@ -1,7 +1,9 @@
 from dotenv import load_dotenv
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from api.key_processor import load_location_keys
+from api.request_scheduler import scheduler
 from utils.logging import log_api_interaction
 
 # Load the API key from the .env file or the github actions secrets
@@ -12,8 +14,16 @@ except Exception as e:
     API_KEY = os.environ("API_KEY")
     error_message = f"Error loading API key: {str(e)}"
 
+# Base URL of the AccuWeather API, can be pointed to a local stand-in server
+# e.g. ACCUWEATHER_BASE_URL=http://127.0.0.1:8000 (see benchmarks/)
+ACCUWEATHER_BASE_URL = os.getenv(
+    "ACCUWEATHER_BASE_URL", "http://dataservice.accuweather.com")
 
-def _12_hour_temperature_forecast(location_keys=load_location_keys()) -> dict:
+# Maximum number of locations fetched in parallel by the concurrent mode
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+
+
+def _12_hour_temperature_forecast(location_keys=None) -> dict:
     """
     Fetches the 12-hour temperature forecast for the given locations.
     Returns the forecast data in JSON format.
@@ -37,6 +47,9 @@ def _12_hour_temperature_forecast(location_keys=load_location_keys()) -> dict:
         and the value is the location key.
         e.g. {"Dwarka": "123456", "Najafgarh": "789012", ...}
     """
+    if location_keys is None:
+        location_keys = load_location_keys()
+
     # Final JSON response
     json_response = {}
 
@@ -45,15 +58,15 @@ def _12_hour_temperature_forecast(location_keys=load_location_keys()) -> dict:
     for location in location_keys:
         location_key = location_keys[location]
         HOURLY_URL = (
-            f'''http://dataservice.accuweather.com/forecasts/v1/hourly/12hour/
-            {location_key}'''
+            f"{ACCUWEATHER_BASE_URL}/forecasts/v1/hourly/12hour/"
+            f"{location_key}"
             )
         forecast_params = {
             "apikey": API_KEY,
             "metric": "true"
         }  # Metric for Celsius
 
-        forecast_response = requests.get(HOURLY_URL, params=forecast_params)
+        forecast_response = scheduler.get(HOURLY_URL, params=forecast_params)
         if forecast_response.status_code == 200:
             forecast_data = forecast_response.json()
             json_response[location] = forecast_data
@@ -67,3 +80,141 @@ def _12_hour_temperature_forecast(location_keys=load_location_keys()) -> dict:
         log_api_interaction(HOURLY_URL, "GET",
                             forecast_response.status_code, error_message)
     return json_response
+
+
+def _fetch_location_forecast(session, location_key) -> tuple:
+    """
+    Fetches the 12-hour forecast of a single location using a shared session.
+    Runs inside the worker threads of the concurrent fetch mode, hence it does
+    not touch the database; logging is left to the calling thread.
+
+    Returns a tuple of (request url, status code, forecast data or None).
+
+    Parameters:
+        session (requests.Session): A session shared by all the workers so
+        that the connections to the API are kept alive and reused.
+        location_key (str): The AccuWeather key of the location.
+    """
+    HOURLY_URL = (
+        f"{ACCUWEATHER_BASE_URL}/forecasts/v1/hourly/12hour/{location_key}"
+        )
+    forecast_params = {
+        "apikey": API_KEY,
+        "metric": "true"
+    }  # Metric for Celsius
+
+    forecast_response = scheduler.get(HOURLY_URL, params=forecast_params,
+                                      session=session)
+    if forecast_response.status_code == 200:
+        return HOURLY_URL, 200, forecast_response.json()
+    return HOURLY_URL, forecast_response.status_code, None
+
+
+def _12_hour_temperature_forecast_stream(
+        location_keys=None,
+        max_workers=FETCH_CONCURRENCY,
+        max_pending=None):
+    """
+    Streaming version of _12_hour_temperature_forecast_concurrent.
+    Fetches the forecasts of the locations in parallel on a bounded thread
+    pool sharing one keep-alive session, and yields (location, hours) as
+    each response comes in, in completion order; failed locations are
+    logged and skipped.
+
+    At most max_pending requests are submitted and not yet consumed, so a
+    slow consumer holds back the requests instead of piling up responses,
+    and the memory used does not grow with the number of locations.
+
+    API interactions are logged from the consuming thread as the responses
+    are yielded, so the database is never used from the worker threads.
+
+    Parameters:
+        location_keys (dict): A dictionary where the key is the location name
+        and the value is the location key.
+        e.g. {"Dwarka": "123456", "Najafgarh": "789012", ...}
+        Defaults to the keys of the bin file, loaded on call.
+        max_workers (int): Maximum number of requests in flight at once.
+        max_pending (int): Maximum number of requests submitted and not yet
+        consumed; defaults to twice max_workers.
+    """
+    if location_keys is None:
+        location_keys = load_location_keys()
+
+    max_workers = max(1, min(max_workers, len(location_keys) or 1))
+    if max_pending is None:
+        max_pending = 2 * max_workers
+    max_pending = max(max_workers, max_pending)
+    with requests.Session() as session:
+        # Size the keep-alive pool to the number of workers
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=max_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            locations = iter(location_keys)
+            futures = {}
+            while True:
+                # Keep up to max_pending requests submitted
+                for location in locations:
+                    futures[executor.submit(
+                        _fetch_location_forecast, session,
+                        location_keys[location])] = location
+                    if len(futures) >= max_pending:
+                        break
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    location = futures.pop(future)
+                    # Log Error Message
+                    error_message = ""
+                    try:
+                        HOURLY_URL, status_code, forecast_data = (
+                            future.result())
+                    except requests.RequestException as e:
+                        HOURLY_URL, status_code, forecast_data = (
+                            f"{ACCUWEATHER_BASE_URL}/forecasts/v1/hourly/"
+                            f"12hour/{location_keys[location]}", None, None)
+                        error_message = f"Error fetching forecast: {str(e)}"
+                        print("Error fetching forecast:", str(e))
+
+                    if forecast_data is None and status_code is not None:
+                        error_message = (
+                            f"Error fetching forecast: {status_code}"
+                            )
+                        print("Error fetching forecast:", status_code)
+
+                    # Log the API interaction details
+                    log_api_interaction(HOURLY_URL, "GET",
+                                        status_code, error_message)
+                    if forecast_data is not None:
+                        yield location, forecast_data
+
+
+def _12_hour_temperature_forecast_concurrent(
+        location_keys=None,
+        max_workers=FETCH_CONCURRENCY) -> dict:
+    """
+    Concurrent version of _12_hour_temperature_forecast.
+    Fetches the forecasts of all the locations in parallel on a bounded
+    thread pool sharing one keep-alive session (see
+    _12_hour_temperature_forecast_stream), and returns the same
+    {location: [hours...]} dictionary in the order of location_keys.
+
+    Parameters:
+        location_keys (dict): A dictionary where the key is the location name
+        and the value is the location key.
+        e.g. {"Dwarka": "123456", "Najafgarh": "789012", ...}
+        Defaults to the keys of the bin file, loaded on call.
+        max_workers (int): Maximum number of requests in flight at once.
+    """
+    if location_keys is None:
+        location_keys = load_location_keys()
+    # Forecast data by location, in completion order
+    fetched = dict(_12_hour_temperature_forecast_stream(
+        location_keys, max_workers, max_pending=len(location_keys)))
+
+    # Keep the same location order as the sequential fetch
+    return {location: fetched[location]
+            for location in location_keys if location in fetched}
@@ -2,6 +2,7 @@ import pickle
 from dotenv import load_dotenv
 import os
 import requests
+from api.request_scheduler import scheduler
 from utils.logging import log_api_interaction
 
 # Load the API key from the .env file or the github actions secrets
@@ -12,6 +13,16 @@ except Exception as e:
     API_KEY = os.environ("API_KEY")
     error_message = f"Error loading API key: {str(e)}"
 
+# Base URL of the AccuWeather API, can be pointed to a local stand-in server
+ACCUWEATHER_BASE_URL = os.getenv(
+    "ACCUWEATHER_BASE_URL", "http://dataservice.accuweather.com")
+
+
+class LocationKeyError(requests.RequestException):
+    """
+    Raised when the key of a location cannot be fetched.
+    """
+
 
 def get_location_keys(locations) -> dict:
     """
@@ -25,35 +36,43 @@ def get_location_keys(locations) -> dict:
         dict: A dictionary where the key is the location name and the value is
         the location key.
         e.g. {"Dwarka": "123456", "Najafgarh": "789012", ...}
+
+    Raises:
+        LocationKeyError: if a location's key cannot be fetched (after the
+        retries of the scheduler), once the failed request is logged.
     """
     # Log Error Message
     error_message = ""
 
     location_keys = {}
     LOCATION_URL = (
-        "http://dataservice.accuweather.com/locations/v1/cities/search"
+        f"{ACCUWEATHER_BASE_URL}/locations/v1/cities/search"
         )
     for LOCATION in locations:
         location_params = {"apikey": API_KEY, "q": LOCATION}
 
         # Make a request to the API to get location data
-        location_response = requests.get(LOCATION_URL, params=location_params)
+        location_response = scheduler.get(LOCATION_URL,
+                                          params=location_params)
         if location_response.status_code == 200:
             location_data = location_response.json()
-            location_key = location_data[0]["Key"]
-            # storing location data in a dictionary
-            location_keys[LOCATION] = location_key
+            if location_data:
+                location_key = location_data[0]["Key"]
+                # storing location data in a dictionary
+                location_keys[LOCATION] = location_key
+            else:
+                error_message = f"No location found for {LOCATION}"
         else:
             error_message = (
                 f"Error fetching location key: {location_response.status_code}"
                 )
-            print("Error fetching location key:",
-                  location_response.status_code)
-            exit()
 
         # Log the API interaction details
         log_api_interaction(LOCATION_URL, "GET",
                             location_response.status_code, error_message)
+        if error_message:
+            print(error_message)
+            raise LocationKeyError(error_message, response=location_response)
     return location_keys
 
 
@@ -0,0 +1,262 @@
+import os
+import math
+import random
+import threading
+import time
+import datetime
+import email.utils
+import requests
+from dotenv import load_dotenv
+
+# Load the rate limit configuration from the .env file or the environment
+load_dotenv()
+# Sustained requests per second allowed for a single API key, 0 means the
+# requests are not paced
+RATE_LIMIT = float(os.getenv("ACCUWEATHER_RATE_LIMIT", "5"))
+# Number of requests that can be fired at once before the rate applies
+BURST = int(os.getenv("ACCUWEATHER_BURST", "10"))
+# Calls allowed per API key per (UTC) day, 0 means no budget is enforced;
+# the calls logged earlier in the day (e.g. by the previous populate runs,
+# each a process of its own) count against it, see usage_source
+DAILY_QUOTA = int(os.getenv("ACCUWEATHER_DAILY_QUOTA", "0"))
+# Attempts made after the first one for a transient failure
+MAX_RETRIES = int(os.getenv("ACCUWEATHER_MAX_RETRIES", "4"))
+
+# Status codes worth retrying: rate limited or a temporary server error
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class QuotaExceeded(requests.RequestException):
+    """
+    Raised when a request would overrun the daily quota of an API key.
+    """
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket: holds up to `capacity` tokens which are
+    refilled at `rate` tokens per second; a rate of 0 (or less) never
+    makes a caller wait.
+
+    Methods:
+        - acquire(none) -> blocks until a token is available and returns
+        the number of seconds spent waiting.
+    """
+
+    def __init__(self, rate, capacity) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Takes a token from the bucket, waiting for the refill if empty.
+
+        Parameters:
+            none
+        """
+        waited = 0.0
+        if self.rate <= 0:
+            return waited
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class RequestScheduler:
+    """
+    Paces the AccuWeather API calls of every caller in the process.
+    Each API key gets its own token bucket and daily quota budget, and
+    transient failures (429, 5xx, connection errors) are retried with
+    jittered exponential backoff, honouring the Retry-After header.
+
+    Methods:
+        - get(url, params, session) -> performs a paced GET request and
+        returns the response.
+        - metrics(none) -> returns the throttle and retry counters.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=BURST, daily_quota=DAILY_QUOTA,
+                 max_retries=MAX_RETRIES, backoff_base=0.5,
+                 backoff_cap=30.0, usage_source=None) -> None:
+        """
+        Initializes the scheduler with the per key rate (requests/second),
+        burst size, daily quota (0 for none) and the retry policy.
+
+        usage_source, if set, returns the calls already made today (UTC)
+        by other processes, e.g. api_calls_logged_today in
+        utils/logging.py; the quota used of a key starts from it on its
+        first call of the day (False or None counts as 0).
+        """
+        self.rate = rate
+        self.burst = burst
+        self.daily_quota = daily_quota
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.usage_source = usage_source
+
+        self._buckets = {}
+        self._quota_used = {}  # (api key, utc date) -> calls made
+        self._lock = threading.Lock()
+        self._metrics = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "throttle_waits": 0,
+            "throttle_wait_seconds": 0.0,
+            "backoff_seconds": 0.0,
+            "quota_rejections": 0,
+            "bytes_received": 0,
+        }
+
+    def get(self, url, params=None, session=None) -> requests.Response:
+        """
+        Performs a GET request once the rate limit and the quota allow it,
+        retrying transient failures. The last response is returned when the
+        retries are exhausted, so callers keep checking the status code.
+
+        Parameters:
+            url (str): The url of the API endpoint.
+            params (dict): The query parameters, including the apikey.
+            session (requests.Session): Optional session to send the request
+            with, e.g. the keep-alive session of the concurrent fetcher.
+        """
+        params = params or {}
+        api_key = params.get("apikey")
+        bucket = self._bucket(api_key)
+        sender = session or requests
+
+        for attempt in range(self.max_retries + 1):
+            self._consume_quota(api_key)
+            waited = bucket.acquire()
+            self._record_wait(waited)
+
+            try:
+                response = sender.get(url, params=params)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    self._increment("failures")
+                    raise
+                self._backoff(attempt, None)
+                continue
+            with self._lock:
+                self._metrics["bytes_received"] += len(response.content)
+
+            if (response.status_code not in TRANSIENT_STATUS_CODES
+                    or attempt == self.max_retries):
+                if response.status_code != 200:
+                    self._increment("failures")
+                return response
+            self._backoff(attempt, response.headers.get("Retry-After"))
+        return response
+
+    def metrics(self) -> dict:
+        """
+        Returns a copy of the counters, including the quota used today.
+
+        Parameters:
+            none
+        """
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["quota_used_today"] = sum(
+                used for (_, day), used in self._quota_used.items()
+                if day == today)
+        return metrics
+
+    def _bucket(self, api_key) -> TokenBucket:
+        with self._lock:
+            if api_key not in self._buckets:
+                self._buckets[api_key] = TokenBucket(self.rate, self.burst)
+            return self._buckets[api_key]
+
+    def _consume_quota(self, api_key) -> None:
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        if self.daily_quota and (api_key, today) not in self._quota_used:
+            self._seed_quota(api_key, today)
+        with self._lock:
+            used = self._quota_used.get((api_key, today), 0)
+            if self.daily_quota and used >= self.daily_quota:
+                self._metrics["quota_rejections"] += 1
+                raise QuotaExceeded(
+                    f"Daily quota of {self.daily_quota} calls exhausted")
+            self._quota_used[(api_key, today)] = used + 1
+            self._metrics["requests"] += 1
+
+    def _seed_quota(self, api_key, today) -> None:
+        # The calls made earlier today by other processes, read once per
+        # key and day (outside of the lock, as it may be a query)
+        used = self.usage_source() if self.usage_source else 0
+        with self._lock:
+            self._quota_used.setdefault((api_key, today), used or 0)
+
+    def _backoff(self, attempt, retry_after) -> None:
+        # Full jitter: a random delay up to the exponential ceiling,
+        # unless the server told us how long to wait; either way no longer
+        # than backoff_cap
+        delay = retry_after_seconds(retry_after)
+        if delay is None:
+            delay = random.uniform(
+                0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        delay = min(max(delay, 0.0), self.backoff_cap)
+        with self._lock:
+            self._metrics["retries"] += 1
+            self._metrics["backoff_seconds"] += delay
+        time.sleep(delay)
+
+    def _record_wait(self, waited) -> None:
+        if waited:
+            with self._lock:
+                self._metrics["throttle_waits"] += 1
+                self._metrics["throttle_wait_seconds"] += waited
+
+    def _increment(self, counter) -> None:
+        with self._lock:
+            self._metrics[counter] += 1
+
+
+def retry_after_seconds(retry_after) -> any:
+    """
+    Returns the seconds to wait of a Retry-After header, given as seconds
+    or as an HTTP date, or None if there is none or it cannot be read. The
+    result may be negative, e.g. for a date already past.
+
+    Parameters:
+        retry_after (str): The header value.
+        e.g. "120", "Wed, 21 Oct 2015 07:28:00 GMT"
+    """
+    if retry_after is None:
+        return None
+    try:
+        seconds = float(retry_after)
+        return seconds if math.isfinite(seconds) else None
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at is None:
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (retry_at - now).total_seconds()
+
+
+# Shared scheduler used by every AccuWeather caller in the process
+scheduler = RequestScheduler()
@@ -0,0 +1,515 @@
+"""
+End-to-end benchmark of the pipeline, offline: the fake AccuWeather server
+(benchmarks/fake_accuweather.py) stands in for the API and a throwaway
+local Postgres cluster (initdb / pg_ctl from PATH) for NeonDB.
+
+Stages measured:
+    - fetch: forecasts fetched per second by the concurrent fetcher.
+    - ingest: rows/sec of the bulk COPY of a synthetic history, and of
+      whole populate() runs (fetch, sync, transform, insert, logs).
+    - queries: latency percentiles of the dashboard queries (chart data,
+      CSV download rows, streamed download) over random date ranges.
+    - formatting: cost of the JSON (rows of objects and columns) and CSV
+      responses of the backend.
+
+The results are written as JSON (--report) and can be compared with an
+earlier report (--compare). Run from the repository root:
+    python -m benchmarks.e2e_benchmark --locations 50 --days 30
+    python -m benchmarks.e2e_benchmark --database-url postgresql://...
+        --report after.json --compare before.json
+
+initdb refuses to run as root; use --database-url with an empty scratch
+database instead. The repository modules are imported once the database
+is known, as the connection strings are read on import.
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "frontend", "flask-backend")
+
+# Tables populate() expects before the migrations (see db/schema.txt)
+BASE_SCHEMA = """CREATE TABLE locations (
+    location_id SERIAL PRIMARY KEY,
+    location_name VARCHAR(255) NOT NULL,
+    unique_key VARCHAR(255) UNIQUE NOT NULL);
+CREATE TABLE temperature_predictions (
+    id SERIAL PRIMARY KEY,
+    location_id INT REFERENCES locations(location_id),
+    forecast_for_hour TIMESTAMP NOT NULL,
+    forecast_made_at TIMESTAMP NOT NULL,
+    temperature FLOAT NOT NULL);
+CREATE INDEX idx_forecast
+ON temperature_predictions(location_id, forecast_for_hour, forecast_made_at);
+CREATE TABLE populate_logs (
+    populate_id SERIAL PRIMARY KEY,
+    timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    status VARCHAR(10) NOT NULL,
+    error_message TEXT);
+CREATE TABLE db_transaction_logs (
+    log_id SERIAL PRIMARY KEY,
+    id INT REFERENCES temperature_predictions(id),
+    timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    operation_type VARCHAR(20) NOT NULL,
+    status VARCHAR(10) NOT NULL,
+    error_message TEXT,
+    populate_id INT REFERENCES populate_logs(populate_id));
+CREATE TABLE api_logs (
+    log_id SERIAL PRIMARY KEY,
+    timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    request_url TEXT NOT NULL,
+    request_method VARCHAR(10) NOT NULL,
+    response_status INTEGER,
+    error_message TEXT,
+    populate_id INT REFERENCES populate_logs(populate_id));"""
+
+PREDICTION_COLUMNS = """(location_id, forecast_made_at, forecast_for_hour,
+                 temperature)"""
+
+
+class LocalPostgres:
+    """
+    A throwaway Postgres cluster in a temporary folder, listening on a unix
+    socket only, removed on exit.
+
+    Methods:
+        - start(none) -> creates and starts the cluster, returns its DSN.
+        - stop(none) -> stops the cluster and removes its folder.
+    """
+
+    def __init__(self) -> None:
+        self.folder = None
+        self.data = None
+
+    def start(self) -> str:
+        """
+        Creates and starts the cluster and returns its connection string.
+        """
+        initdb, pg_ctl = binary("initdb"), binary("pg_ctl")
+        self.folder = tempfile.mkdtemp(prefix="forecast_journal_pg_")
+        self.data = os.path.join(self.folder, "data")
+        port = free_port()
+        subprocess.run([initdb, "-D", self.data, "-U", "postgres",
+                        "-A", "trust", "--no-sync"], check=True,
+                       capture_output=True)
+        subprocess.run([pg_ctl, "-D", self.data, "-w", "-l",
+                        os.path.join(self.folder, "postgres.log"), "-o",
+                        f"-p {port} -k {self.folder} -c listen_addresses=''"
+                        " -c fsync=off", "start"], check=True,
+                       capture_output=True)
+        return (f"host={self.folder} port={port} user=postgres "
+                "dbname=postgres")
+
+    def stop(self) -> None:
+        """
+        Stops the cluster and removes its folder.
+        """
+        if self.data and os.path.exists(self.data):
+            subprocess.run([binary("pg_ctl"), "-D", self.data, "-w", "-m",
+                            "fast", "stop"], capture_output=True)
+        if self.folder:
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def binary(name) -> str:
+    """
+    Returns the path of a Postgres program, from PATH or pg_config.
+    """
+    path = shutil.which(name)
+    if path is None and shutil.which("pg_config"):
+        bindir = subprocess.run(["pg_config", "--bindir"], check=True,
+                                capture_output=True, text=True).stdout
+        path = shutil.which(name, path=bindir.strip())
+    if path is None:
+        raise RuntimeError(f"{name} not found; install Postgres or pass "
+                           "--database-url")
+    return path
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(samples) -> dict:
+    """
+    Returns the count, mean, p50/p90/p95/p99 and max of latencies in
+    seconds, as milliseconds.
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def rank(p):
+        # Nearest rank: the smallest sample above p% of the samples
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": rank(50) * 1000,
+        "p90_ms": rank(90) * 1000,
+        "p95_ms": rank(95) * 1000,
+        "p99_ms": rank(99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def timed(function) -> tuple:
+    """
+    Returns the wall time of a call and its result.
+    """
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def prepare_database() -> dict:
+    """
+    Creates the base tables, applies the migrations and the unique index
+    of the natural key, and returns the server version.
+    """
+    from db.data_crud import cpool
+    from db.migrations import migrate, MIGRATIONS
+    from db.compaction import CREATE_UNIQUE_INDEX_QUERY
+
+    conn, cur = cpool.get_connection()
+    try:
+        cur.execute("SELECT to_regclass('locations'), version();")
+        existing, version = cur.fetchone()
+        if existing is not None:
+            raise RuntimeError("The database already has a locations table;"
+                               " use an empty scratch database.")
+        cur.execute(BASE_SCHEMA)
+        conn.commit()
+    finally:
+        cpool.close_connection(conn, cur)
+
+    applied = migrate()
+    if len(applied) != len(MIGRATIONS):
+        raise RuntimeError("A migration failed, see above.")
+    conn, cur = cpool.get_connection()
+    cur.execute(CREATE_UNIQUE_INDEX_QUERY)
+    conn.commit()
+    cpool.close_connection(conn, cur)
+    return {"server_version": version, "migrations": applied}
+
+
+def seed_history(location_keys, days) -> dict:
+    """
+    Bulk loads days of hourly runs (12 forecasts each) for every location
+    with one COPY, refreshes the forecast errors, and returns the rates.
+    """
+    from db.data_crud import sync_locations, copy_data_skip_duplicates
+    from db.forecast_errors import backfill_forecast_errors
+    from db.partitions import ensure_partitions
+
+    location_ids, _ = sync_locations(location_keys)
+    now = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+    first_run = now - datetime.timedelta(days=days)
+    # The monthly partitions of the whole history, so that no row lands in
+    # the default one
+    months = ((now.year - first_run.year) * 12 + now.month - first_run.month
+              + 1)
+    ensure_partitions(months_ahead=months, today=first_run.date())
+
+    rows = []
+    for name, location_id in sorted(location_ids.items()):
+        run = first_run
+        while run < now:
+            made_at = run + datetime.timedelta(minutes=12, seconds=location_id
+                                               % 60)
+            for hour in range(1, 13):
+                for_hour = run + datetime.timedelta(hours=hour)
+                rows.append((location_id, made_at, for_hour,
+                             round(15 + (location_id + for_hour.hour) % 15
+                                   + 0.1 * hour, 1)))
+            run += datetime.timedelta(hours=1)
+
+    copy_time, inserted = timed(lambda: copy_data_skip_duplicates(
+        "temperature_predictions", (PREDICTION_COLUMNS, *rows)))
+    if inserted is False:
+        raise RuntimeError("Seeding the history failed.")
+    errors_time, _ = timed(backfill_forecast_errors)
+    return {
+        "rows": inserted,
+        "copy_seconds": copy_time,
+        "rows_per_second": inserted / copy_time,
+        "forecast_errors_backfill_seconds": errors_time,
+        "first_hour": first_run.isoformat(),
+        "last_hour": now.isoformat(),
+    }
+
+
+def benchmark_populate(location_keys, runs) -> dict:
+    """
+    Times whole populate() runs against the fake API, with the location
+    keys file of the fake locations. Runs within the same hour skip the
+    rows of the first one as duplicates, as a retried job would.
+    """
+    from api.key_processor import store_location_keys
+    from scripts.populate import populate
+
+    folder = tempfile.mkdtemp(prefix="forecast_journal_keys_")
+    cwd = os.getcwd()
+    samples = []
+    try:
+        # populate() loads location_keys.bin from the working folder
+        os.chdir(folder)
+        store_location_keys(location_keys)
+        for _ in range(runs):
+            elapsed, _ = timed(populate)
+            samples.append(elapsed)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder, ignore_errors=True)
+    rows = len(location_keys) * 12
+    return {
+        "runs": runs,
+        "rows_per_run": rows,
+        "run_seconds": percentiles(samples),
+        "rows_per_second": rows / (sum(samples) / len(samples)),
+    }
+
+
+def benchmark_fetch(location_keys, repeat) -> dict:
+    """
+    Times the concurrent fetcher alone; its API logs are buffered.
+    """
+    import api.data_fetcher as data_fetcher
+    from api.request_scheduler import scheduler
+    from utils.logging import LogBuffer
+
+    samples = []
+    for _ in range(repeat):
+        with LogBuffer():
+            elapsed, fetched = timed(
+                lambda: data_fetcher._12_hour_temperature_forecast_concurrent(
+                    location_keys))
+        samples.append(elapsed)
+    best = min(samples)
+    return {
+        "locations": len(location_keys),
+        "fetched": len(fetched),
+        "seconds": percentiles(samples),
+        "locations_per_second": len(location_keys) / best,
+        "scheduler": scheduler.metrics(),
+    }
+
+
+def benchmark_queries(cities, first_hour, last_hour, iterations,
+                      window_days) -> tuple:
+    """
+    Times the dashboard queries over random windows of window_days and
+    returns the percentiles and the rows of the widest window, for the
+    formatting stage.
+    """
+    from services.query_handler import (
+        chart_data_by_city_and_date_range,
+        get_date_range_temperature_data_by_city,
+        stream_date_range_temperature_data_by_city)
+
+    first = datetime.datetime.fromisoformat(first_hour)
+    last = datetime.datetime.fromisoformat(last_hour)
+    window = datetime.timedelta(days=window_days)
+    span = max(0, int((last - first - window).total_seconds()))
+    samples = {"chart": [], "download": [], "download_stream": []}
+    rng = random.Random(0)
+    for _ in range(iterations):
+        city = rng.choice(cities)
+        start = first + datetime.timedelta(seconds=rng.randint(0, span))
+        start_date = start.strftime("%Y-%m-%d %H:%M:%S")
+        end_date = (start + window).strftime("%Y-%m-%d %H:%M:%S")
+
+        elapsed, _ = timed(lambda: chart_data_by_city_and_date_range(
+            city, start_date, end_date))
+        samples["chart"].append(elapsed)
+        elapsed, _ = timed(lambda: get_date_range_temperature_data_by_city(
+            city, start_date, end_date))
+        samples["download"].append(elapsed)
+        elapsed, _ = timed(lambda: sum(
+            len(batch) for batch in
+            stream_date_range_temperature_data_by_city(
+                city, start_date, end_date) or ()))
+        samples["download_stream"].append(elapsed)
+
+    start_date, end_date = first_hour, last_hour
+    chart_rows = chart_data_by_city_and_date_range(cities[0], start_date,
+                                                   end_date)
+    download_rows = get_date_range_temperature_data_by_city(
+        cities[0], start_date, end_date)
+    return ({name: percentiles(values) for name, values in samples.items()},
+            chart_rows, download_rows)
+
+
+def benchmark_formatting(chart_rows, download_rows, repeat) -> dict:
+    """
+    Times the JSON and CSV responses built from the rows of the widest
+    window.
+    """
+    from services.data_formatter import (
+        convert_db_data_to_frontend_json, convert_db_data_to_frontend_columns,
+        dumps_json, convert_db_data_to_csv_download,
+        stream_db_data_to_csv_download)
+
+    def best(function):
+        results = [timed(function) for _ in range(repeat)]
+        elapsed = min(result[0] for result in results)
+        return {"ms": elapsed * 1000, "bytes": len(results[-1][1])}
+
+    return {
+        "chart_rows": len(chart_rows),
+        "download_rows": len(download_rows),
+        "json_rows_of_objects": best(lambda: json.dumps(
+            convert_db_data_to_frontend_json(list(chart_rows))).encode()),
+        "json_columns": best(lambda: dumps_json(
+            convert_db_data_to_frontend_columns(chart_rows))),
+        "csv": best(lambda: convert_db_data_to_csv_download(
+            list(download_rows)).encode()),
+        "csv_streamed": best(lambda: "".join(stream_db_data_to_csv_download(
+            [download_rows[i:i + 2000]
+             for i in range(0, len(download_rows), 2000)])).encode()),
+    }
+
+
+def compare(report, baseline, path="") -> list:
+    """
+    Returns (metric, baseline value, value, ratio) of every number of the
+    report also in the baseline.
+    """
+    rows = []
+    for key, value in report.items():
+        name = f"{path}.{key}" if path else key
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            rows.extend(compare(value, old or {}, name))
+        elif (isinstance(value, (int, float)) and not isinstance(value, bool)
+              and isinstance(old, (int, float)) and old):
+            rows.append((name, old, value, value / old))
+    return rows
+
+
+def run_suite(args, database_url) -> dict:
+    """
+    Runs every stage against the given database and returns the report.
+    """
+    # Read by db/conn.py on import, so set before any repository import
+    os.environ["DATABASE_URL_MASTER"] = database_url
+    # Every range is served by the master database
+    os.environ["DB_FEDERATION_SPANS"] = "3:2000-01-01:"
+    sys.path.insert(0, ROOT)
+    # services.* and db.data_r of the backend; the rest of db comes from
+    # the repository root, where the same modules read the same database
+    sys.path.append(BACKEND)
+
+    from benchmarks.fake_accuweather import (FakeAccuWeatherServer,
+                                             fake_location_keys)
+    import api.data_fetcher as data_fetcher
+
+    report = {
+        "config": vars(args).copy(),
+        "environment": {"python": platform.python_version(),
+                        "platform": platform.platform()},
+    }
+    for option in ("compare", "report", "database_url"):
+        report["config"].pop(option, None)
+    report["environment"].update(prepare_database())
+
+    location_keys = fake_location_keys(args.locations)
+    print(f"Seeding {args.days} days of history for {args.locations} "
+          "locations...")
+    history = seed_history(location_keys, args.days)
+    report["ingest"] = {"bulk_copy": history}
+
+    with FakeAccuWeatherServer(latency=args.latency,
+                               error_rate=args.error_rate) as server:
+        data_fetcher.ACCUWEATHER_BASE_URL = server.base_url
+        print("Running populate()...")
+        report["ingest"]["populate"] = benchmark_populate(location_keys,
+                                                          args.runs)
+        print("Fetching...")
+        report["fetch"] = benchmark_fetch(location_keys, args.repeat)
+        report["fetch"]["api_requests"] = server.request_count
+
+    print("Querying...")
+    queries, chart_rows, download_rows = benchmark_queries(
+        sorted(location_keys), history["first_hour"], history["last_hour"],
+        args.queries, args.window_days)
+    report["queries"] = queries
+    print("Formatting...")
+    report["formatting"] = benchmark_formatting(chart_rows or [],
+                                                download_rows or [],
+                                                args.repeat)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--locations", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30,
+                        help="days of synthetic history to seed")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds per fake API request")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of fake API requests answered 503")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="populate() runs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200,
+                        help="dashboard queries of each kind")
+    parser.add_argument("--window-days", type=int, default=7)
+    parser.add_argument("--database-url",
+                        help="empty scratch database, instead of a local "
+                             "cluster")
+    parser.add_argument("--report", default="e2e_report.json")
+    parser.add_argument("--compare", help="earlier report to compare with")
+    args = parser.parse_args()
+
+    if args.database_url:
+        report = run_suite(args, args.database_url)
+    else:
+        with LocalPostgres() as postgres:
+            report = run_suite(args, postgres.start())
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Report written to {args.report}")
+    print(f"fetch: {report['fetch']['locations_per_second']:.1f} "
+          "locations/sec")
+    print(f"ingest: {report['ingest']['bulk_copy']['rows_per_second']:,.0f}"
+          " rows/sec (COPY), "
+          f"{report['ingest']['populate']['rows_per_second']:,.0f} rows/sec "
+          "(populate)")
+    for name, stats in report["queries"].items():
+        print(f"{name}: p50 {stats.get('p50_ms', 0):.1f} ms, "
+              f"p95 {stats.get('p95_ms', 0):.1f} ms")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} (ratio = new / old):")
+        for name, old, new, ratio in compare(report, baseline):
+            if name.startswith(("config.", "environment.")):
+                continue
+            print(f"{name:<55}{old:>14.3f}{new:>14.3f}{ratio:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
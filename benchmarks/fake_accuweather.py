@@ -0,0 +1,176 @@
+import json
+import random
+import threading
+import time
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FakeAccuWeatherServer:
+    """
+    A local stand-in for the AccuWeather endpoints used by the project,
+    served from a background thread. Used to test and benchmark the fetchers
+    without spending the API quota.
+
+    Serves:
+        - /forecasts/v1/hourly/12hour/<location_key>
+        - /locations/v1/cities/search?q=<location_name>
+
+    Methods:
+        - start(none) -> starts the server and returns its base url.
+        - stop(none) -> shuts the server down.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, host="127.0.0.1",
+                 port=0, statuses=None) -> None:
+        """
+        Initializes the server with the simulated latency (seconds per
+        request), the fraction of requests answered with a 503 and the
+        status code always answered for some location keys or searched
+        location names, e.g. {"123456": 404, "Dwarka": 503}.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.statuses = statuses or {}
+        self.request_count = 0
+        # Requests being answered, and the most answered at once
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        """
+        Starts serving in a daemon thread and returns the base url.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        """
+        Shuts the server down.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.request_count += 1
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight,
+                                             fake.in_flight)
+                try:
+                    self._answer()
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+            def _answer(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if fake.error_rate and random.random() < fake.error_rate:
+                    return self._send(503, {"Message": "Service Unavailable"})
+
+                url = urlparse(self.path)
+                if url.path.startswith("/forecasts/v1/hourly/12hour/"):
+                    location_key = url.path.rsplit("/", 1)[-1]
+                    if location_key in fake.statuses:
+                        return self._send(fake.statuses[location_key],
+                                          {"Message": "Error"})
+                    return self._send(200, hourly_forecast(location_key))
+                if url.path == "/locations/v1/cities/search":
+                    name = parse_qs(url.query).get("q", [""])[0]
+                    if name in fake.statuses:
+                        return self._send(fake.statuses[name],
+                                          {"Message": "Error"})
+                    return self._send(200, [{"Key": location_key_for(name),
+                                             "LocalizedName": name}])
+                return self._send(404, {"Message": "Not Found"})
+
+            def _send(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass  # keep the benchmark output clean
+
+        return Handler
+
+
+def location_key_for(name) -> str:
+    """
+    Deterministic fake location key for a location name.
+    """
+    return str(100000 + sum(ord(c) for c in name) * 97 % 900000)
+
+
+def hourly_forecast(location_key) -> list:
+    """
+    Builds a 12 hour forecast shaped like the AccuWeather response,
+    deterministic for a given location key and hour.
+    """
+    ist = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+    start = datetime.datetime.now(ist).replace(minute=0, second=0,
+                                               microsecond=0)
+    seed = int(location_key) if location_key.isdigit() else len(location_key)
+    forecast = []
+    for i in range(1, 13):
+        hour = start + datetime.timedelta(hours=i)
+        forecast.append({
+            "DateTime": hour.isoformat(),
+            "EpochDateTime": int(hour.timestamp()),
+            "WeatherIcon": 1,
+            "IconPhrase": "Sunny",
+            "HasPrecipitation": False,
+            "IsDaylight": 6 <= hour.hour < 18,
+            "Temperature": {"Value": round(15 + (seed + hour.hour) % 15
+                                           + 0.1 * i, 1),
+                            "Unit": "C", "UnitType": 17},
+            "PrecipitationProbability": 0,
+        })
+    return forecast
+
+
+def fake_location_keys(count) -> dict:
+    """
+    Returns {location name: location key} for count fake locations.
+    """
+    return {f"Location {i}": location_key_for(f"Location {i}")
+            for i in range(count)}
+
+
+if __name__ == "__main__":
+    server = FakeAccuWeatherServer(latency=0.2)
+    print("Fake AccuWeather API running at", server.start())
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
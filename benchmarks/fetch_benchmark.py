@@ -0,0 +1,60 @@
+"""
+Compares the sequential and the concurrent 12 hour forecast fetchers against
+the local stand-in AccuWeather server, and checks that both return the same
+data.
+
+The API logs are counted in memory, unless --log-to-database writes them
+to the configured database as populate() does. Run from the repository
+root:
+    python -m benchmarks.fetch_benchmark --locations 100 --latency 0.2
+"""
+import argparse
+import time
+import api.data_fetcher as data_fetcher
+from benchmarks.fake_accuweather import (FakeAccuWeatherServer,
+                                         fake_location_keys)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--locations", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--workers", type=int,
+                        default=data_fetcher.FETCH_CONCURRENCY)
+    parser.add_argument("--log-to-database", action="store_true",
+                        help="write the API logs to the configured database")
+    args = parser.parse_args()
+
+    # API interactions logged by the fetchers
+    api_logs = []
+    if not args.log_to_database:
+        data_fetcher.log_api_interaction = (
+            lambda *log: api_logs.append(log))
+
+    location_keys = fake_location_keys(args.locations)
+    with FakeAccuWeatherServer(latency=args.latency) as server:
+        data_fetcher.ACCUWEATHER_BASE_URL = server.base_url
+
+        start = time.perf_counter()
+        sequential = data_fetcher._12_hour_temperature_forecast(location_keys)
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        concurrent = data_fetcher._12_hour_temperature_forecast_concurrent(
+            location_keys, max_workers=args.workers)
+        concurrent_time = time.perf_counter() - start
+
+    assert list(sequential) == list(concurrent), "location order differs"
+    assert sequential == concurrent, "forecast data differs"
+
+    print(f"locations: {args.locations}, latency: {args.latency}s, "
+          f"workers: {args.workers}")
+    print(f"sequential: {sequential_time:.2f}s")
+    print(f"concurrent: {concurrent_time:.2f}s "
+          f"({sequential_time / concurrent_time:.1f}x)")
+    if not args.log_to_database:
+        print(f"API logs: {len(api_logs)} (not written)")
+
+
+if __name__ == "__main__":
+    main()
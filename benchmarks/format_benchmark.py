@@ -0,0 +1,81 @@
+"""
+Compares the /home response formats of the Flask backend on synthetic
+chart rows: one object per row (convert_db_data_to_frontend_json, encoded
+with json.dumps like jsonify) against the columnar format
+(convert_db_data_to_frontend_columns, encoded with dumps_json).
+
+Needs no database. Run from the repository root:
+    python -m benchmarks.format_benchmark --rows 50000
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+# The backend modules import each other from the backend folder
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "frontend", "flask-backend"))
+
+from services.data_formatter import (  # noqa: E402
+    convert_db_data_to_frontend_json, convert_db_data_to_frontend_columns,
+    dumps_json, orjson)
+
+
+def chart_rows(count) -> list:
+    """
+    Returns count rows shaped like the chart query result.
+    """
+    start = datetime.datetime(2025, 2, 1)
+    rows = []
+    for i in range(count):
+        for_hour = start + datetime.timedelta(hours=i)
+        made_at = for_hour - datetime.timedelta(hours=11, seconds=i % 60,
+                                                microseconds=741948)
+        predicted, actual = 20 + i % 7 * 0.5, 20 + i % 5 * 0.5
+        rows.append((1, for_hour, 2 * i, 2 * i + 1, made_at,
+                     11 + (i % 60) / 3600, predicted, actual,
+                     predicted - actual, abs(predicted - actual)))
+    return rows
+
+
+def timed(function, repeat) -> tuple:
+    """
+    Returns the best time of repeat calls and the last result.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = chart_rows(args.rows)
+    print(f"{args.rows} rows, JSON encoder: "
+          f"{'orjson' if orjson is not None else 'json'}")
+
+    row_time, row_body = timed(lambda: json.dumps(
+        convert_db_data_to_frontend_json(list(rows))).encode(), args.repeat)
+    column_time, column_body = timed(lambda: dumps_json(
+        convert_db_data_to_frontend_columns(rows)), args.repeat)
+
+    print(f"Rows of objects: {row_time * 1000:8.1f} ms "
+          f"{len(row_body) / 1024:8.0f} KiB")
+    print(f"Columns:         {column_time * 1000:8.1f} ms "
+          f"{len(column_body) / 1024:8.0f} KiB")
+    print(f"Speed-up: {row_time / column_time:.1f}x, size: "
+          f"{len(column_body) / len(row_body):.0%} of the rows of objects")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Measures the startup cost of the entry points: the time to import each
+module in a fresh interpreter, and (with --connect) the time of the first
+database connection, which importing a module used to pay up front since
+the connection pools connected on import.
+
+A module that opens a connection or reads location_keys.bin on import is
+reported, as no import should touch either. Run from the repository root:
+    python -m benchmarks.import_benchmark --repeat 5 --connect
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "frontend", "flask-backend")
+
+# (module, folder it is imported from)
+MODULES = [
+    ("db.data_crud", ROOT),
+    ("api.data_fetcher", ROOT),
+    ("scripts.key_updater", ROOT),
+    ("scripts.populate", ROOT),
+    ("db.data_r", BACKEND),
+    ("app", BACKEND),
+]
+
+# Run in the fresh interpreter: imports the module and prints the import
+# time along with the connections opened and key files read meanwhile
+IMPORT_SCRIPT = """
+import builtins, json, sys, time
+import psycopg2
+connections, key_reads = [], []
+connect = psycopg2.connect
+def counted_connect(*args, **kwargs):
+    connections.append(1)
+    return connect(*args, **kwargs)
+psycopg2.connect = counted_connect
+open_file = builtins.open
+def counted_open(file, *args, **kwargs):
+    if str(file).endswith("location_keys.bin"):
+        key_reads.append(1)
+    return open_file(file, *args, **kwargs)
+builtins.open = counted_open
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "connections": len(connections),
+                  "key_reads": len(key_reads)}}))
+"""
+
+# Run in the fresh interpreter: times the first checkout of the pool
+CONNECT_SCRIPT = """
+import json, time
+from {module} import cpool
+start = time.perf_counter()
+conn, cur = cpool.get_connection()
+elapsed = time.perf_counter() - start
+cpool.close_connection(conn, cur)
+print(json.dumps({{"seconds": elapsed}}))
+"""
+
+
+def run(script, cwd) -> dict:
+    """
+    Runs a script in a fresh interpreter and returns its JSON output.
+    """
+    result = subprocess.run([sys.executable, "-c", script], cwd=cwd,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--connect", action="store_true",
+                        help="also time the first connection of the pools")
+    args = parser.parse_args()
+
+    print(f"{'module':<22}{'import (ms)':>12}{'connections':>13}"
+          f"{'key reads':>11}")
+    for module, cwd in MODULES:
+        try:
+            runs = [run(IMPORT_SCRIPT.format(module=module), cwd)
+                    for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:<22}failed: {e}")
+            continue
+        median = statistics.median(r["seconds"] for r in runs) * 1000
+        print(f"{module:<22}{median:>12.1f}{runs[-1]['connections']:>13}"
+              f"{runs[-1]['key_reads']:>11}")
+
+    if not args.connect:
+        return
+    # The cost moved from the import to the first query
+    for module, cwd in (("db.data_crud", ROOT), ("db.data_r", BACKEND)):
+        try:
+            runs = [run(CONNECT_SCRIPT.format(module=module), cwd)
+                    for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"First connection of {module} failed: {e}")
+            continue
+        median = statistics.median(r["seconds"] for r in runs) * 1000
+        print(f"First connection of {module}: {median:.1f} ms "
+              "(paid on import before the pools were lazy)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Compares the rows/sec of the per-location INSERT path (insert_data, one
+statement and commit per location) against the single COPY path (copy_data)
+used by populate().
+
+The rows go into a scratch copy of temperature_predictions which is dropped
+afterwards. Run from the repository root against a local database:
+    python -m benchmarks.ingest_benchmark --locations 500
+"""
+import argparse
+import datetime
+import time
+from db.data_crud import cpool, insert_data, copy_data
+
+TABLE = "temperature_predictions_benchmark"
+COLUMNS = """(location_id, forecast_made_at, forecast_for_hour,
+                 temperature)"""
+
+
+def execute(query) -> None:
+    conn, cur = cpool.get_connection()
+    cur.execute(query)
+    conn.commit()
+    cpool.close_connection(conn, cur)
+
+
+def forecast_rows(locations) -> dict:
+    """
+    Returns {location_id: [12 rows]} shaped like the transformed forecasts.
+    """
+    made_at = datetime.datetime.now().replace(microsecond=0)
+    rows = {}
+    for location_id in range(1, locations + 1):
+        rows[location_id] = [
+            (location_id, made_at.isoformat(),
+             (made_at + datetime.timedelta(hours=hour)).isoformat(),
+             round(20 + location_id % 10 + hour * 0.1, 1))
+            for hour in range(1, 13)]
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--locations", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = forecast_rows(args.locations)
+    row_count = sum(len(location_rows) for location_rows in rows.values())
+
+    execute(f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+        id SERIAL PRIMARY KEY,
+        location_id INT,
+        forecast_for_hour TIMESTAMP NOT NULL,
+        forecast_made_at TIMESTAMP NOT NULL,
+        temperature FLOAT NOT NULL);""")
+    try:
+        # Current path: one INSERT and commit per location
+        execute(f"TRUNCATE {TABLE};")
+        start = time.perf_counter()
+        for location_rows in rows.values():
+            insert_data(TABLE, (COLUMNS, *location_rows))
+        insert_time = time.perf_counter() - start
+
+        # Bulk path: every row of the run in one COPY
+        execute(f"TRUNCATE {TABLE};")
+        start = time.perf_counter()
+        copy_data(TABLE, (COLUMNS, *[row for location_rows in rows.values()
+                                     for row in location_rows]))
+        copy_time = time.perf_counter() - start
+    finally:
+        execute(f"DROP TABLE IF EXISTS {TABLE};")
+
+    print(f"locations: {args.locations}, rows: {row_count}")
+    print(f"insert per location: {row_count / insert_time:,.0f} rows/sec "
+          f"({insert_time:.2f}s)")
+    print(f"single copy: {row_count / copy_time:,.0f} rows/sec "
+          f"({copy_time:.2f}s, {insert_time / copy_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
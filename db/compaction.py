@@ -0,0 +1,121 @@
+import datetime
+from db.data_crud import cpool
+from db.forecast_errors import refresh_forecast_errors
+
+"""
+One-off compaction of temperature_predictions: removes the duplicate
+forecasts left by re-run or retried populate runs, then creates the unique
+index on the natural key of a prediction,
+    (location_id, issue_hour, forecast_for_hour)
+after which populate() skips duplicates as they come (ON CONFLICT DO
+NOTHING, see copy_data_skip_duplicates in db/data_crud.py).
+
+The first forecast of each key is kept. The duplicates are removed a range
+of forecast hours per transaction, and the forecast errors of the range are
+recomputed, as they may refer to removed rows.
+
+Relies on the issue_hour column added by db/migrations.py. Run from the
+repository root:
+    python -m db.compaction
+"""
+
+UNIQUE_INDEX = "uq_predictions_location_issue_hour_for_hour"
+
+DELETE_DUPLICATES_QUERY = """DELETE FROM temperature_predictions t
+USING (
+    SELECT
+        id,
+        forecast_for_hour,
+        ROW_NUMBER() OVER (
+            PARTITION BY location_id, issue_hour, forecast_for_hour
+            ORDER BY forecast_made_at, id) AS copy_number
+    FROM
+        temperature_predictions
+    WHERE
+        forecast_for_hour BETWEEN %(start_hour)s AND %(end_hour)s
+) duplicates
+WHERE
+    duplicates.copy_number > 1
+    AND t.id = duplicates.id
+    AND t.forecast_for_hour = duplicates.forecast_for_hour;"""
+
+CREATE_UNIQUE_INDEX_QUERY = f"""CREATE UNIQUE INDEX IF NOT EXISTS
+{UNIQUE_INDEX} ON temperature_predictions(
+    location_id, issue_hour, forecast_for_hour);"""
+
+
+def remove_duplicates(start_hour, end_hour) -> any:
+    """
+    Removes the duplicate forecasts of the forecast hours between start_hour
+    and end_hour (inclusive) in one transaction, and returns their number,
+    or False if it failed.
+
+    Parameters:
+        start_hour (str or datetime): The first forecast hour.
+        end_hour (str or datetime): The last forecast hour.
+    """
+    try:
+        # Get a connection and cursor object
+        conn, cur = cpool.get_connection()
+
+        cpool.execute(cur, DELETE_DUPLICATES_QUERY,
+                      {"start_hour": start_hour, "end_hour": end_hour})
+        removed = cur.rowcount
+        # save the changes
+        conn.commit()
+
+        # close the connection
+        cpool.close_connection(conn, cur)
+
+    except Exception as e:
+        print(e)
+        return False
+    return removed
+
+
+def compact_predictions(chunk_days=7) -> bool:
+    """
+    Removes the duplicate forecasts of the whole table, chunk_days of
+    forecast hours per transaction, then creates the unique index.
+
+    Parameters:
+        chunk_days (int): The number of days compacted per transaction.
+    """
+    conn, cur = cpool.get_connection()
+    cpool.execute(cur, """SELECT MIN(forecast_for_hour),
+    MAX(forecast_for_hour) FROM temperature_predictions;""")
+    first_hour, last_hour = cur.fetchone()
+    conn.rollback()
+    cpool.close_connection(conn, cur)
+
+    chunk = datetime.timedelta(days=chunk_days)
+    start_hour = first_hour
+    while first_hour is not None and start_hour <= last_hour:
+        # Chunks are disjoint: the end is one microsecond before the next
+        end_hour = start_hour + chunk - datetime.timedelta(microseconds=1)
+        removed = remove_duplicates(start_hour, end_hour)
+        if removed is False:
+            return False
+        print(f"{removed} duplicates removed from {start_hour} to "
+              f"{end_hour}")
+        if removed and not refresh_forecast_errors(start_hour, end_hour):
+            return False
+        start_hour += chunk
+
+    conn, cur = cpool.get_connection()
+    try:
+        cur.execute(CREATE_UNIQUE_INDEX_QUERY)
+        conn.commit()
+    except Exception as e:
+        # e.g. duplicates inserted by a run during the compaction
+        print(e)
+        conn.rollback()
+        return False
+    finally:
+        cpool.close_connection(conn, cur)
+    print(f"Unique index {UNIQUE_INDEX} created.")
+    return True
+
+
+if __name__ == "__main__":
+    compact_predictions()
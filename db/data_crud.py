@@ -1,3 +1,5 @@
+import csv
+from io import StringIO
 from db.conn import ConnectionPool
 
 """
@@ -5,6 +7,7 @@ Create a connection pool
 The default database is the trial database i.e. DB=0
 To use the development or main database, change the value of DB;
 DB=1 dev_database and DB=2 main database.
+The pool connects on first use, not on import.
 """
 cpool = ConnectionPool(DB=3)  # master database
 
@@ -30,17 +33,65 @@ def insert_data(table_name, data) -> bool:
         # Get a connection and cursor object
         conn, cur = cpool.get_connection()
 
-        # Get the column names
-        cols = data[0]
+        insert_data_with_cursor(cur, table_name, data)
+        # save the changes
+        conn.commit()
 
-        # Create the query
-        query = f"INSERT INTO {table_name} {cols} VALUES "
-        for i in range(1, len(data)):
-            query += f"{data[i]}, "
-        query = query[:-2]
-        query += ";"
-        # print(query)
-        cur.execute(query)
+        # close the connection
+        cpool.close_connection(conn, cur)
+
+    except Exception as e:
+        print(e)
+        return False
+    return True
+
+
+def insert_data_with_cursor(cur, table_name, data) -> None:
+    """
+    Runs the INSERT of insert_data on the given cursor, without committing,
+    e.g. as part of the transaction of a populate run.
+
+    Parameters:
+        cur (cursor): A cursor object of a pooled connection.
+        table_name (str): The name of the table.
+        data (tuple): Same format as insert_data.
+    """
+    # Get the column names
+    cols = data[0]
+
+    # Create the query, one placeholder group per row; the values are
+    # bound by the driver instead of pasted into the SQL text
+    row = "(" + ", ".join(["%s"] * len(data[1])) + ")"
+    query = (f"INSERT INTO {table_name} {cols} VALUES "
+             + ", ".join([row] * (len(data) - 1)) + ";")
+    values = [value for i in range(1, len(data)) for value in data[i]]
+    # print(query)
+    # Not prepared: the query shape changes with the number of rows
+    cpool.execute(cur, query, values, prepare=False)
+
+
+def copy_data(table_name, data) -> bool:
+    """
+    Bulk inserts data into the specified table with a single
+    COPY ... FROM STDIN, i.e. one round-trip and one transaction for all the
+    rows, however many there are.
+
+    Parameters:
+        table_name (str): The name of the table.
+        data (tuple): Same format as insert_data; the first element is the
+        column names in parentheses, the rest are the rows to be inserted.
+        e.g. table_name = "temperature_predictions"
+             data = (("(location_id, forecast_made_at, forecast_for_hour,
+                        temperature)"),
+                        (1, "2025-01-21T15:24", "2025-01-21T16:00", 24.4),
+                        (2, "2025-01-21T15:24", "2025-01-21T16:00", 23.9))
+    """
+    conn = None
+    try:
+        # Get a connection and cursor object
+        conn, cur = cpool.get_connection()
+
+        copy_data_with_cursor(cur, table_name, data)
         # save the changes
         conn.commit()
 
@@ -49,10 +100,111 @@ def insert_data(table_name, data) -> bool:
 
     except Exception as e:
         print(e)
+        if conn is not None:
+            # discard the failed COPY before returning the connection
+            conn.rollback()
+            cpool.close_connection(conn, cur)
         return False
     return True
 
 
+def csv_rows(data) -> StringIO:
+    """
+    Returns the rows of a data tuple (see insert_data) as a CSV file object;
+    None values become NULLs.
+    """
+    rows = StringIO()
+    csv.writer(rows).writerows(data[1:])
+    rows.seek(0)
+    return rows
+
+
+def copy_data_with_cursor(cur, table_name, data) -> None:
+    """
+    Runs the COPY of copy_data on the given cursor, without committing.
+
+    Parameters:
+        cur (cursor): A cursor object of a pooled connection.
+        table_name (str): The name of the table.
+        data (tuple): Same format as copy_data.
+    """
+    # Get the column names, on a single line
+    cols = " ".join(data[0].split())
+
+    # Stream the rows to the database
+    cur.copy_expert(f"COPY {table_name} {cols} FROM STDIN WITH (FORMAT csv);",
+                    csv_rows(data))
+
+
+def copy_data_skip_duplicates(table_name, data) -> any:
+    """
+    Idempotent version of copy_data: the rows are copied into a temporary
+    table, then inserted with ON CONFLICT DO NOTHING, so the rows already
+    in the table under one of its unique keys are skipped. All in one
+    transaction.
+
+    Returns the number of rows inserted, or False if it failed.
+
+    Parameters:
+        table_name (str): The name of the table.
+        data (tuple): Same format as copy_data.
+    """
+    conn = None
+    try:
+        # Get a connection and cursor object
+        conn, cur = cpool.get_connection()
+
+        inserted = copy_data_skip_duplicates_with_cursor(cur, table_name,
+                                                         data)
+        # save the changes
+        conn.commit()
+
+        # close the connection
+        cpool.close_connection(conn, cur)
+
+    except Exception as e:
+        print(e)
+        if conn is not None:
+            # discard the failed transaction before returning the connection
+            conn.rollback()
+            cpool.close_connection(conn, cur)
+        return False
+    return inserted
+
+
+def copy_data_skip_duplicates_with_cursor(cur, table_name, data,
+                                          returning=False) -> any:
+    """
+    Runs the statements of copy_data_skip_duplicates on the given cursor,
+    without committing, and returns the number of rows inserted, or with
+    returning the rows inserted themselves (the duplicates left out).
+
+    Parameters:
+        cur (cursor): A cursor object of a pooled connection.
+        table_name (str): The name of the table.
+        data (tuple): Same format as copy_data.
+        returning (bool): Whether to return the rows inserted, with the
+        columns of data.
+    """
+    # Get the column names, on a single line
+    cols = " ".join(data[0].split())
+
+    # Empty copy of the columns, for the rows of this call only
+    cur.execute(f"""CREATE TEMP TABLE {table_name}_staging
+    ON COMMIT DROP AS SELECT {cols[1:-1]} FROM {table_name}
+    WITH NO DATA;""")
+    # Stream the rows to the staging table
+    cur.copy_expert(f"COPY {table_name}_staging {cols} "
+                    "FROM STDIN WITH (FORMAT csv);", csv_rows(data))
+    returning_clause = f" RETURNING {cols[1:-1]}" if returning else ""
+    cur.execute(f"""INSERT INTO {table_name} {cols}
+    SELECT {cols[1:-1]} FROM {table_name}_staging
+    ON CONFLICT DO NOTHING{returning_clause};""")
+    inserted = cur.fetchall() if returning else cur.rowcount
+    cur.execute(f"DROP TABLE {table_name}_staging;")
+    return inserted
+
+
 def row_existence_check(table_name, column_name, value) -> bool:
     """
     Checks if a row with the specified value exists in the specified column.
@@ -67,8 +219,8 @@ def row_existence_check(table_name, column_name, value) -> bool:
         conn, cur = cpool.get_connection()
 
         # Create the query
-        query = f"SELECT * FROM {table_name} WHERE {column_name} = '{value}';"
-        cur.execute(query)
+        query = f"SELECT 1 FROM {table_name} WHERE {column_name} = %s LIMIT 1;"
+        cpool.execute(cur, query, (value,))
 
         # Get the result
         result = cur.fetchone()
@@ -102,8 +254,8 @@ def get_value_single_where(
 
         # Create the query
         query = f"""SELECT {get_for_column} FROM {table_name} WHERE
-        {get_against_column}='{get_against_value}';"""
-        cur.execute(query)
+        {get_against_column} = %s;"""
+        cpool.execute(cur, query, (get_against_value,))
 
         # Get the result
         result = cur.fetchone()
@@ -117,6 +269,113 @@ def get_value_single_where(
     return result[0] if result else None
 
 
+def get_all_values(table_name, get_for_columns) -> any:
+    """
+    Returns the values of the specified columns for every row of the table.
+
+    Parameters:
+        table_name (str): The name of the table.
+        get_for_columns (str): The columns whose values are to be returned.
+        e.g. "location_name, location_id"
+    """
+    try:
+        # Get a connection and cursor object
+        conn, cur = cpool.get_connection()
+
+        # Create the query
+        query = f"SELECT {get_for_columns} FROM {table_name};"
+        cpool.execute(cur, query)
+
+        # Get the result
+        result = cur.fetchall()
+
+        # close the connection
+        cpool.close_connection(conn, cur)
+
+    except Exception as e:
+        print(e)
+        return False
+    return result
+
+
+def sync_locations(location_keys) -> any:
+    """
+    Inserts the locations missing from the "locations" table and returns the
+    location_id of every location, all in one statement (one round-trip).
+
+    A location is missing when no row has its name; a key already used by
+    another row is skipped (ON CONFLICT DO NOTHING).
+
+    Returns a tuple of (mapping, added) where mapping is a dictionary of
+    every location name -> location_id in the table and added is the list of
+    the names inserted by this call, or False if the query failed.
+
+    Parameters:
+        location_keys (dict): A dictionary where the key is the location name
+        and the value is the location key.
+        e.g. {"Dwarka": "123456", "Najafgarh": "789012", ...}
+    """
+    if not location_keys:
+        # Nothing to insert, only read the mapping
+        rows = get_all_values("locations", "location_name, location_id")
+        if rows is False:
+            return False
+        return {name: location_id for name, location_id in rows}, []
+    try:
+        # Get a connection and cursor object
+        conn, cur = cpool.get_connection()
+
+        result = sync_locations_with_cursor(cur, location_keys)
+        # save the changes
+        conn.commit()
+
+        # close the connection
+        cpool.close_connection(conn, cur)
+
+    except Exception as e:
+        print(e)
+        return False
+    return result
+
+
+def sync_locations_with_cursor(cur, location_keys) -> tuple:
+    """
+    Runs the statement of sync_locations on the given cursor, without
+    committing, and returns its (mapping, added) tuple.
+
+    Parameters:
+        cur (cursor): A cursor object of a pooled connection.
+        location_keys (dict): Same format as sync_locations, not empty.
+    """
+    # Create the query; the main SELECT reads the table as it was before
+    # the insert, the CTE returns the rows it added
+    values = ", ".join(["(%s, %s)"] * len(location_keys))
+    query = f"""WITH fetched (location_name, unique_key) AS (
+        VALUES {values}
+    ), added AS (
+        INSERT INTO locations (location_name, unique_key)
+        SELECT f.location_name, f.unique_key FROM fetched f
+        WHERE NOT EXISTS (
+            SELECT 1 FROM locations l
+            WHERE l.location_name = f.location_name)
+        ON CONFLICT (unique_key) DO NOTHING
+        RETURNING location_name, location_id
+    )
+    SELECT location_name, location_id, TRUE FROM added
+    UNION ALL
+    SELECT location_name, location_id, FALSE FROM locations;"""
+    params = [value for location in location_keys
+              for value in (location, location_keys[location])]
+    # Not prepared: the query shape changes with the number of locations
+    cpool.execute(cur, query, params, prepare=False)
+
+    # Get the result
+    result = cur.fetchall()
+    mapping = {name: location_id for name, location_id, _ in result}
+    added = [name for name, _, is_added in result if is_added]
+    return mapping, added
+
+
 def last_insert_id(table_name, col_name) -> int:
     """
     Returns the last inserted id of the specified column in the specified
@@ -132,7 +391,7 @@ def last_insert_id(table_name, col_name) -> int:
 
         # Create the query
         query = f"SELECT last_value FROM {table_name}_{col_name}_seq;"
-        cur.execute(query)
+        cpool.execute(cur, query)
 
         # Get the result
         result = cur.fetchone()
@@ -154,10 +413,10 @@ def update_row_single_where(table_name, target_col, new_value, against_col,
 
     # Create the query
     query = f"""UPDATE {table_name}
-    SET {target_col} = '{new_value}'
-    WHERE {against_col} = {against_value};"""
+    SET {target_col} = %s
+    WHERE {against_col} = %s;"""
 
-    cur.execute(query)
+    cpool.execute(cur, query, (new_value, against_value))
 
     # save the changes
     conn.commit()
@@ -0,0 +1,150 @@
+import datetime
+from db.data_crud import cpool
+
+"""
+Maintenance of the forecast_errors table (see db/schema.txt), which holds
+the result of the dashboard's forecast vs actual query precomputed:
+for each forecast hour, the "actual" temperature (the forecast made the
+closest to that hour) joined with the predictions made 10 to 12 hours
+before it.
+
+populate() refreshes only the forecast hours touched by its run, so the
+dashboard reads the errors with an indexed range scan.
+
+Relies on the lead_hours column added by db/migrations.py.
+"""
+
+# Forecast hours whose errors are recomputed, across all the locations
+DELETE_QUERY = """DELETE FROM forecast_errors
+WHERE forecast_for_hour BETWEEN %(start_hour)s AND %(end_hour)s;"""
+
+INSERT_QUERY = """WITH actual_temperatures AS (
+    -- For each forecast_for_hour, get the closest recording
+    SELECT DISTINCT ON (location_id, forecast_for_hour)
+        location_id,
+        forecast_for_hour,
+        temperature AS actual_temperature,
+        id AS actual_reading_id
+    FROM
+        temperature_predictions
+    WHERE
+        forecast_for_hour BETWEEN %(start_hour)s AND %(end_hour)s
+    ORDER BY
+        location_id,
+        forecast_for_hour,
+        ABS(lead_hours)
+),
+
+eleven_hour_predictions AS (
+    -- Get predictions made approximately 11 hours before
+    SELECT
+        id AS prediction_id,
+        location_id,
+        forecast_for_hour,
+        forecast_made_at,
+        temperature AS predicted_temperature,
+        lead_hours AS hours_in_advance
+    FROM
+        temperature_predictions
+    WHERE
+        forecast_for_hour BETWEEN %(start_hour)s AND %(end_hour)s
+        AND lead_hours BETWEEN 10 AND 12  -- 11 hours +/- 1
+)
+
+INSERT INTO forecast_errors (
+    location_id, forecast_for_hour, actual_reading_id, prediction_id,
+    forecast_made_at, hours_in_advance, predicted_temperature,
+    actual_temperature, prediction_error, absolute_error)
+SELECT
+    a.location_id,
+    a.forecast_for_hour,
+    a.actual_reading_id,
+    p.prediction_id,
+    p.forecast_made_at,
+    p.hours_in_advance,
+    p.predicted_temperature,
+    a.actual_temperature,
+    (p.predicted_temperature - a.actual_temperature) AS prediction_error,
+    ABS(p.predicted_temperature - a.actual_temperature) AS absolute_error
+FROM
+    actual_temperatures a
+JOIN
+    eleven_hour_predictions p ON a.location_id = p.location_id AND
+    a.forecast_for_hour = p.forecast_for_hour;"""
+
+
+def refresh_forecast_errors(start_hour, end_hour) -> bool:
+    """
+    Recomputes the forecast_errors rows of the forecast hours between
+    start_hour and end_hour (inclusive) for every location, in one
+    transaction.
+
+    Parameters:
+        start_hour (str or datetime): The first forecast hour to refresh.
+        end_hour (str or datetime): The last forecast hour to refresh.
+        e.g. "2025-01-21T16:00:00+05:30", "2025-01-22T03:00:00+05:30"
+    """
+    try:
+        # Get a connection and cursor object
+        conn, cur = cpool.get_connection()
+
+        refresh_forecast_errors_with_cursor(cur, start_hour, end_hour)
+        # save the changes
+        conn.commit()
+
+        # close the connection
+        cpool.close_connection(conn, cur)
+
+    except Exception as e:
+        print(e)
+        return False
+    return True
+
+
+def refresh_forecast_errors_with_cursor(cur, start_hour, end_hour) -> None:
+    """
+    Runs the statements of refresh_forecast_errors on the given cursor,
+    without committing, e.g. as part of the transaction of a populate run.
+
+    Parameters:
+        cur (cursor): A cursor object of a pooled connection.
+        start_hour (str or datetime): The first forecast hour to refresh.
+        end_hour (str or datetime): The last forecast hour to refresh.
+    """
+    params = {"start_hour": start_hour, "end_hour": end_hour}
+    cpool.execute(cur, DELETE_QUERY, params)
+    cpool.execute(cur, INSERT_QUERY, params)
+
+
+def backfill_forecast_errors(chunk_days=7) -> bool:
+    """
+    Fills forecast_errors for the whole temperature_predictions table,
+    chunk_days of forecast hours per transaction.
+
+    Parameters:
+        chunk_days (int): The number of days refreshed per transaction.
+    """
+    conn, cur = cpool.get_connection()
+    cpool.execute(cur, """SELECT MIN(forecast_for_hour),
+    MAX(forecast_for_hour) FROM temperature_predictions;""")
+    first_hour, last_hour = cur.fetchone()
+    conn.rollback()
+    cpool.close_connection(conn, cur)
+    if first_hour is None:
+        return True
+
+    chunk = datetime.timedelta(days=chunk_days)
+    start_hour = first_hour
+    while start_hour <= last_hour:
+        # Chunks are disjoint: the end is one microsecond before the next
+        end_hour = start_hour + chunk - datetime.timedelta(microseconds=1)
+        print(f"Refreshing forecast errors from {start_hour} to {end_hour}")
+        if not refresh_forecast_errors(start_hour, end_hour):
+            return False
+        start_hour += chunk
+    return True
+
+
+if __name__ == "__main__":
+    # One-off fill of the table, e.g. right after creating it
+    backfill_forecast_errors()
@@ -0,0 +1,266 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+"""
+Local append-only archive of the forecasts, for offline analysis without
+a round-trip to the database per query.
+
+The archive is a flat file of fixed-width records (see RECORD_DTYPE), in
+forecast_made_at order, which NumPy maps in memory: reading a slice costs
+no parsing and no copy, and a made_at range is found by binary search.
+
+populate() appends the rows of each run when FORECAST_ARCHIVE_PATH is set,
+spooled to a temporary file (see ArchiveSpool) until the run is committed.
+Timestamps are stored like the database stores them (TIMESTAMP without
+time zone): the wall-clock time, in seconds since the epoch.
+
+e.g.
+    from db.local_archive import ForecastArchive
+    archive = ForecastArchive("forecasts.bin")
+    rows = archive.query(location_id=1, start="2025-02-01",
+                         end="2025-03-01")
+    rows["temperature"].mean()
+"""
+
+# File of the archive written by populate(), none by default
+ARCHIVE_PATH = os.getenv("FORECAST_ARCHIVE_PATH")
+
+RECORD_DTYPE = np.dtype([("location_id", "<i4"), ("made_at", "<i8"),
+                         ("for_hour", "<i8"), ("temperature", "<f4")])
+
+
+def to_epoch_seconds(values) -> np.ndarray:
+    """
+    Returns the timestamps as int64 seconds since the epoch, keeping the
+    wall-clock time and dropping any UTC offset, like a TIMESTAMP column.
+
+    Parameters:
+        values (list): ISO strings, datetimes or epoch seconds.
+        e.g. ["2025-01-21T15:24:14.915621", "2025-01-21T16:00:00+05:30"]
+    """
+    values = list(values)
+    if values and isinstance(values[0], str):
+        # "YYYY-MM-DDTHH:MM:SS", without the fraction and the offset
+        values = [value[:19] for value in values]
+    elif values and hasattr(values[0], "tzinfo"):
+        values = [value.replace(tzinfo=None) for value in values]
+    else:
+        return np.asarray(values, dtype=np.int64)
+    return np.array(values, dtype="datetime64[s]").astype(np.int64)
+
+
+def to_epoch_second(value) -> int:
+    """
+    Returns a single timestamp as seconds since the epoch, see
+    to_epoch_seconds.
+    """
+    return int(to_epoch_seconds([value])[0])
+
+
+def to_records(rows) -> np.ndarray:
+    """
+    Returns the rows as archive records, sorted by forecast_made_at.
+
+    Parameters:
+        rows (list): (location_id, forecast_made_at, forecast_for_hour,
+        temperature) tuples.
+    """
+    if not len(rows):
+        return np.empty(0, dtype=RECORD_DTYPE)
+    location_ids, made_at, for_hour, temperatures = zip(*rows)
+    records = np.empty(len(rows), dtype=RECORD_DTYPE)
+    records["location_id"] = location_ids
+    records["made_at"] = to_epoch_seconds(made_at)
+    records["for_hour"] = to_epoch_seconds(for_hour)
+    records["temperature"] = [float(value) for value in temperatures]
+    return records[np.argsort(records["made_at"], kind="stable")]
+
+
+class ForecastArchive:
+    """
+    An append-only file of forecast records, read through a memory map.
+
+    Methods:
+        - append(rows) -> appends rows and returns the number written.
+        - records(none) -> returns every record, memory-mapped.
+        - query(location_id, start, end, for_hour_start, for_hour_end) ->
+        returns the records of a location and forecast_made_at range.
+    """
+
+    def __init__(self, path=ARCHIVE_PATH) -> None:
+        """
+        Initializes the archive stored at path; it is created on the first
+        append.
+        """
+        self.path = path
+
+    def __len__(self) -> int:
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // RECORD_DTYPE.itemsize
+
+    def append(self, rows) -> int:
+        """
+        Appends rows to the archive, sorted by forecast_made_at; rows made
+        before the last record are rejected, as queries rely on the order.
+        There must be a single writer at a time.
+
+        Parameters:
+            rows (list): (location_id, forecast_made_at, forecast_for_hour,
+            temperature) tuples, e.g. the rows inserted by populate().
+        """
+        records = to_records(rows)
+        if not len(records):
+            return 0
+        self._check_order(records["made_at"][0])
+        with self._open_for_append() as f:
+            f.write(records.tobytes())
+        return len(records)
+
+    def append_spool(self, spool) -> int:
+        """
+        Appends the records of a spool to the archive, a chunk at a time;
+        rejected like append if they were made before the last record.
+
+        Parameters:
+            spool (ArchiveSpool): e.g. the rows inserted by a populate run.
+        """
+        if not spool.count:
+            return 0
+        self._check_order(spool.first_made_at)
+        spool.file.seek(0)
+        with self._open_for_append() as f:
+            shutil.copyfileobj(spool.file, f)
+        return spool.count
+
+    def _check_order(self, first_made_at) -> None:
+        existing = self.records()
+        if len(existing) and first_made_at < existing["made_at"][-1]:
+            raise ValueError("Rows made before the last archived record.")
+
+    def _open_for_append(self) -> any:
+        f = open(self.path, "ab")
+        # Drop a record cut short by an interrupted append
+        f.truncate(len(self) * RECORD_DTYPE.itemsize)
+        return f
+
+    def records(self) -> np.ndarray:
+        """
+        Returns every record as a read-only memory-mapped array.
+
+        Parameters:
+            none
+        """
+        count = len(self)
+        if count == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        # A record cut short by an interrupted append is left out
+        return np.memmap(self.path, dtype=RECORD_DTYPE, mode="r",
+                         shape=(count,))
+
+    def query(self, location_id=None, start=None, end=None,
+              for_hour_start=None, for_hour_end=None) -> np.ndarray:
+        """
+        Returns the records of a location (all locations if None) whose
+        forecast_made_at is between start and end and forecast_for_hour
+        between for_hour_start and for_hour_end, bounds included. The
+        made_at range is a view of the memory map; the other conditions
+        copy the matching records only.
+
+        Parameters:
+            location_id (int): The location id.
+            start (str): The start of the forecast_made_at range.
+            end (str): The end of the forecast_made_at range.
+            for_hour_start (str): The start of the forecast_for_hour range.
+            for_hour_end (str): The end of the forecast_for_hour range.
+            e.g. "2025-02-01", "2025-02-28T23:59:59"
+        """
+        records = self.records()
+        made_at = records["made_at"]
+        first = (0 if start is None else
+                 np.searchsorted(made_at, to_epoch_second(start), "left"))
+        last = (len(records) if end is None else
+                np.searchsorted(made_at, to_epoch_second(end), "right"))
+        records = records[first:last]
+
+        mask = None
+        if location_id is not None:
+            mask = records["location_id"] == location_id
+        if for_hour_start is not None:
+            kept = records["for_hour"] >= to_epoch_second(for_hour_start)
+            mask = kept if mask is None else mask & kept
+        if for_hour_end is not None:
+            kept = records["for_hour"] <= to_epoch_second(for_hour_end)
+            mask = kept if mask is None else mask & kept
+        return records if mask is None else records[mask]
+
+
+class ArchiveSpool:
+    """
+    Temporary file of archive records, appended to an archive later on,
+    e.g. the rows of a populate run once it is committed, so that they are
+    not kept in memory meanwhile. The file has no name and disappears when
+    the spool is closed or garbage collected.
+
+    Usage:
+        with ArchiveSpool() as spool:
+            spool.add(rows)
+            ...
+            forecast_archive.append_spool(spool)
+
+    Methods:
+        - add(rows) -> spools rows and returns the number written.
+        - close(none) -> deletes the spool file.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes an empty spool.
+        """
+        self.file = tempfile.TemporaryFile()
+        self.count = 0
+        self.first_made_at = None
+        self.last_made_at = None
+
+    def add(self, rows) -> int:
+        """
+        Spools rows, sorted by forecast_made_at; rows made before the last
+        spooled record are rejected, as the archive relies on the order.
+
+        Parameters:
+            rows (list): (location_id, forecast_made_at, forecast_for_hour,
+            temperature) tuples, e.g. a batch inserted by populate().
+        """
+        records = to_records(rows)
+        if not len(records):
+            return 0
+        if (self.last_made_at is not None
+                and records["made_at"][0] < self.last_made_at):
+            raise ValueError("Rows made before the last spooled record.")
+        self.file.write(records.tobytes())
+        if self.first_made_at is None:
+            self.first_made_at = records["made_at"][0]
+        self.last_made_at = records["made_at"][-1]
+        self.count += len(records)
+        return len(records)
+
+    def close(self) -> None:
+        """
+        Deletes the spool file.
+
+        Parameters:
+            none
+        """
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Archive written by populate(), enabled by FORECAST_ARCHIVE_PATH
+forecast_archive = ForecastArchive()
@@ -0,0 +1,209 @@
+from db.data_crud import cpool
+
+"""
+Schema migrations of the Forecast Journal database, applied in order.
+Each migration runs once, in its own transaction, and is recorded in the
+schema_migrations table; the statements are idempotent as well (IF NOT
+EXISTS, or a check of the current schema) so that databases changed by
+hand can be migrated safely.
+
+Run from the repository root:
+    python -m db.migrations
+"""
+
+MIGRATIONS = [
+    # Predictions of a location by forecast time, e.g. the /download range
+    # (location_id, forecast_for_hour) is already served by idx_forecast
+    ("001_predictions_location_made_at_index",
+     """CREATE INDEX IF NOT EXISTS idx_predictions_location_made_at
+     ON temperature_predictions(location_id, forecast_made_at);"""),
+
+    # Hours between the forecast and the forecast hour, computed on write
+    # instead of per row in every query
+    ("002_predictions_lead_hours_column",
+     """ALTER TABLE temperature_predictions
+     ADD COLUMN IF NOT EXISTS lead_hours DOUBLE PRECISION
+     GENERATED ALWAYS AS (
+         EXTRACT(EPOCH FROM (forecast_for_hour - forecast_made_at)) / 3600
+     ) STORED;"""),
+
+    # The forecast errors refresh reads a range of forecast hours for all
+    # the locations and keeps the ~11 hour leads
+    ("003_predictions_for_hour_lead_hours_index",
+     """CREATE INDEX IF NOT EXISTS idx_predictions_for_hour_lead_hours
+     ON temperature_predictions(forecast_for_hour, lead_hours);"""),
+
+    # Precomputed dashboard errors, see db/forecast_errors.py
+    ("004_forecast_errors_table",
+     """CREATE TABLE IF NOT EXISTS forecast_errors (
+         prediction_id INT PRIMARY KEY REFERENCES temperature_predictions(id),
+         location_id INT REFERENCES locations(location_id),
+         forecast_for_hour TIMESTAMP NOT NULL,
+         actual_reading_id INT REFERENCES temperature_predictions(id),
+         forecast_made_at TIMESTAMP NOT NULL,
+         hours_in_advance FLOAT NOT NULL,
+         predicted_temperature FLOAT NOT NULL,
+         actual_temperature FLOAT NOT NULL,
+         prediction_error FLOAT NOT NULL,
+         absolute_error FLOAT NOT NULL
+     );
+     CREATE INDEX IF NOT EXISTS idx_forecast_errors
+     ON forecast_errors(location_id, forecast_for_hour);"""),
+
+    # Monthly range partitions of the predictions on forecast_for_hour,
+    # replacing the per-month databases (see db/partitions.py).
+    # The rows are copied with their ids; the previous table is kept as
+    # temperature_predictions_unpartitioned until dropped by hand.
+    # A unique key of a partitioned table must include the partition key,
+    # so the foreign keys to temperature_predictions(id) are dropped.
+    # Skipped when temperature_predictions is already partitioned.
+    ("005_partition_predictions_by_month",
+     """DO $$
+     DECLARE
+         first_day DATE;
+     BEGIN
+         -- Already partitioned, e.g. by hand: nothing to do
+         IF (SELECT relkind FROM pg_class
+             WHERE oid = to_regclass('temperature_predictions')) = 'p' THEN
+             RETURN;
+         END IF;
+
+         ALTER TABLE temperature_predictions
+         RENAME TO temperature_predictions_unpartitioned;
+         ALTER INDEX IF EXISTS temperature_predictions_pkey
+         RENAME TO temperature_predictions_unpartitioned_pkey;
+         ALTER INDEX IF EXISTS idx_forecast
+         RENAME TO idx_forecast_unpartitioned;
+         ALTER INDEX IF EXISTS idx_predictions_location_made_at
+         RENAME TO idx_predictions_location_made_at_unpartitioned;
+         ALTER INDEX IF EXISTS idx_predictions_for_hour_lead_hours
+         RENAME TO idx_predictions_for_hour_lead_hours_unpartitioned;
+         ALTER TABLE db_transaction_logs
+         DROP CONSTRAINT IF EXISTS db_transaction_logs_id_fkey;
+         ALTER TABLE forecast_errors
+         DROP CONSTRAINT IF EXISTS forecast_errors_prediction_id_fkey;
+         ALTER TABLE forecast_errors
+         DROP CONSTRAINT IF EXISTS forecast_errors_actual_reading_id_fkey;
+
+         CREATE TABLE temperature_predictions (
+             id INT NOT NULL
+                 DEFAULT nextval('temperature_predictions_id_seq'),
+             location_id INT REFERENCES locations(location_id),
+             forecast_for_hour TIMESTAMP NOT NULL,
+             forecast_made_at TIMESTAMP NOT NULL,
+             temperature FLOAT NOT NULL,
+             lead_hours DOUBLE PRECISION GENERATED ALWAYS AS (
+                 EXTRACT(EPOCH FROM (forecast_for_hour - forecast_made_at))
+                 / 3600
+             ) STORED,
+             PRIMARY KEY (id, forecast_for_hour)
+         ) PARTITION BY RANGE (forecast_for_hour);
+         ALTER SEQUENCE temperature_predictions_id_seq
+         OWNED BY temperature_predictions.id;
+
+         -- One partition per month of existing data, up to the next month
+         SELECT date_trunc('month', COALESCE(MIN(forecast_for_hour), NOW()))
+         INTO first_day FROM temperature_predictions_unpartitioned;
+         WHILE first_day <= date_trunc('month', NOW()) + INTERVAL '1 month'
+         LOOP
+             EXECUTE format(
+                 'CREATE TABLE IF NOT EXISTS %I PARTITION OF '
+                 'temperature_predictions FOR VALUES FROM (%L) TO (%L);',
+                 'temperature_predictions_y' || to_char(first_day, 'YYYY')
+                 || 'm' || to_char(first_day, 'MM'),
+                 first_day, first_day + INTERVAL '1 month');
+             first_day := first_day + INTERVAL '1 month';
+         END LOOP;
+         -- Rows beyond the prepared months, should populate not run for long
+         CREATE TABLE IF NOT EXISTS temperature_predictions_default
+         PARTITION OF temperature_predictions DEFAULT;
+
+         INSERT INTO temperature_predictions
+             (id, location_id, forecast_for_hour, forecast_made_at,
+              temperature)
+         SELECT id, location_id, forecast_for_hour, forecast_made_at,
+                temperature
+         FROM temperature_predictions_unpartitioned;
+
+         -- Created on every partition, present and future
+         CREATE INDEX IF NOT EXISTS idx_forecast ON temperature_predictions(
+             location_id, forecast_for_hour, forecast_made_at);
+         CREATE INDEX IF NOT EXISTS idx_predictions_location_made_at
+         ON temperature_predictions(location_id, forecast_made_at);
+         CREATE INDEX IF NOT EXISTS idx_predictions_for_hour_lead_hours
+         ON temperature_predictions(forecast_for_hour, lead_hours);
+     END $$;"""),
+
+    # Hour of the run that made the forecast, part of the natural key of a
+    # prediction; the unique index on that key is created by
+    # db/compaction.py once the historical duplicates are removed
+    ("006_predictions_issue_hour_column",
+     """ALTER TABLE temperature_predictions
+     ADD COLUMN IF NOT EXISTS issue_hour TIMESTAMP
+     GENERATED ALWAYS AS (date_trunc('hour', forecast_made_at)) STORED;"""),
+
+    # Timing of the stages of each populate run (utils/run_profile.py)
+    ("007_populate_stage_metrics_table",
+     """CREATE TABLE IF NOT EXISTS populate_stage_metrics (
+         populate_id INT REFERENCES populate_logs(populate_id),
+         stage VARCHAR(20) NOT NULL,
+         wall_ms FLOAT NOT NULL,
+         calls INT NOT NULL,
+         api_requests INT NOT NULL,
+         db_round_trips INT NOT NULL,
+         rows_received INT NOT NULL,
+         bytes_received BIGINT NOT NULL,
+         PRIMARY KEY (populate_id, stage)
+     );"""),
+]
+
+
+def applied_migrations(cur) -> set:
+    """
+    Returns the names of the migrations already applied, creating the
+    schema_migrations table on first use.
+
+    Parameters:
+        cur (cursor): A cursor object of a pooled connection.
+    """
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+        name VARCHAR(255) PRIMARY KEY,
+        applied_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+    );""")
+    cur.execute("SELECT name FROM schema_migrations;")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate() -> list:
+    """
+    Applies the pending migrations in order and returns their names.
+    Stops at the first failing migration, which is rolled back.
+
+    Parameters:
+        none
+    """
+    applied = []
+    conn, cur = cpool.get_connection()
+    try:
+        done = applied_migrations(cur)
+        conn.commit()
+        for name, statement in MIGRATIONS:
+            if name in done:
+                continue
+            print(f"Applying {name}...")
+            cur.execute(statement)
+            cpool.execute(cur, "INSERT INTO schema_migrations (name) "
+                               "VALUES (%s);", (name,), prepare=False)
+            conn.commit()
+            applied.append(name)
+    except Exception as e:
+        print(e)
+        conn.rollback()
+    finally:
+        cpool.close_connection(conn, cur)
+    return applied
+
+
+if __name__ == "__main__":
+    applied = migrate()
+    print(f"{len(applied)} migration(s) applied.")
@@ -0,0 +1,159 @@
+import datetime
+from db.data_crud import cpool
+
+"""
+Monthly range partitions of temperature_predictions (partitioned on
+forecast_for_hour by migration 005 in db/migrations.py), replacing the
+per-month databases: each month lives in its own partition, e.g.
+temperature_predictions_y2025m03, and queries filtering on
+forecast_for_hour only scan the partitions overlapping their range.
+
+populate() calls ensure_partitions() so that the partitions of the coming
+months exist before any row is written to them. Rows written beyond them
+land in temperature_predictions_default, and are moved to the partition of
+their month when it is created.
+"""
+
+# Number of months after the current one to create partitions for
+MONTHS_AHEAD = 2
+# Partition of the rows outside every monthly partition
+DEFAULT_PARTITION = "temperature_predictions_default"
+
+
+def month_start(day) -> datetime.date:
+    """
+    Returns the first day of the month of the given date.
+    """
+    return datetime.date(day.year, day.month, 1)
+
+
+def next_month(day) -> datetime.date:
+    """
+    Returns the first day of the month following the given date.
+    """
+    return (datetime.date(day.year + 1, 1, 1) if day.month == 12
+            else datetime.date(day.year, day.month + 1, 1))
+
+
+def partition_name(day) -> str:
+    """
+    Returns the name of the partition holding the given date.
+    e.g. temperature_predictions_y2025m03
+    """
+    return f"temperature_predictions_y{day.year}m{day.month:02d}"
+
+
+def partitions_for_range(start, end) -> list:
+    """
+    Returns the (name, first day, first day of next month) of every monthly
+    partition overlapping the range between start and end.
+
+    Parameters:
+        start (date or datetime): The start of the range.
+        end (date or datetime): The end of the range.
+    """
+    partitions = []
+    month = month_start(start)
+    end = month_start(end)
+    while month <= end:
+        partitions.append((partition_name(month), month, next_month(month)))
+        month = next_month(month)
+    return partitions
+
+
+def create_partition(cur, name, first_day, last_day,
+                     has_default=True) -> int:
+    """
+    Creates the partition of a month and returns the number of rows moved
+    into it from the default partition: a partition cannot be created while
+    the default one holds rows of its range, so those rows are set aside in
+    a temporary table, deleted from the default partition and inserted
+    again once the partition exists. Runs in the caller's transaction.
+
+    Parameters:
+        cur (cursor): A cursor object of a pooled connection.
+        name (str): The name of the partition.
+        first_day (date): The first day of the month.
+        last_day (date): The first day of the next month.
+        has_default (bool): Whether the default partition exists.
+    """
+    moved = 0
+    if has_default:
+        cur.execute(f"""SELECT 1 FROM {DEFAULT_PARTITION}
+        WHERE forecast_for_hour >= %s AND forecast_for_hour < %s
+        LIMIT 1;""", (first_day, last_day))
+        if cur.fetchone() is not None:
+            cur.execute(f"""CREATE TEMP TABLE {name}_moved AS
+            SELECT id, location_id, forecast_for_hour, forecast_made_at,
+                   temperature
+            FROM {DEFAULT_PARTITION}
+            WHERE forecast_for_hour >= %s AND forecast_for_hour < %s;""",
+                        (first_day, last_day))
+            cur.execute(f"""DELETE FROM {DEFAULT_PARTITION}
+            WHERE forecast_for_hour >= %s AND forecast_for_hour < %s;""",
+                        (first_day, last_day))
+            moved = cur.rowcount
+
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS {name}
+    PARTITION OF temperature_predictions
+    FOR VALUES FROM ('{first_day}') TO ('{last_day}');""")
+
+    if moved:
+        cur.execute(f"""INSERT INTO temperature_predictions
+        (id, location_id, forecast_for_hour, forecast_made_at, temperature)
+        SELECT id, location_id, forecast_for_hour, forecast_made_at,
+               temperature
+        FROM {name}_moved;""")
+        cur.execute(f"DROP TABLE {name}_moved;")
+        print(f"Moved {moved} rows from {DEFAULT_PARTITION} to {name}.")
+    return moved
+
+
+def ensure_partitions(months_ahead=MONTHS_AHEAD, today=None) -> list:
+    """
+    Creates the missing partitions from the current month up to
+    months_ahead months later, in one transaction, and returns their names.
+    The rows of those months already in the default partition are moved to
+    them (see create_partition).
+
+    Parameters:
+        months_ahead (int): The number of upcoming months to prepare.
+        today (date): The current date, for tests and backfills.
+    """
+    today = today or datetime.date.today()
+    end = month_start(today)
+    for _ in range(months_ahead):
+        end = next_month(end)
+
+    created = []
+    conn = cur = None
+    try:
+        # Get a connection and cursor object
+        conn, cur = cpool.get_connection()
+
+        # The existing partitions, in one round-trip
+        cpool.execute(cur, """SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'temperature_predictions';""")
+        existing = {row[0] for row in cur.fetchall()}
+
+        for name, first_day, last_day in partitions_for_range(today, end):
+            if name in existing:
+                continue
+            create_partition(cur, name, first_day, last_day,
+                             has_default=DEFAULT_PARTITION in existing)
+            created.append(name)
+        # save the changes
+        conn.commit()
+
+    except Exception as e:
+        print(e)
+        if conn is not None:
+            conn.rollback()
+        return []
+    finally:
+        # close the connection
+        if conn is not None:
+            cpool.close_connection(conn, cur)
+    return created
@@ -0,0 +1,214 @@
+import threading
+from psycopg2 import extensions
+from db.data_crud import (
+    cpool, insert_data_with_cursor, copy_data_with_cursor,
+    copy_data_skip_duplicates_with_cursor, sync_locations_with_cursor)
+from db.forecast_errors import refresh_forecast_errors_with_cursor
+
+"""
+A populate run on a single pooled connection and a single transaction: the
+populate log, the new locations, the predictions, the run's API and
+database logs and the final status are committed together, so a failed or
+interrupted run leaves no partial data behind.
+
+The populate_id is returned by the INSERT of the populate log itself
+(RETURNING), instead of being read back from the sequence, which another
+run could have advanced in between.
+
+e.g.
+    with PopulateRun() as run:
+        location_ids, added = run.sync_locations(location_keys)
+        inserted = run.copy_predictions(data, skip_duplicates=True)
+"""
+
+INSERT_POPULATE_LOG_QUERY = """INSERT INTO populate_logs (status,
+error_message) VALUES (%s, %s) RETURNING populate_id;"""
+
+INSERT_FAILED_POPULATE_LOG_QUERY = """INSERT INTO populate_logs
+(populate_id, status, error_message) VALUES (%s, %s, %s);"""
+
+UPDATE_POPULATE_STATUS_QUERY = """UPDATE populate_logs SET status = %s
+WHERE populate_id = %s;"""
+
+
+class PopulateRun:
+    """
+    Context manager of a populate run: checks out one connection, inserts
+    the Pending populate log, and on exit sets the status to Success and
+    commits everything, or rolls back and records the Failed populate log
+    (same populate_id) along with the logs of the run.
+
+    Methods:
+        - sync_locations(location_keys) -> inserts the missing locations
+        and returns (mapping, added), or False if it failed.
+        - copy_predictions(data, skip_duplicates, returning) -> copies the
+        predictions and returns the number of rows inserted, or the rows.
+        - last_prediction_id(none) -> returns the id of the last prediction
+        inserted by the run, or None.
+        - insert_logs(table_name, data) -> inserts log rows in the run's
+        transaction; they are kept if the run fails.
+        - refresh_forecast_errors(start_hour, end_hour) -> recomputes the
+        forecast errors of a range of forecast hours.
+    """
+
+    def __init__(self, pool=cpool) -> None:
+        """
+        Initializes the run on the given connection pool.
+        """
+        self.pool = pool
+        self.conn = None
+        self.cur = None
+        self.populate_id = None
+        self.inserted = 0
+        # Log rows of the run, written again if the transaction is rolled
+        # back: (table_name, data)
+        self.logs = []
+        # Logs may be flushed and predictions copied from other threads
+        # (e.g. the writer of the populate pipeline): one statement at a
+        # time on the connection
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        # Get a connection and cursor object
+        self.conn, self.cur = self.pool.get_connection()
+        try:
+            self.pool.execute(self.cur, INSERT_POPULATE_LOG_QUERY,
+                              ("Pending", ""))
+            self.populate_id = self.cur.fetchone()[0]
+        except Exception:
+            self.conn.rollback()
+            self.pool.close_connection(self.conn, self.cur)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None:
+                try:
+                    self.pool.execute(self.cur, UPDATE_POPULATE_STATUS_QUERY,
+                                      ("Success", self.populate_id))
+                    # save the changes
+                    self.conn.commit()
+                    return False
+                except Exception as e:
+                    # e.g. the commit failed: record the run as failed
+                    print(e)
+                    exc = e
+            self._record_failure(str(exc))
+        finally:
+            # close the connection
+            self.pool.close_connection(self.conn, self.cur)
+        # Errors of the run propagate to the caller
+        return False
+
+    def _record_failure(self, error_message) -> None:
+        # Nothing of the run is kept but its populate log and logs
+        self.conn.rollback()
+        try:
+            self.pool.execute(self.cur, INSERT_FAILED_POPULATE_LOG_QUERY,
+                              (self.populate_id, "Failed", error_message))
+            for table_name, data in self.logs:
+                insert_data_with_cursor(self.cur, table_name, data)
+            # save the changes
+            self.conn.commit()
+        except Exception as e:
+            print(e)
+            self.conn.rollback()
+
+    def _in_error(self) -> bool:
+        # An earlier statement failed: the transaction only accepts ROLLBACK
+        return (self.conn.info.transaction_status
+                == extensions.TRANSACTION_STATUS_INERROR)
+
+    def _with_savepoint(self, function, *args) -> any:
+        # Runs the statements of function, undoing only them if they fail
+        self.cur.execute("SAVEPOINT populate_step;")
+        try:
+            result = function(self.cur, *args)
+        except Exception as e:
+            print(e)
+            self.cur.execute("ROLLBACK TO SAVEPOINT populate_step;")
+            return False
+        self.cur.execute("RELEASE SAVEPOINT populate_step;")
+        return result
+
+    def sync_locations(self, location_keys) -> any:
+        """
+        Inserts the missing locations in the run's transaction and returns
+        (name -> location_id mapping, names added), see sync_locations in
+        db/data_crud.py, or False if it failed (the run goes on).
+
+        Parameters:
+            location_keys (dict): The location names and their keys.
+        """
+        return self._with_savepoint(sync_locations_with_cursor,
+                                    location_keys)
+
+    def copy_predictions(self, data, skip_duplicates=True,
+                         returning=False) -> any:
+        """
+        Copies the predictions in the run's transaction and returns the
+        number of rows inserted, or with returning the rows inserted (the
+        duplicates skipped left out); raises if the copy failed. May be
+        called once per batch of rows, from another thread than the run's.
+
+        Parameters:
+            data (tuple): The column names and rows, see copy_data.
+            skip_duplicates (bool): Whether to skip the rows already
+            inserted, see copy_data_skip_duplicates.
+            returning (bool): Whether to return the rows inserted.
+        """
+        with self._lock:
+            if skip_duplicates:
+                inserted = copy_data_skip_duplicates_with_cursor(
+                    self.cur, "temperature_predictions", data, returning)
+            else:
+                copy_data_with_cursor(self.cur, "temperature_predictions",
+                                      data)
+                inserted = list(data[1:]) if returning else len(data) - 1
+            self.inserted += len(inserted) if returning else inserted
+        return inserted
+
+    def last_prediction_id(self) -> any:
+        """
+        Returns the id of the last prediction inserted by the run, or None
+        if it inserted none. The sequence value of the session, unlike
+        last_insert_id, is not moved by other runs.
+
+        Parameters:
+            none
+        """
+        with self._lock:
+            if not self.inserted or self._in_error():
+                return None
+            self.cur.execute(
+                "SELECT currval('temperature_predictions_id_seq');")
+            return self.cur.fetchone()[0]
+
+    def insert_logs(self, table_name, data) -> None:
+        """
+        Inserts log rows in the run's transaction. They are kept for the
+        Failed populate log if the run fails, and only kept if the
+        transaction already failed.
+
+        Parameters:
+            table_name (str): The name of the log table.
+            data (tuple): The column names and rows, see insert_data.
+        """
+        with self._lock:
+            self.logs.append((table_name, data))
+            if not self._in_error():
+                insert_data_with_cursor(self.cur, table_name, data)
+
+    def refresh_forecast_errors(self, start_hour, end_hour) -> bool:
+        """
+        Recomputes the forecast errors of a range of forecast hours in the
+        run's transaction, see refresh_forecast_errors in
+        db/forecast_errors.py; returns False if it failed (the run goes on).
+
+        Parameters:
+            start_hour (str or datetime): The first forecast hour.
+            end_hour (str or datetime): The last forecast hour.
+        """
+        return self._with_savepoint(refresh_forecast_errors_with_cursor,
+                                    start_hour, end_hour) is not False
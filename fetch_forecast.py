@@ -1,5 +1,4 @@
 from scripts.populate import populate
-from db.data_crud import update_row_single_where, last_insert_id
 
 # Ececute only when need to update the keys
 """
@@ -18,24 +17,12 @@ try:
     Main script to populate the next 12 hours data in the db.
     To be executed every alternate hour.
     Fetches -> Cleans -> Populates the data in the db.
-    """
 
-    # Set the status of the populate log to success
-    update_row_single_where(
-        "populate_logs", "status", "Success", "populate_id",
-        last_insert_id("populate_logs", "populate_id")
-        )
+    The status of the populate log (Success, or Failed with the error
+    message) is set by populate() itself, in the transaction of the run.
+    """
     print("Data populated successfully.")
 
 except Exception as e:
-    # Set the status of the populate log to failed
-    update_row_single_where(
-        "populate_logs", "status", "Failed", "populate_id",
-        last_insert_id("populate_logs", "populate_id")
-        )
-    # Set the error message
-    update_row_single_where(
-        "populate_logs", "error_message", str(e), "populate_id",
-        last_insert_id("populate_logs", "populate_id")
-        )
+    print(e)
     print("Error populating data.")
@@ -1,7 +1,8 @@
-from flask import Flask
+from flask import Flask, request, has_request_context
 from flask_cors import CORS
 from config.config import Config
 from routes.views import views
+from db.conn import slow_query_log
 from dotenv import load_dotenv
 import os
 
@@ -23,5 +24,17 @@ CORS(app, resources={
 
 app.register_blueprint(views, url_prefix="/")
 
+
+def request_context():
+    # The request a slow query was run for, see DB_SLOW_QUERY_MS
+    return request.full_path if has_request_context() else None
+
+
+slow_query_log.context = request_context
+
+# The location name -> id directory is loaded by the first request that
+# needs it (see db/location_cache.py), like the connection pool, so the
+# app starts without a round-trip to the database
+
 if __name__ == "__main__":
     app.run(port=app.config.get("DB_PORT"))
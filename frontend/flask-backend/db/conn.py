@@ -1,5 +1,11 @@
 import os
-from psycopg2 import pool
+import re
+import time
+import hashlib
+import threading
+from collections import deque
+import psycopg2
+from psycopg2 import pool, errors, extensions
 from dotenv import load_dotenv
 
 # Load .env file to get the connection string or use the environment variable
@@ -26,6 +32,461 @@ except Exception as e:
     db = [trial_db, dev_db, main_db, master_db, feb_2025_db, march_2025_db]
     error_message = f"Error loading database URL: {str(e)}"
 
+# Server-side prepared statements can be turned off for poolers that do not
+# keep a session per client (e.g. PgBouncer in transaction mode)
+USE_PREPARED_STATEMENTS = (
+    os.getenv("DB_PREPARED_STATEMENTS", "true").lower() == "true")
+
+# Health check settings of the thread-safe pool mode (seconds)
+# A connection idle for longer than this is pinged before being handed out
+POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "5"))
+# Connections older than this are closed and replaced
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+# Idle connections beyond min_conn are closed after this long
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+# How long a checkout waits for a free connection before failing
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# %s, %(name)s and the escaped %% of a psycopg2 query
+PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+# Queries slower than this (milliseconds) are logged with their EXPLAIN
+# plan, 0 to turn the slow-query log off
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+
+# Functions called with the trace of every round-trip of a pooled cursor,
+# see add_query_tracer
+_query_tracers = ()
+# Time the last checkout of each connection waited for: id(conn) -> seconds
+_pool_waits = {}
+# Queries of the prepared statements, by statement name
+_prepared_queries = {}
+
+
+def add_query_tracer(tracer) -> None:
+    """
+    Adds a function called after every round-trip of the pooled cursors
+    with its trace, a dictionary of:
+        kind (str): "execute", "copy" or "fetch" (server-side cursor).
+        query (str): The query on one line; for the EXECUTE of a prepared
+        statement, the prepared query.
+        statement (str), params: What was sent to the server.
+        duration (float): Seconds the round-trip took.
+        rows (int): The rows received.
+        pool_wait (float): Seconds the checkout of the connection waited.
+        error (Exception): The error raised, or None.
+        cursor (cursor): The cursor.
+    Tracers run in the thread of the query and must not raise.
+
+    Parameters:
+        tracer (function): Called with the trace of each round-trip.
+        e.g. the stage timing of the populate runs (utils/run_profile.py)
+    """
+    global _query_tracers
+    _query_tracers = (*_query_tracers, tracer)
+
+
+def remove_query_tracer(tracer) -> None:
+    """
+    Removes a function added with add_query_tracer.
+    """
+    global _query_tracers
+    # Equality, not identity: each access to a bound method (e.g.
+    # profile._trace) creates a new object
+    _query_tracers = tuple(t for t in _query_tracers if t != tracer)
+
+
+def query_shape(query) -> str:
+    """
+    Returns the query on one line, e.g. for logs; the EXECUTE of a prepared
+    statement is replaced by the prepared query.
+
+    Parameters:
+        query (str): The statement sent to the server.
+    """
+    if not isinstance(query, str):
+        query = query.decode() if isinstance(query, bytes) else str(query)
+    if query.startswith("EXECUTE stmt_"):
+        name = query.split()[1].split("(")[0].rstrip(";")
+        query = _prepared_queries.get(name, query)
+    return " ".join(query.split())
+
+
+class TracedCursor(extensions.cursor):
+    """
+    The cursor of the pooled connections: passes the trace of every
+    round-trip to the server (statements, COPY, fetches of a server-side
+    cursor) to the query tracers, if any.
+    """
+
+    traced_query = None
+
+    def execute(self, query, vars=None):
+        # Kept for the traces of the fetches of a server-side cursor
+        self.traced_query = query
+        start, error = time.perf_counter(), None
+        try:
+            return super().execute(query, vars)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._trace("execute", query, vars, start, error)
+
+    def executemany(self, query, vars_list):
+        start, error = time.perf_counter(), None
+        try:
+            return super().executemany(query, vars_list)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._trace("execute", query, None, start, error)
+
+    def copy_expert(self, sql, file, size=8192):
+        start, error = time.perf_counter(), None
+        try:
+            return super().copy_expert(sql, file, size)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._trace("copy", sql, None, start, error)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        if self.name is not None:
+            # Each fetch of a server-side cursor is a round-trip
+            self._trace("fetch", self.traced_query, None, start, None,
+                        int(row is not None))
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = (super().fetchmany() if size is None
+                else super().fetchmany(size))
+        if self.name is not None:
+            self._trace("fetch", self.traced_query, None, start, None,
+                        len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        if self.name is not None:
+            self._trace("fetch", self.traced_query, None, start, None,
+                        len(rows))
+        return rows
+
+    def _trace(self, kind, query, params, start, error, rows=None) -> None:
+        tracers = _query_tracers
+        if not tracers:
+            return
+        duration = time.perf_counter() - start
+        if rows is None:
+            # A client-side cursor receives every row of a query with it
+            rows = (max(self.rowcount, 0) if error is None
+                    and self.name is None and self.description is not None
+                    else 0)
+        trace = {"kind": kind, "query": query_shape(query or ""),
+                 "statement": query, "params": params,
+                 "duration": duration, "rows": rows,
+                 "pool_wait": _pool_waits.get(id(self.connection)),
+                 "error": error, "cursor": self}
+        for tracer in tracers:
+            tracer(trace)
+
+
+class SlowQueryLog:
+    """
+    Query tracer logging the statements slower than threshold_ms along with
+    their EXPLAIN plan (not ANALYZE: the statement is not run again), and
+    keeping the last max_entries of them for inspection.
+
+    Methods:
+        - entries(none) -> returns the logged slow queries, latest last.
+    """
+
+    # Statements EXPLAIN accepts
+    EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "VALUES",
+                   "EXECUTE")
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, max_entries=100,
+                 context=None) -> None:
+        """
+        Initializes the log with the threshold, the number of entries kept
+        and an optional function returning the context of the query (e.g.
+        the path of the Flask request running it).
+        """
+        self.threshold_ms = threshold_ms
+        self.context = context
+        self._entries = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def __call__(self, trace) -> None:
+        duration_ms = trace["duration"] * 1000
+        if (trace["kind"] != "execute" or trace["error"] is not None
+                or duration_ms < self.threshold_ms):
+            return
+        entry = {"query": trace["query"], "duration_ms": duration_ms,
+                 "rows": trace["rows"],
+                 "pool_wait_ms": (trace["pool_wait"] or 0.0) * 1000,
+                 "context": self.context() if self.context else None,
+                 "plan": self._explain(trace)}
+        with self._lock:
+            self._entries.append(entry)
+        print(f"Slow query ({duration_ms:.0f} ms, {entry['rows']} rows, "
+              f"pool wait {entry['pool_wait_ms']:.0f} ms"
+              + (f", {entry['context']}" if entry["context"] else "")
+              + f"): {entry['query']}\n{entry['plan']}")
+
+    def entries(self) -> list:
+        """
+        Returns the logged slow queries, latest last.
+
+        Parameters:
+            none
+        """
+        with self._lock:
+            return list(self._entries)
+
+    def _explain(self, trace) -> str:
+        statement = trace["statement"]
+        if not isinstance(statement, str) or not statement.lstrip().upper(
+                ).startswith(self.EXPLAINABLE):
+            return None
+        conn = trace["cursor"].connection
+        if (conn.closed or conn.info.transaction_status
+                == extensions.TRANSACTION_STATUS_INERROR):
+            return None
+        # A plain cursor, not traced; the savepoint keeps a failing EXPLAIN
+        # from aborting the transaction of the caller
+        cur = conn.cursor(cursor_factory=extensions.cursor)
+        in_transaction = not conn.autocommit
+        try:
+            if in_transaction:
+                cur.execute("SAVEPOINT slow_query_explain;")
+            try:
+                cur.execute("EXPLAIN " + statement, trace["params"])
+                plan = "\n".join(row[0] for row in cur.fetchall())
+            except psycopg2.Error as e:
+                plan = f"EXPLAIN failed: {e}"
+                if in_transaction:
+                    cur.execute("ROLLBACK TO SAVEPOINT slow_query_explain;")
+            if in_transaction:
+                cur.execute("RELEASE SAVEPOINT slow_query_explain;")
+        except psycopg2.Error as e:
+            plan = f"EXPLAIN failed: {e}"
+        finally:
+            cur.close()
+        return plan
+
+
+# Slow-query log of the process, see DB_SLOW_QUERY_MS
+slow_query_log = SlowQueryLog()
+if SLOW_QUERY_MS > 0:
+    add_query_tracer(slow_query_log)
+
+
+def prepared_statement(query) -> tuple:
+    """
+    Converts a psycopg2 query into the body of a PREPARE statement.
+
+    Returns a tuple of (statement name, PREPARE body, parameter order), where
+    the name is derived from the query shape, the body uses $1, $2, ...
+    placeholders and the parameter order is the list of the named parameters
+    (in order of first use) or the number of positional ones.
+
+    Parameters:
+        query (str): A query with %s or %(name)s placeholders.
+    """
+    names = []
+    positional = 0
+
+    def number(match):
+        nonlocal positional
+        if match.group(0) == "%%":
+            return "%"
+        if match.group(1):
+            if match.group(1) not in names:
+                names.append(match.group(1))
+            return f"${names.index(match.group(1)) + 1}"
+        positional += 1
+        return f"${positional}"
+
+    body = PLACEHOLDER.sub(number, query).strip().rstrip(";")
+    name = "stmt_" + hashlib.md5(query.encode()).hexdigest()[:16]
+    # For the traces of its EXECUTEs
+    _prepared_queries[name] = query
+    return name, body, names or positional
+
+
+class HealthCheckedPool:
+    """
+    A thread-safe connection pool validating its connections on checkout.
+
+    Threads wait (up to timeout seconds) for a free connection instead of
+    failing when max_conn connections are in use. Before a connection is
+    handed out it is replaced if closed or older than max_lifetime, and
+    pinged with SELECT 1 if it has been idle for more than ping_after, so
+    connections dropped by the server are never given to a request. Idle
+    connections beyond min_conn are closed after max_idle seconds.
+
+    Same interface as the psycopg2 pools: getconn, putconn, closeall; plus
+    stats() for the wait times and health check counters.
+    """
+
+    def __init__(self, min_conn, max_conn, connection_string,
+                 ping_after=POOL_PING_AFTER, max_lifetime=POOL_MAX_LIFETIME,
+                 max_idle=POOL_MAX_IDLE, timeout=POOL_TIMEOUT) -> None:
+        self.min_conn = min_conn
+        self.max_conn = max_conn
+        self.connection_string = connection_string
+        self.ping_after = ping_after
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.timeout = timeout
+
+        self._idle = deque()  # (conn, returned at), most recent last
+        self._created_at = {}  # id(conn) -> creation time
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self._stats = {"checkouts": 0, "wait_seconds": 0.0,
+                       "max_wait_seconds": 0.0, "timeouts": 0,
+                       "connections_opened": 0, "failed_pings": 0,
+                       "expired": 0, "reaped": 0}
+
+        for _ in range(min_conn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def getconn(self):
+        """
+        Returns a healthy connection, waiting for one to be free if needed.
+        """
+        start = time.monotonic()
+        with self._condition:
+            self._reap()
+            while not self._idle and self._in_use >= self.max_conn:
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise pool.PoolError(
+                        f"No connection available after {self.timeout}s")
+                self._condition.wait(remaining)
+            self._in_use += 1
+            idle = self._idle.pop() if self._idle else None
+            waited = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            self._stats["wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(
+                self._stats["max_wait_seconds"], waited)
+
+        try:
+            conn = self._validate(*idle) if idle else None
+            return conn if conn is not None else self._connect()
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+    def putconn(self, conn, close=False) -> None:
+        """
+        Returns a connection to the pool, ending any open transaction.
+        """
+        try:
+            if not conn.closed and not close:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+        except psycopg2.Error:
+            # A connection that cannot be rolled back is not reused
+            close = True
+        finally:
+            if close or conn.closed:
+                self._discard(conn)
+            # The slot is freed whatever happened to the connection
+            with self._condition:
+                self._in_use -= 1
+                if not close and not conn.closed:
+                    self._idle.append((conn, time.monotonic()))
+                self._reap()
+                self._condition.notify()
+
+    def closeall(self) -> None:
+        """
+        Closes the idle connections; in-use ones are closed on return.
+        """
+        with self._condition:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+    def stats(self) -> dict:
+        """
+        Returns the pool size, wait time and health check counters.
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats["in_use"] = self._in_use
+            stats["idle"] = len(self._idle)
+        stats["avg_wait_seconds"] = (
+            stats["wait_seconds"] / stats["checkouts"]
+            if stats["checkouts"] else 0.0)
+        return stats
+
+    def _connect(self):
+        conn = psycopg2.connect(self.connection_string,
+                                cursor_factory=TracedCursor)
+        self._created_at[id(conn)] = time.monotonic()
+        self._count("connections_opened")
+        return conn
+
+    def _count(self, counter) -> None:
+        with self._condition:
+            self._stats[counter] += 1
+
+    def _validate(self, conn, returned_at):
+        # Returns the connection if it is usable, None if it was discarded
+        now = time.monotonic()
+        if conn.closed:
+            self._discard(conn)
+            return None
+        if now - self._created_at.get(id(conn), now) > self.max_lifetime:
+            self._count("expired")
+            self._discard(conn)
+            return None
+        if now - returned_at > self.ping_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+                conn.rollback()
+            except psycopg2.Error:
+                self._count("failed_pings")
+                self._discard(conn)
+                return None
+        return conn
+
+    def _reap(self) -> None:
+        # Close the connections idle for too long, oldest first, keeping
+        # min_conn of them (called with the condition held)
+        now = time.monotonic()
+        while (len(self._idle) + self._in_use > self.min_conn
+               and self._idle and now - self._idle[0][1] > self.max_idle):
+            self._count("reaped")
+            self._discard(self._idle.popleft()[0])
+
+    def _discard(self, conn) -> None:
+        self._created_at.pop(id(conn), None)
+        if not conn.closed:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
 
 class ConnectionPool:
     """
@@ -37,19 +498,55 @@ class ConnectionPool:
         - close_connection(conn, cur) -> closes the connection and returns
         it to the pool.
         - close_all_connections(none) -> closes all connections in the pool.
+        - execute(cur, query, params, prepare) -> executes a query with bound
+        parameters, as a server-side prepared statement if prepare is set.
+        - stats(none) -> returns the wait time and health check counters of
+        the thread-safe mode.
     """
 
     def __init__(self, DB=0, min_conn=1,
-                 max_conn=10) -> None:
+                 max_conn=10, threaded=False) -> None:
         """
         Initializes the connection pool with the given connection string,
         minimum and maximum number of connections.
+
+        With threaded set, the pool can be shared by threads (e.g. the
+        Flask workers) and validates its connections on checkout, see
+        HealthCheckedPool.
+
+        No connection is opened here: the pool connects on first use, so
+        importing a module holding a pool costs no round-trip.
+        """
+        self.connection_string = db[DB]
+        self.min_conn = min_conn
+        self.max_conn = max_conn
+        self.threaded = threaded
+        self._connection_pool = None
+        self._pool_lock = threading.Lock()
+        # Prepared statement names by connection: id(conn) -> (conn, names)
+        self.prepared_statements = {}
+        self._prepared_lock = threading.Lock()
+
+    @property
+    def connection_pool(self):
+        """
+        The underlying psycopg2 pool, created on first use.
         """
-        connection_string = db[DB]
-        self.connection_pool = pool.SimpleConnectionPool(
-            min_conn,  # Minimum number of connections in the pool
-            max_conn,  # Maximum number of connections in the pool
-            connection_string
+        if self._connection_pool is None:
+            with self._pool_lock:
+                if self._connection_pool is None:
+                    self._connection_pool = self._create_pool()
+        return self._connection_pool
+
+    def _create_pool(self):
+        if self.threaded:
+            return HealthCheckedPool(
+                self.min_conn, self.max_conn, self.connection_string)
+        return pool.SimpleConnectionPool(
+            self.min_conn,  # Minimum number of connections in the pool
+            self.max_conn,  # Maximum number of connections in the pool
+            self.connection_string,
+            cursor_factory=TracedCursor
         )
 
     def get_connection(self) -> tuple:
@@ -59,7 +556,10 @@ class ConnectionPool:
         Parameters:
             none
         """
+        start = time.perf_counter()
         conn = self.connection_pool.getconn()
+        # Reported with the queries of the connection, see add_query_tracer
+        _pool_waits[id(conn)] = time.perf_counter() - start
         cur = conn.cursor()
         return conn, cur
 
@@ -72,6 +572,7 @@ class ConnectionPool:
             cur (cursor): A cursor object to be closed.
         """
         cur.close()
+        _pool_waits.pop(id(conn), None)
         self.connection_pool.putconn(conn)
 
     def close_all_connections(self) -> None:
@@ -81,4 +582,91 @@ class ConnectionPool:
         Parameters:
             none
         """
-        self.connection_pool.closeall()
+        if self._connection_pool is not None:
+            self._connection_pool.closeall()
+
+    def stats(self) -> dict:
+        """
+        Returns the pool statistics (checkouts, wait times, failed pings,
+        expired and reaped connections); empty for the simple pool.
+
+        Parameters:
+            none
+        """
+        if isinstance(self._connection_pool, HealthCheckedPool):
+            return self._connection_pool.stats()
+        return {}
+
+    def execute(self, cur, query, params=None, prepare=True) -> None:
+        """
+        Executes a query with bound parameters, never interpolating values
+        into the SQL text.
+
+        With prepare set, the query runs as a server-side prepared statement
+        named after its shape: Postgres parses and plans it once per
+        connection and later calls only send EXECUTE with the values. A
+        statement gone stale (its table's columns changed since it was
+        prepared) is prepared again once.
+
+        Parameters:
+            cur (cursor): A cursor object of a pooled connection.
+            query (str): The query with %s or %(name)s placeholders.
+            params (tuple or dict): The values of the placeholders.
+            prepare (bool): Whether to use a prepared statement.
+        """
+        if not (prepare and USE_PREPARED_STATEMENTS):
+            cur.execute(query, params)
+            return
+
+        conn = cur.connection
+        name, body, order = prepared_statement(query)
+        if isinstance(order, list):
+            values = [params[key] for key in order]
+        else:
+            values = list(params or ())
+        execute = (f"EXECUTE {name} ({', '.join(['%s'] * len(values))});"
+                   if values else f"EXECUTE {name};")
+
+        # Statements are tracked per connection object; holding the
+        # connection keeps its id from being reused by another one
+        with self._prepared_lock:
+            entry = self.prepared_statements.get(id(conn))
+            if entry is None or entry[0] is not conn:
+                # Forget the connections closed since, e.g. by the pool
+                self.prepared_statements = {
+                    key: value for key, value
+                    in self.prepared_statements.items() if not value[0].closed}
+                entry = self.prepared_statements[id(conn)] = (conn, set())
+        names = entry[1]
+        # The recovery below rolls back: only safe if no work is pending
+        idle = (conn.info.transaction_status
+                == extensions.TRANSACTION_STATUS_IDLE)
+
+        prepared = name in names
+        try:
+            if not prepared:
+                cur.execute(f"PREPARE {name} AS {body};")
+                names.add(name)
+            cur.execute(execute, values)
+        except (errors.InvalidSqlStatementName,
+                errors.DuplicatePreparedStatement,
+                errors.FeatureNotSupported) as e:
+            # "cached plan must not change result type": the table of a
+            # SELECT * prepared earlier gained columns (e.g. a migration)
+            if isinstance(e, errors.FeatureNotSupported) and not prepared:
+                raise
+            if not idle:
+                # Inside a transaction (e.g. a populate run) the error aborts
+                # the earlier statements too: let the caller fail, the next
+                # transaction starts over
+                names.clear()
+                raise
+            # The session and our bookkeeping disagree (e.g. the session was
+            # reset) or the statement is stale; start over on a clean
+            # transaction
+            conn.rollback()
+            names.clear()
+            cur.execute("DEALLOCATE ALL;")
+            cur.execute(f"PREPARE {name} AS {body};")
+            names.add(name)
+            cur.execute(execute, values)
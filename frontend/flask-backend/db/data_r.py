@@ -5,8 +5,9 @@ Create a connection pool
 The default database is the trial database i.e. DB=0
 To use the development or main database, change the value of DB;
 DB=1 dev_database and DB=2 main database.
+The pool connects on first use, not on import.
 """
-cpool = ConnectionPool(DB=3)
+cpool = ConnectionPool(DB=3, threaded=True)  # shared by the Flask threads
 
 
 def row_existence_check(table_name, column_name, value) -> bool:
@@ -23,8 +24,8 @@ def row_existence_check(table_name, column_name, value) -> bool:
         conn, cur = cpool.get_connection()
 
         # Create the query
-        query = f"SELECT * FROM {table_name} WHERE {column_name} = '{value}';"
-        cur.execute(query)
+        query = f"SELECT 1 FROM {table_name} WHERE {column_name} = %s LIMIT 1;"
+        cpool.execute(cur, query, (value,))
 
         # Get the result
         result = cur.fetchone()
@@ -58,8 +59,8 @@ def get_value_single_where(
 
         # Create the query
         query = f"""SELECT {get_for_column} FROM {table_name} WHERE
-        {get_against_column}='{get_against_value}';"""
-        cur.execute(query)
+        {get_against_column} = %s;"""
+        cpool.execute(cur, query, (get_against_value,))
 
         # Get the result
         result = cur.fetchall()
@@ -73,9 +74,84 @@ def get_value_single_where(
     return result[0] if result else None
 
 
+def get_max_value_single_where(
+        table_name, get_for_column,
+        get_against_value, get_against_column
+        ) -> any:
+    """
+    Returns the maximum value of the specified column among the rows where
+    the value of the other specified column is equal to the specified value.
+
+    Parameters:
+        table_name (str): The name of the table.
+        get_for_column (str): The column whose maximum value is returned.
+        get_against_value (str): The value to be checked against.
+        get_against_column (str): The column to be checked against.
+    """
+    try:
+        # Get a connection and cursor object
+        conn, cur = cpool.get_connection()
+
+        # Create the query
+        query = f"""SELECT MAX({get_for_column}) FROM {table_name} WHERE
+        {get_against_column} = %s;"""
+        cpool.execute(cur, query, (get_against_value,))
+
+        # Get the result
+        result = cur.fetchone()
+
+        # close the connection
+        cpool.close_connection(conn, cur)
+
+    except Exception as e:
+        print(e)
+        return False
+    return result[0] if result else None
+
+
+def get_all_values(table_name, get_for_columns) -> any:
+    """
+    Returns the values of the specified columns for every row of the table.
+
+    Parameters:
+        table_name (str): The name of the table.
+        get_for_columns (str): The columns whose values are to be returned.
+        e.g. "location_name, location_id"
+    """
+    try:
+        # Get a connection and cursor object
+        conn, cur = cpool.get_connection()
+
+        # Create the query
+        query = f"SELECT {get_for_columns} FROM {table_name};"
+        cpool.execute(cur, query)
+
+        # Get the result
+        result = cur.fetchall()
+
+        # close the connection
+        cpool.close_connection(conn, cur)
+
+    except Exception as e:
+        print(e)
+        return False
+    return result
+
+
+def partition_condition(partition_range) -> str:
+    """
+    Returns the forecast_for_hour condition pruning the monthly partitions
+    of temperature_predictions, or "" without a partition_range.
+    """
+    if partition_range is None:
+        return ""
+    return " AND\n        forecast_for_hour BETWEEN %s AND %s"
+
+
 def get_value_double_where_with_between(
         table_name, get_for_column, get_against_value,
-        get_against_column, start_date, end_date, between_column
+        get_against_column, start_date, end_date, between_column,
+        partition_range=None
         ) -> any:
     """
     Returns the value of the specified column where the value of the specified
@@ -89,17 +165,22 @@ def get_value_double_where_with_between(
         start_date (str): The start date of the data range.
         end_date (str): The end date of the data range.
         between_column (str): The column to be checked against.
+        partition_range (tuple): Optional (start, end) of forecast_for_hour,
+        limiting the scan to the overlapping monthly partitions,
+        see db/partition_router.py.
     """
     try:
         # Get a connection and cursor object
         conn, cur = cpool.get_connection()
 
         # Create the query
+        pruning = partition_condition(partition_range)
         query = f"""SELECT {get_for_column} FROM {table_name} WHERE
-        {get_against_column}='{get_against_value}' AND
-        {between_column} BETWEEN '{start_date}' AND '{end_date}';"""
+        {get_against_column} = %s AND
+        {between_column} BETWEEN %s AND %s{pruning};"""
 
-        cur.execute(query)
+        cpool.execute(cur, query, (get_against_value, start_date, end_date,
+                                   *(partition_range or ())))
 
         # Get the result
         result = cur.fetchall()
@@ -113,11 +194,67 @@ def get_value_double_where_with_between(
     return result if result else None
 
 
+def stream_value_double_where_with_between(
+        table_name, get_for_column, get_against_value,
+        get_against_column, start_date, end_date, between_column,
+        batch_size=2000, partition_range=None
+        ) -> any:
+    """
+    Generator version of get_value_double_where_with_between: yields the
+    rows in lists of up to batch_size, read through a server-side (named)
+    cursor, so only one batch is held in memory at a time.
+
+    The connection is returned to the pool when the generator is exhausted
+    or closed (e.g. the client of a streamed response disconnected).
+
+    Parameters:
+        table_name (str): The name of the table.
+        get_for_column (str): The column whose value is to be returned.
+        get_against_value (str): The value to be checked against.
+        get_against_column (str): The column to be checked against.
+        start_date (str): The start date of the data range.
+        end_date (str): The end date of the data range.
+        between_column (str): The column to be checked against.
+        batch_size (int): The number of rows fetched per round-trip.
+        partition_range (tuple): Optional (start, end) of forecast_for_hour,
+        limiting the scan to the overlapping monthly partitions.
+    """
+    # Get a connection and cursor object
+    conn, cur = cpool.get_connection()
+    # Server-side cursor, the rows stay in the database until fetched
+    named_cur = conn.cursor(name=f"stream_{id(conn)}_{id(cur)}")
+    try:
+        # Create the query
+        pruning = partition_condition(partition_range)
+        query = f"""SELECT {get_for_column} FROM {table_name} WHERE
+        {get_against_column} = %s AND
+        {between_column} BETWEEN %s AND %s{pruning}
+        ORDER BY {between_column};"""
+
+        # Named cursors run a DECLARE, which cannot wrap a prepared statement
+        cpool.execute(named_cur, query,
+                      (get_against_value, start_date, end_date,
+                       *(partition_range or ())),
+                      prepare=False)
+
+        while True:
+            batch = named_cur.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+
+    finally:
+        # close the cursors and end the read transaction
+        named_cur.close()
+        conn.rollback()
+        cpool.close_connection(conn, cur)
+
+
 def get_predictions_vs_actual_with_error_by_location_id_with_date_range(
         id, start_date, end_date):
     """
     Returns the predictions vs actual temperature with error by location id
-    with date range.
+    with date range, read from the precomputed forecast_errors table.
 
     Parameters:
         id (int): The location id.
@@ -129,69 +266,30 @@ def get_predictions_vs_actual_with_error_by_location_id_with_date_range(
         # Get a connection and cursor object
         conn, cur = cpool.get_connection()
 
-        # Create the query
-        query = (
-            f"""WITH actual_temperatures AS (
-    -- For each forecast_for_hour, get the closest recording
-    SELECT DISTINCT ON (location_id, forecast_for_hour)
-        location_id,
-        forecast_for_hour,
-        temperature AS actual_temperature,
-        forecast_made_at,
-        id AS actual_reading_id
-    FROM
-        temperature_predictions
-    WHERE
-        location_id = {id}  -- Filter by location
-        AND forecast_for_hour BETWEEN '{start_date}' AND '{end_date}'
-        -- Filter by date range
-    ORDER BY
-        location_id,
-        forecast_for_hour,
-        ABS(EXTRACT(EPOCH FROM (forecast_for_hour - forecast_made_at)))
-),
-
-eleven_hour_predictions AS (
-    -- Get predictions made approximately 11 hours before
-    SELECT
-        id AS prediction_id,
-        location_id,
-        forecast_for_hour,
-        forecast_made_at,
-        temperature AS predicted_temperature,
-        EXTRACT(EPOCH FROM (forecast_for_hour - forecast_made_at)) / 3600 AS
-        hours_in_advance
-    FROM
-        temperature_predictions
-    WHERE
-        location_id = {id}  -- Filter by location
-        AND forecast_for_hour BETWEEN '{start_date}' AND '{end_date}'
-        -- Filter by date range
-        AND EXTRACT(EPOCH FROM (forecast_for_hour - forecast_made_at)) / 3600
-        BETWEEN 10 AND 12  -- 11 hours +/- 1
-)
-
--- Join actual temperatures with 11-hour predictions
-SELECT
-    a.location_id,
-    a.forecast_for_hour,
-    a.actual_reading_id,
-    p.prediction_id,
-    p.forecast_made_at,
-    p.hours_in_advance,
-    p.predicted_temperature,
-    a.actual_temperature,
-    (p.predicted_temperature - a.actual_temperature) AS prediction_error,
-    ABS(p.predicted_temperature - a.actual_temperature) AS absolute_error
+        # Create the query; the errors are precomputed after each populate
+        # run (see db/forecast_errors.py at the repository root)
+        query = """SELECT
+    location_id,
+    forecast_for_hour,
+    actual_reading_id,
+    prediction_id,
+    forecast_made_at,
+    hours_in_advance,
+    predicted_temperature,
+    actual_temperature,
+    prediction_error,
+    absolute_error
 FROM
-    actual_temperatures a
-JOIN
-    eleven_hour_predictions p ON a.location_id = p.location_id AND
-    a.forecast_for_hour = p.forecast_for_hour
+    forecast_errors
+WHERE
+    location_id = %(id)s  -- Filter by location
+    AND forecast_for_hour BETWEEN %(start_date)s AND %(end_date)s
+    -- Filter by date range
 ORDER BY
-    a.forecast_for_hour;""")
+    forecast_for_hour;"""
 
-        cur.execute(query)
+        cpool.execute(cur, query, {"id": id, "start_date": start_date,
+                                   "end_date": end_date})
 
         # Get the result
         result = cur.fetchall()
@@ -0,0 +1,434 @@
+import os
+import heapq
+import queue
+import datetime
+import threading
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from db.conn import ConnectionPool, db as database_urls
+from db import data_r
+from db.location_cache import location_directory
+from db.partition_router import to_datetime, forecast_for_hour_range
+
+"""
+Federated reads over the archived monthly databases (see db/conn.py).
+
+Each database holds the data of a date span: DB=4 February 2025, DB=5
+March 2025 and the master database (DB=3) what came after. A date range
+query is split by span, sent to every database it overlaps in parallel,
+and the sorted results are merged; a range within the master span is
+answered by data_r.py alone, as before. An archive database that is
+unreachable or not configured is skipped by the dashboard queries, which
+then answer with the rows of the other databases.
+
+The spans can be changed with DB_FEDERATION_SPANS, e.g.
+    "4:2025-02-01:2025-03-01,5:2025-03-01:2025-04-01,3:2025-04-01:"
+(DB index:first day:first day after, an empty end for an open span).
+"""
+
+MASTER_DB = 3
+FEDERATION_SPANS = os.getenv(
+    "DB_FEDERATION_SPANS",
+    "4:2025-02-01:2025-03-01,5:2025-03-01:2025-04-01,3:2025-04-01:")
+# Connections per archive database, which only serve history reads
+ARCHIVE_MAX_CONN = int(os.getenv("DB_ARCHIVE_MAX_CONN", "4"))
+# Batches read ahead per database while streaming a download
+PREFETCH_BATCHES = 2
+
+master_chart_query = (
+    data_r.get_predictions_vs_actual_with_error_by_location_id_with_date_range)
+
+# Chart rows of an archive database, which has no forecast_errors table:
+# the query the dashboard ran before the errors were precomputed
+ARCHIVE_CHART_QUERY = """WITH location AS (
+    SELECT location_id FROM locations WHERE location_name = %(city)s
+),
+
+actual_temperatures AS (
+    -- For each forecast_for_hour, get the closest recording
+    SELECT DISTINCT ON (location_id, forecast_for_hour)
+        location_id,
+        forecast_for_hour,
+        temperature AS actual_temperature,
+        id AS actual_reading_id
+    FROM
+        temperature_predictions
+    WHERE
+        location_id = (SELECT location_id FROM location)
+        AND forecast_for_hour BETWEEN %(start_date)s AND %(end_date)s
+        AND forecast_for_hour < %(span_end)s
+    ORDER BY
+        location_id,
+        forecast_for_hour,
+        ABS(EXTRACT(EPOCH FROM (forecast_for_hour - forecast_made_at)))
+),
+
+eleven_hour_predictions AS (
+    -- Get predictions made approximately 11 hours before
+    SELECT
+        id AS prediction_id,
+        location_id,
+        forecast_for_hour,
+        forecast_made_at,
+        temperature AS predicted_temperature,
+        (EXTRACT(EPOCH FROM (forecast_for_hour - forecast_made_at))
+        / 3600)::float8 AS hours_in_advance
+    FROM
+        temperature_predictions
+    WHERE
+        location_id = (SELECT location_id FROM location)
+        AND forecast_for_hour BETWEEN %(start_date)s AND %(end_date)s
+        AND forecast_for_hour < %(span_end)s
+        AND EXTRACT(EPOCH FROM (forecast_for_hour - forecast_made_at)) / 3600
+        BETWEEN 10 AND 12  -- 11 hours +/- 1
+)
+
+SELECT
+    a.location_id,
+    a.forecast_for_hour,
+    a.actual_reading_id,
+    p.prediction_id,
+    p.forecast_made_at,
+    p.hours_in_advance,
+    p.predicted_temperature,
+    a.actual_temperature,
+    (p.predicted_temperature - a.actual_temperature) AS prediction_error,
+    ABS(p.predicted_temperature - a.actual_temperature) AS absolute_error
+FROM
+    actual_temperatures a
+JOIN
+    eleven_hour_predictions p ON a.location_id = p.location_id AND
+    a.forecast_for_hour = p.forecast_for_hour
+ORDER BY
+    a.forecast_for_hour;"""
+
+# Download rows of any database, by forecast time
+DOWNLOAD_QUERY = """SELECT t.id, t.location_id, t.forecast_for_hour,
+    t.forecast_made_at, t.temperature
+FROM temperature_predictions t
+JOIN locations l ON l.location_id = t.location_id
+WHERE
+    l.location_name = %(city)s
+    AND t.forecast_made_at BETWEEN %(start_date)s AND %(end_date)s
+    AND t.forecast_made_at < %(span_end)s
+    AND t.forecast_for_hour BETWEEN %(first_hour)s AND %(last_hour)s
+ORDER BY t.forecast_made_at;"""
+
+# Error sums of the predictions of a city by lead hour (1 to 12), on any
+# database: like the chart rows, each prediction is compared with the
+# forecast made the closest to its hour, but for every lead hour instead of
+# the ~11 hour predictions only
+LEAD_HOUR_ERRORS_QUERY = """WITH predictions AS (
+    SELECT
+        t.forecast_for_hour,
+        t.temperature,
+        EXTRACT(EPOCH FROM (t.forecast_for_hour - t.forecast_made_at)) / 3600
+        AS lead
+    FROM temperature_predictions t
+    JOIN locations l ON l.location_id = t.location_id
+    WHERE
+        l.location_name = %(city)s
+        AND t.forecast_for_hour BETWEEN %(start_date)s AND %(end_date)s
+        AND t.forecast_for_hour < %(span_end)s
+),
+
+actual_temperatures AS (
+    -- For each forecast_for_hour, get the closest recording
+    SELECT DISTINCT ON (forecast_for_hour)
+        forecast_for_hour,
+        temperature AS actual_temperature
+    FROM
+        predictions
+    ORDER BY
+        forecast_for_hour,
+        ABS(lead)
+),
+
+errors AS (
+    SELECT
+        ROUND(p.lead)::int AS lead_hour,
+        (p.temperature - a.actual_temperature)::float8 AS error
+    FROM
+        predictions p
+    JOIN
+        actual_temperatures a ON a.forecast_for_hour = p.forecast_for_hour
+    WHERE
+        ROUND(p.lead) BETWEEN 1 AND 12
+)
+
+SELECT
+    lead_hour,
+    COUNT(*),
+    SUM(error),
+    SUM(ABS(error)),
+    SUM(error * error)
+FROM
+    errors
+GROUP BY
+    lead_hour
+ORDER BY
+    lead_hour;"""
+
+
+def parse_spans(spans) -> list:
+    """
+    Returns the [(DB index, first day, first day after or None)] of a
+    DB_FEDERATION_SPANS string.
+
+    Parameters:
+        spans (str): e.g. "4:2025-02-01:2025-03-01,3:2025-03-01:"
+    """
+    parsed = []
+    for span in spans.split(","):
+        DB, first_day, end_day = span.strip().split(":")
+        parsed.append((int(DB), to_datetime(first_day),
+                       to_datetime(end_day) if end_day else None))
+    return parsed
+
+
+database_spans = parse_spans(FEDERATION_SPANS)
+
+
+def spans_for_range(start_date, end_date) -> list:
+    """
+    Returns the (DB index, start, end, span end) of every database whose
+    span overlaps the range, in date order, where start is clipped to the
+    span and the span end bounds the rows read from that database.
+
+    Parameters:
+        start_date (str): The start date of the data range.
+        end_date (str): The end date of the data range.
+    """
+    start, end = to_datetime(start_date), to_datetime(end_date)
+    overlapping = []
+    for DB, first_day, end_day in sorted(database_spans,
+                                         key=itemgetter(1)):
+        if first_day > end or (end_day is not None and end_day <= start):
+            continue
+        overlapping.append((DB, max(start, first_day), end,
+                            end_day or datetime.datetime.max))
+    return overlapping
+
+
+def is_federated(start_date, end_date) -> bool:
+    """
+    Returns True if the range reaches into an archive database.
+    """
+    return any(DB != MASTER_DB
+               for DB, *_ in spans_for_range(start_date, end_date))
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(DB) -> ConnectionPool:
+    """
+    Returns the connection pool of a database, created on first use; the
+    master database shares the pool of data_r.py.
+    """
+    if DB == MASTER_DB:
+        return data_r.cpool
+    with _pools_lock:
+        if DB not in _pools:
+            _pools[DB] = ConnectionPool(DB=DB, max_conn=ARCHIVE_MAX_CONN,
+                                        threaded=True)
+        return _pools[DB]
+
+
+def fetch_all(DB, query, params) -> list:
+    """
+    Returns every row of a query run on the given database.
+    """
+    cpool = get_pool(DB)
+    conn, cur = cpool.get_connection()
+    try:
+        cpool.execute(cur, query, params)
+        return cur.fetchall()
+    finally:
+        conn.rollback()
+        cpool.close_connection(conn, cur)
+
+
+def fetch_archive(DB, query, params) -> list:
+    """
+    Returns every row of a query run on an archive database, or no rows if
+    the database is not configured (no URL) or cannot be queried, so that
+    the other databases still answer; the error is logged.
+    """
+    if not database_urls[DB]:
+        print(f"Skipping database {DB}: no database URL configured")
+        return []
+    try:
+        return fetch_all(DB, query, params)
+    except psycopg2.Error as e:
+        # e.g. OperationalError or PoolError, the server being unreachable
+        print(f"Skipping database {DB}: {e}")
+        return []
+
+
+def stream_rows(DB, query, params, batch_size) -> any:
+    """
+    Yields the rows of a query run on the given database in lists of up to
+    batch_size, read through a server-side cursor.
+    """
+    cpool = get_pool(DB)
+    conn, cur = cpool.get_connection()
+    named_cur = conn.cursor(name=f"federated_{id(conn)}_{id(cur)}")
+    try:
+        # Named cursors run a DECLARE, which cannot wrap a prepared statement
+        cpool.execute(named_cur, query, params, prepare=False)
+        while True:
+            batch = named_cur.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        named_cur.close()
+        conn.rollback()
+        cpool.close_connection(conn, cur)
+
+
+def prefetch(batches, depth=PREFETCH_BATCHES) -> any:
+    """
+    Yields the rows of a generator of batches, read ahead by a background
+    thread up to depth batches, so that several databases are read at the
+    same time. Closing this generator stops the thread, which closes the
+    batches generator (and returns its connection) in turn.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read_ahead() -> None:
+        try:
+            for batch in batches:
+                if not put(batch):
+                    break
+        except Exception as e:
+            put(e)
+        finally:
+            batches.close()
+            put(done)
+
+    threading.Thread(target=read_ahead, daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+    finally:
+        stop.set()
+
+
+def federated_chart_data(city, start_date, end_date) -> list:
+    """
+    Returns the predictions vs actual temperature with error of a city over
+    a date range spanning several databases, queried in parallel and merged
+    by forecast_for_hour.
+
+    Parameters:
+        city (str): The city for which the data is to be fetched.
+        start_date (str): The start date of the data range.
+        end_date (str): The end date of the data range.
+    """
+    def span_rows(span) -> list:
+        DB, start, end, span_end = span
+        if DB == MASTER_DB:
+            # The precomputed forecast errors of the master database
+            location_id = location_directory.get_id(city)
+            if location_id is None:
+                return []
+            return master_chart_query(location_id, start, end) or []
+        return fetch_archive(DB, ARCHIVE_CHART_QUERY, {
+            "city": city, "start_date": start, "end_date": end,
+            "span_end": span_end})
+
+    spans = spans_for_range(start_date, end_date)
+    if not spans:
+        return []
+    with ThreadPoolExecutor(max_workers=len(spans)) as executor:
+        results = list(executor.map(span_rows, spans))
+    return list(heapq.merge(*results, key=itemgetter(1)))
+
+
+def lead_hour_error_sums(city, start_date, end_date) -> list:
+    """
+    Returns the (lead hour, count, sum of errors, sum of absolute errors,
+    sum of squared errors) of the predictions of a city over a date range,
+    for the lead hours 1 to 12 with predictions, added up over every
+    database the range overlaps (queried in parallel).
+
+    Parameters:
+        city (str): The city for which the data is to be fetched.
+        start_date (str): The start date of the data range.
+        end_date (str): The end date of the data range.
+    """
+    def span_sums(span) -> list:
+        DB, start, end, span_end = span
+        fetch = fetch_all if DB == MASTER_DB else fetch_archive
+        return fetch(DB, LEAD_HOUR_ERRORS_QUERY, {
+            "city": city, "start_date": start, "end_date": end,
+            "span_end": span_end})
+
+    spans = spans_for_range(start_date, end_date)
+    if not spans:
+        return []
+    with ThreadPoolExecutor(max_workers=len(spans)) as executor:
+        results = list(executor.map(span_sums, spans))
+
+    sums = {}
+    for rows in results:
+        for lead_hour, *values in rows:
+            total = sums.setdefault(lead_hour, [0, 0.0, 0.0, 0.0])
+            for i, value in enumerate(values):
+                total[i] += value
+    return [(lead_hour, *sums[lead_hour]) for lead_hour in sorted(sums)]
+
+
+def stream_federated_download(city, start_date, end_date,
+                              batch_size=2000) -> any:
+    """
+    Yields the temperature data of a city over a date range spanning several
+    databases, in lists of up to batch_size rows ordered by
+    forecast_made_at. Every database is read in parallel through a
+    server-side cursor and the rows are merged as they arrive.
+
+    Parameters:
+        city (str): The city for which the data is to be fetched.
+        start_date (str): The start date of the data range.
+        end_date (str): The end date of the data range.
+        batch_size (int): The number of rows per batch.
+    """
+    streams = []
+    for DB, start, end, span_end in spans_for_range(start_date, end_date):
+        first_hour, last_hour = forecast_for_hour_range(start, end)
+        streams.append(prefetch(stream_rows(DB, DOWNLOAD_QUERY, {
+            "city": city, "start_date": start, "end_date": end,
+            "span_end": span_end, "first_hour": first_hour,
+            "last_hour": last_hour}, batch_size)))
+    try:
+        batch = []
+        for row in heapq.merge(*streams, key=itemgetter(3)):
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        for stream in streams:
+            stream.close()
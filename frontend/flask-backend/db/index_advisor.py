@@ -0,0 +1,155 @@
+import json
+import argparse
+import datetime as dt
+from db import data_r
+from db.data_r import cpool
+from db.partition_router import forecast_for_hour_range
+
+"""
+Index advisor for the queries of db/data_r.py.
+Runs every helper once with representative arguments, captures the SQL it
+executes, and reports from the EXPLAIN plan which indexes the query uses
+and whether it falls back to a sequential scan of a large table.
+
+On a small table the planner may rightly prefer a sequential scan, so run
+it against a database with production-like volume, once the migrations are
+applied (python -m db.migrations at the repository root):
+    python -m db.index_advisor --city Najafgarh
+"""
+
+# Tables for which a sequential scan is reported as a problem, along with
+# their partitions, e.g. temperature_predictions_y2025m03
+LARGE_TABLES = ("temperature_predictions", "forecast_errors")
+
+chart_query = (
+    data_r.get_predictions_vs_actual_with_error_by_location_id_with_date_range)
+
+
+def data_r_calls(city, location_id, start_date, end_date) -> dict:
+    """
+    Returns {helper name: function running it} for each query of data_r.
+    """
+    partition_range = forecast_for_hour_range(start_date, end_date)
+    return {
+        "row_existence_check": lambda: data_r.row_existence_check(
+            "locations", "location_name", city),
+        "get_value_single_where": lambda: data_r.get_value_single_where(
+            "locations", "location_id", city, "location_name"),
+        "get_max_value_single_where":
+            lambda: data_r.get_max_value_single_where(
+                "populate_logs", "populate_id", "Success", "status"),
+        "get_all_values": lambda: data_r.get_all_values(
+            "locations", "location_name, location_id"),
+        "get_value_double_where_with_between":
+            lambda: data_r.get_value_double_where_with_between(
+                "temperature_predictions", "*", location_id, "location_id",
+                start_date, end_date, "forecast_made_at",
+                partition_range=partition_range),
+        "stream_value_double_where_with_between":
+            lambda: next(data_r.stream_value_double_where_with_between(
+                "temperature_predictions", "*", location_id, "location_id",
+                start_date, end_date, "forecast_made_at",
+                partition_range=partition_range), None),
+        "get_predictions_vs_actual_with_error_by_location_id_with_date_range":
+            lambda: chart_query(location_id, start_date, end_date),
+    }
+
+
+def capture_queries(call) -> list:
+    """
+    Runs call and returns the (query, params) it executed through cpool.
+    """
+    captured = []
+    execute = cpool.execute
+
+    def recording_execute(cur, query, params=None, prepare=True):
+        captured.append((query, params))
+        return execute(cur, query, params, prepare)
+
+    cpool.execute = recording_execute
+    try:
+        call()
+    finally:
+        cpool.execute = execute
+    return captured
+
+
+def plan_nodes(plan) -> list:
+    """
+    Flattens an EXPLAIN (FORMAT JSON) plan into its list of nodes.
+    """
+    nodes = [plan]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+def explain(query, params) -> dict:
+    """
+    Returns the indexes used and the tables scanned sequentially by a query.
+    """
+    conn, cur = cpool.get_connection()
+    try:
+        cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+        plan = cur.fetchone()[0]
+    finally:
+        conn.rollback()
+        cpool.close_connection(conn, cur)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    nodes = plan_nodes(plan[0]["Plan"])
+    return {
+        "indexes": sorted({node["Index Name"] for node in nodes
+                           if "Index Name" in node}),
+        "seq_scans": sorted({node["Relation Name"] for node in nodes
+                             if node["Node Type"] == "Seq Scan"}),
+    }
+
+
+def check_indexes(city="Najafgarh", start_date="2025-02-01",
+                  end_date=None) -> dict:
+    """
+    Returns {helper name: [report, ...]} with a report for every query run
+    by each helper of data_r, in the order they ran; a report holds the
+    query, the indexes used, the tables scanned sequentially, and
+    ok = False if one of those is a large table.
+
+    Parameters:
+        city (str): A city present in the locations table.
+        start_date (str): The start date of the data range.
+        end_date (str): The end date of the data range, today by default.
+    """
+    end_date = end_date or dt.datetime.now().strftime("%Y-%m-%d")
+    location = data_r.get_value_single_where(
+        "locations", "location_id", city, "location_name")
+    location_id = location[0] if location else None
+
+    reports = {}
+    for name, call in data_r_calls(
+            city, location_id, start_date, end_date).items():
+        reports[name] = []
+        for query, params in capture_queries(call):
+            report = explain(query, params)
+            report["query"] = " ".join(query.split())
+            report["ok"] = not any(table.startswith(LARGE_TABLES)
+                                   for table in report["seq_scans"])
+            reports[name].append(report)
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--city", default="Najafgarh")
+    parser.add_argument("--start-date", default="2025-02-01")
+    parser.add_argument("--end-date", default=None)
+    args = parser.parse_args()
+
+    for name, reports in check_indexes(
+            args.city, args.start_date, args.end_date).items():
+        for i, report in enumerate(reports, 1):
+            print(f"{'OK  ' if report['ok'] else 'SLOW'} {name} "
+                  f"(query {i}/{len(reports)})")
+            print(f"     query: {report['query'][:120]}")
+            print(f"     indexes: {', '.join(report['indexes']) or '-'}")
+            print(f"     seq scans: {', '.join(report['seq_scans']) or '-'}")
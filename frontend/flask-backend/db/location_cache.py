@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from db.data_r import get_all_values
+
+# Seconds before the cached locations are reloaded from the database
+LOCATION_CACHE_TTL = float(os.getenv("LOCATION_CACHE_TTL", "3600"))
+# Minimum seconds between two reloads caused by an unknown location name,
+# and between two attempts while the database cannot be queried
+MISS_RELOAD_INTERVAL = 5.0
+
+
+class LocationDirectory:
+    """
+    An in-process, thread-safe cache of the locations table mapping each
+    location name to its location_id. The whole table is loaded with a
+    single query and reloaded when the TTL expires or after invalidate(),
+    so name -> id lookups cost no round-trip in the steady state.
+
+    Methods:
+        - get_id(location_name) -> returns the location_id or None.
+        - mapping(none) -> returns a copy of the name -> id dictionary.
+        - refresh(none) -> reloads the locations from the database.
+        - invalidate(none) -> forces a reload on the next lookup.
+    """
+
+    def __init__(self, ttl=LOCATION_CACHE_TTL) -> None:
+        self.ttl = ttl
+        self.location_ids = {}
+        self.loaded_at = None
+        # Time of the last failed load, None once a load succeeds
+        self.failed_at = None
+        self._lock = threading.Lock()
+
+    def get_id(self, location_name) -> int:
+        """
+        Returns the location_id of the location, or None if it is unknown.
+
+        Parameters:
+            location_name (str): The name of the location.
+        """
+        with self._lock:
+            if self._stale():
+                self._load()
+            location_id = self.location_ids.get(location_name)
+            # A location added since the last load, reload (rate-limited)
+            if location_id is None and not self._failed_recently() and (
+                    self.loaded_at is None or
+                    time.monotonic() - self.loaded_at > MISS_RELOAD_INTERVAL):
+                self._load()
+                location_id = self.location_ids.get(location_name)
+        return location_id
+
+    def mapping(self) -> dict:
+        """
+        Returns a copy of the location name -> location_id dictionary.
+
+        Parameters:
+            none
+        """
+        with self._lock:
+            if self._stale():
+                self._load()
+            return dict(self.location_ids)
+
+    def refresh(self) -> bool:
+        """
+        Reloads the locations from the database.
+        Returns False if the query failed; the old entries are kept.
+
+        Parameters:
+            none
+        """
+        with self._lock:
+            return self._load()
+
+    def invalidate(self) -> None:
+        """
+        Marks the cache as stale, e.g. after inserting a new location.
+
+        Parameters:
+            none
+        """
+        with self._lock:
+            self.loaded_at = None
+            self.failed_at = None
+
+    def _stale(self) -> bool:
+        # While the database is down, the old entries are served between
+        # two attempts
+        return (self.loaded_at is None or
+                time.monotonic() - self.loaded_at > self.ttl
+                ) and not self._failed_recently()
+
+    def _failed_recently(self) -> bool:
+        return (self.failed_at is not None and
+                time.monotonic() - self.failed_at <= MISS_RELOAD_INTERVAL)
+
+    def _load(self) -> bool:
+        rows = get_all_values("locations", "location_name, location_id")
+        if rows is False:
+            self.failed_at = time.monotonic()
+            return False
+        self.location_ids = {name: location_id for name, location_id in rows}
+        self.loaded_at = time.monotonic()
+        self.failed_at = None
+        return True
+
+
+# Shared directory used by the query handlers
+location_directory = LocationDirectory()
@@ -0,0 +1,60 @@
+import datetime
+
+"""
+Routing of the temperature_predictions queries to its monthly partitions.
+
+The table is partitioned on forecast_for_hour (migration 005 of
+db/migrations.py at the repository root), so Postgres only scans the
+partitions overlapping a forecast_for_hour condition. Queries filtering on
+forecast_made_at alone, e.g. the CSV download, would scan every month:
+the router turns their range into the forecast_for_hour range it implies,
+added to the query as a redundant condition.
+"""
+
+# A forecast covers the next 12 hours, whose timestamps may be a few hours
+# off forecast_made_at (local vs UTC time); the margins stay well clear
+MADE_BEFORE_MARGIN = datetime.timedelta(days=1)
+MADE_AFTER_MARGIN = datetime.timedelta(days=2)
+
+
+def to_datetime(value) -> datetime.datetime:
+    """
+    Returns the value as a naive datetime, converted to UTC if it has an
+    offset, like the TIMESTAMP columns it is compared with; raises
+    ValueError if it is not a date.
+
+    Parameters:
+        value (str, date or datetime): e.g. "2025-02-01", or the
+        toISOString() dates of the dashboard "2025-02-01T00:00:00.000Z"
+    """
+    if isinstance(value, datetime.datetime):
+        parsed = value
+    elif isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    elif isinstance(value, str):
+        text = value.strip()
+        # fromisoformat only reads the "Z" suffix from Python 3.11
+        if text[-1:] in ("Z", "z"):
+            text = text[:-1] + "+00:00"
+        parsed = datetime.datetime.fromisoformat(text)
+    else:
+        raise ValueError(f"Invalid date: {value!r}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(
+            tzinfo=None)
+    return parsed
+
+
+def forecast_for_hour_range(start_date, end_date) -> tuple:
+    """
+    Returns the (start, end) of forecast_for_hour covering every prediction
+    made between start_date and end_date, which limits the query to the
+    partitions of those months.
+
+    Parameters:
+        start_date (str): The start of the forecast_made_at range.
+        end_date (str): The end of the forecast_made_at range.
+        e.g. "2025-02-01", "2025-03-01"
+    """
+    return (to_datetime(start_date) - MADE_BEFORE_MARGIN,
+            to_datetime(end_date) + MADE_AFTER_MARGIN)
@@ -1,11 +1,29 @@
-from flask import Blueprint, request, jsonify, make_response
-from services.query_handler import chart_data_by_city_and_date_range, get_date_range_temperature_data_by_city
-from services.data_formatter import convert_db_data_to_frontend_json, convert_db_data_to_csv_download
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from services.query_handler import chart_data_by_city_and_date_range, stream_date_range_temperature_data_by_city
+from services.query_handler import lead_hour_errors_by_city_and_date_range
+from services.data_formatter import convert_db_data_to_frontend_json, stream_db_data_to_csv_download
+from services.data_formatter import convert_db_data_to_frontend_columns, dumps_json
+from services.response_cache import chart_cache
+from services.error_stats import error_statistics
+from db.data_r import cpool
+from db.conn import slow_query_log
+from db.partition_router import to_datetime
 import datetime as dt
 
 views = Blueprint("views", __name__)
 
 
+def invalid_date_range(start_date, end_date):
+    # 400 response of a date range that cannot be parsed, None otherwise
+    # (the dashboard sends toISOString() dates, "2025-02-01T00:00:00.000Z")
+    try:
+        to_datetime(start_date)
+        to_datetime(end_date)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return None
+
+
 @views.route("/home", methods=["GET", "POST"])
 def home():
     if request.method == "GET":
@@ -19,18 +37,128 @@ def home():
         end_date = data.get("end_date")
         # print(f"{data}")  # Debugging statement
 
+    invalid = invalid_date_range(start_date, end_date)
+    if invalid is not None:
+        return invalid
+
+    # ?format=columns returns {"columns": [...], "data": {column: [...]}}
+    # instead of one object per row
+    if request.args.get("format") == "columns":
+        return home_columns(city, start_date, end_date)
+
     try:
+        # Serve the response from the cache if this range was asked before
+        # since the last populate run
+        cache_key = (city, start_date, end_date)
+        chart_data = chart_cache.get(cache_key)
+        if chart_data is not None:
+            response = jsonify(chart_data)
+            response.headers["X-Cache"] = "HIT"
+            return response
+
         temperature_data = chart_data_by_city_and_date_range(
             city, start_date, end_date)
         # print(f"Temperature data: {temperature_data}")  # Debugging statement
         # print(convert_db_data_to_frontend_json(temperature_data)) # Debugging
-        return jsonify(convert_db_data_to_frontend_json(temperature_data))
+        chart_data = convert_db_data_to_frontend_json(temperature_data)
+        # Empty results are not cached, they may come from a failed query
+        if chart_data:
+            chart_cache.set(cache_key, chart_data)
+        response = jsonify(chart_data)
+        response.headers["X-Cache"] = "MISS"
+        return response
 
     except Exception as e:
         # print(f"Exception occurred: {str(e)}")  # Debugging statement
         return f"<p>{str(e)}<p>"
 
 
+def home_columns(city, start_date, end_date):
+    # Columnar /home response, cached already encoded
+    try:
+        cache_key = (city, start_date, end_date, "columns")
+        body = chart_cache.get(cache_key)
+        if body is not None:
+            response = Response(body, mimetype="application/json")
+            response.headers["X-Cache"] = "HIT"
+            return response
+
+        temperature_data = chart_data_by_city_and_date_range(
+            city, start_date, end_date)
+        body = dumps_json(convert_db_data_to_frontend_columns(temperature_data))
+        # Empty results are not cached, they may come from a failed query
+        if temperature_data:
+            chart_cache.set(cache_key, body)
+        response = Response(body, mimetype="application/json")
+        response.headers["X-Cache"] = "MISS"
+        return response
+
+    except Exception as e:
+        return f"<p>{str(e)}<p>"
+
+
+@views.route("/home/stats", methods=["GET", "POST"])
+def home_stats():
+    # Error histogram, heatmap and per lead hour statistics of the /home
+    # chart data, aggregated here instead of in the browser
+    if request.method == "GET":
+        city = "Najafgarh"
+        start_date = "2025-02-01"
+        end_date = dt.datetime.now().strftime("%Y-%m-%d")
+    elif request.method == "POST":
+        data = request.get_json()
+        city = data.get("city")
+        start_date = data.get("start_date")
+        end_date = data.get("end_date")
+
+    invalid = invalid_date_range(start_date, end_date)
+    if invalid is not None:
+        return invalid
+
+    try:
+        cache_key = ("stats", city, start_date, end_date)
+        statistics = chart_cache.get(cache_key)
+        if statistics is not None:
+            response = jsonify(statistics)
+            response.headers["X-Cache"] = "HIT"
+            return response
+
+        temperature_data = chart_data_by_city_and_date_range(
+            city, start_date, end_date)
+        # The chart rows only hold the ~11 hour predictions: the per lead
+        # hour statistics are computed from every prediction
+        lead_hour_sums = lead_hour_errors_by_city_and_date_range(
+            city, start_date, end_date)
+        statistics = error_statistics(temperature_data,
+                                      lead_hour_sums=lead_hour_sums)
+        if statistics["count"]:
+            chart_cache.set(cache_key, statistics)
+        response = jsonify(statistics)
+        response.headers["X-Cache"] = "MISS"
+        return response
+
+    except Exception as e:
+        return f"<p>{str(e)}<p>"
+
+
+@views.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    # Hit/miss counters of the /home response cache
+    return jsonify(chart_cache.stats())
+
+
+@views.route("/pool/stats", methods=["GET"])
+def pool_stats():
+    # Wait times and health check counters of the database connection pool
+    return jsonify(cpool.stats())
+
+
+@views.route("/db/slow-queries", methods=["GET"])
+def slow_queries():
+    # The last queries slower than DB_SLOW_QUERY_MS, with their EXPLAIN plan
+    return jsonify(slow_query_log.entries())
+
+
 @views.route("/download", methods=["GET"])
 def download():
     # This route is for downloading the data as a CSV file
@@ -38,19 +166,30 @@ def download():
     start_date = request.args.get("start_date")
     end_date = request.args.get("end_date")
 
-    data = get_date_range_temperature_data_by_city(city, start_date, end_date)
-    # print(data)
-
     try:
-        if data:
-            csv_data = convert_db_data_to_csv_download(data)
-            response = make_response(csv_data)
+        # Batches of rows read through a server-side cursor, so the memory
+        # use does not grow with the date range; None for an unknown city
+        # or missing or invalid dates
+        batches = stream_date_range_temperature_data_by_city(
+            city, start_date, end_date)
+
+        # Read the first batch now to tell an empty range apart
+        first_batch = next(batches, None) if batches is not None else None
+        if first_batch:
+            def all_batches():
+                yield first_batch
+                yield from batches
+
+            # The CSV is sent chunk by chunk as the batches come in
+            response = Response(
+                stream_with_context(
+                    stream_db_data_to_csv_download(all_batches())),
+                mimetype="text/csv")
             response.headers["Content-Disposition"] = "attachment; filename=data.csv"
-            response.headers["Content-Type"] = "text/csv"
             return response
         else:
             return "No data found in the database."
-        
+
     except Exception as e:
         # print(f"Exception occurred: {str(e)}")  # Debugging statement
-        return f"<p>{str(e)}<p>"
\ No newline at end of file
+        return f"<p>{str(e)}<p>"
@@ -1,8 +1,23 @@
 import json
+from decimal import Decimal
 from datetime import datetime, timedelta
 from io import StringIO
 import csv
 
+# Optional faster JSON encoder, the standard library one is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Column names of the chart query rows
+CHART_COLUMNS = [
+    "location_id", "forecast_for_hour",
+    "actual_reading_id", "prediction_id", "forecast_made_at",
+    "hours_in_advance", "predicted_temperature", "actual_temperature",
+    "prediction_error", "absolute_error"
+]
+
 
 def convert_db_data_to_frontend_json(forecast_tuples):
     """
@@ -19,12 +34,7 @@ def convert_db_data_to_frontend_json(forecast_tuples):
         JSON string representation of the data
     """
     # Define column names for the tuple data
-    column_names = [
-        "location_id", "forecast_for_hour",
-        "actual_reading_id", "prediction_id", "forecast_made_at",
-        "hours_in_advance", "predicted_temperature", "actual_temperature",
-        "prediction_error", "absolute_error"
-    ]
+    column_names = CHART_COLUMNS
 
     # Convert tuples to dictionaries
     forecast_dicts = []
@@ -42,6 +52,62 @@ def convert_db_data_to_frontend_json(forecast_tuples):
 
     return forecast_dicts
 
+def convert_db_data_to_frontend_columns(forecast_tuples):
+    """
+    Columnar version of convert_db_data_to_frontend_json: the rows are
+    transposed once into one list per column, so each key is sent once
+    instead of once per row, and the timestamps are converted a column at
+    a time.
+
+    Args:
+        forecast_tuples: List of tuples containing forecast data with the
+            fields of convert_db_data_to_frontend_json
+
+    Returns:
+        {"columns": [column names], "data": {column name: [values]}}
+    """
+    if forecast_tuples:
+        columns = [list(column) for column in zip(*forecast_tuples)]
+    else:
+        columns = [[] for _ in CHART_COLUMNS]
+    data = dict(zip(CHART_COLUMNS, columns))
+
+    # datetime objects to ISO format strings, strings are passed through
+    for dt_field in ["forecast_for_hour", "forecast_made_at"]:
+        values = data[dt_field]
+        if values and isinstance(values[0], datetime):
+            data[dt_field] = list(map(datetime.isoformat, values))
+
+    return {"columns": CHART_COLUMNS, "data": data}
+
+
+def json_default(value):
+    """
+    Encodes the values neither JSON encoder knows, e.g. the Decimal of a
+    numeric column (Flask's jsonify does the same).
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps_json(payload):
+    """
+    Serializes a response payload to compact JSON bytes, with orjson when
+    it is installed.
+
+    Args:
+        payload: JSON-serializable object, Decimal values included
+
+    Returns:
+        JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=json_default)
+    return json.dumps(payload, separators=(",", ":"),
+                      default=json_default).encode()
+
+
 def convert_db_data_to_csv_download(forecast_tuples):
     """
     Convert a list of forecast data tuples to a CSV format.
@@ -73,6 +139,44 @@ def convert_db_data_to_csv_download(forecast_tuples):
     # print(f"CSV data: {output.getvalue()}")  # Debugging statement
     return output.getvalue()
 
+def stream_db_data_to_csv_download(forecast_batches):
+    """
+    Streaming version of convert_db_data_to_csv_download.
+    Yields the CSV text chunk by chunk: the header row, then one chunk per
+    batch of forecast data tuples, so the file is never built in memory.
+
+    Args:
+        forecast_batches: Iterable of lists of tuples containing forecast data
+            with fields:
+            (id, location_id, forecast_for_hour, forecast_made_at, temperature)
+
+    Yields:
+        CSV text chunks
+    """
+    # Define column names for the tuple data
+    columns = [
+        "id", "location_id", "forecast_for_hour",
+        "forecast_made_at", "temperature"
+    ]
+
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(columns)             # Write header row
+    yield output.getvalue()
+
+    ist_offset = timedelta(hours=5, minutes=30)
+    for batch in forecast_batches:
+        output.seek(0)
+        output.truncate()
+        # convert datetime objects to strings in ISO format
+        # and add 5:30 hours to forecast_made_at(utc+0) to get IST(utc+5:30)
+        writer.writerows(
+            (row[0], row[1], row[2].isoformat(),
+             (row[3] + ist_offset).isoformat(), row[4])
+            for row in batch)
+        yield output.getvalue()
+
+
 # Example usage
 if __name__ == "__main__":
     # Sample data (your actual tuples would go here)
@@ -0,0 +1,203 @@
+import numpy as np
+
+"""
+Error statistics of the dashboard, computed on the server from the rows of
+the forecast vs actual chart query in vectorized form: the rows are
+transposed once into NumPy columns, then every statistic is a handful of
+array operations instead of a Python loop per row.
+
+The chart rows only hold the predictions made ~11 hours ahead (10 to 12),
+so the per lead hour statistics are computed from the error sums of every
+lead hour instead (see lead_hour_error_sums in db/federation.py).
+"""
+
+# Number of bins of the prediction error histogram
+HISTOGRAM_BINS = 20
+# Lead hours reported, as hours_in_advance rounded to the nearest hour
+LEAD_HOURS = range(1, 13)
+
+# Position of the used fields in the chart query rows, see
+# convert_db_data_to_frontend_json
+FORECAST_FOR_HOUR = 1
+HOURS_IN_ADVANCE = 5
+PREDICTION_ERROR = 8
+
+
+def to_columns(forecast_tuples) -> dict:
+    """
+    Transposes the chart query rows into the NumPy columns the statistics
+    are computed from.
+
+    Args:
+        forecast_tuples: List of tuples of the chart query, see
+            convert_db_data_to_frontend_json
+
+    Returns:
+        {"forecast_for_hour": datetime64[s], "hours_in_advance": float64,
+        "prediction_error": float64} arrays
+    """
+    if not forecast_tuples:
+        columns = ((), (), ())
+    else:
+        columns = tuple(zip(*forecast_tuples))
+        columns = (columns[FORECAST_FOR_HOUR], columns[HOURS_IN_ADVANCE],
+                   columns[PREDICTION_ERROR])
+    return {
+        "forecast_for_hour": np.array(columns[0], dtype="datetime64[s]"),
+        "hours_in_advance": np.array(columns[1], dtype=np.float64),
+        "prediction_error": np.array(columns[2], dtype=np.float64),
+    }
+
+
+def nan_to_none(values) -> list:
+    """
+    Returns the array as a (nested) list with NaN replaced by None, as JSON
+    has no NaN.
+    """
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def error_histogram(errors, bins=HISTOGRAM_BINS) -> dict:
+    """
+    Returns the histogram of the prediction errors.
+
+    Args:
+        errors: float64 array of prediction errors
+        bins: number of equal-width bins
+
+    Returns:
+        {"edges": bins + 1 bin edges, "counts": bins counts}
+    """
+    if errors.size == 0:
+        return {"edges": [], "counts": []}
+    counts, edges = np.histogram(errors, bins=bins)
+    return {"edges": edges.tolist(), "counts": counts.tolist()}
+
+
+def error_heatmap(for_hours, errors) -> dict:
+    """
+    Returns the mean absolute error of each (date, hour of day) cell.
+
+    Args:
+        for_hours: datetime64 array of the forecast hours
+        errors: float64 array of prediction errors
+
+    Returns:
+        {"dates": the dates with data, "hours": 0 to 23,
+        "mean_absolute_error": dates x 24 cells, None without data,
+        "counts": dates x 24 number of predictions}
+    """
+    days = for_hours.astype("datetime64[D]")
+    hours = (for_hours - days).astype("timedelta64[h]").astype(np.int64)
+    dates, date_index = np.unique(days, return_inverse=True)
+
+    counts = np.zeros((dates.size, 24), dtype=np.int64)
+    sums = np.zeros((dates.size, 24), dtype=np.float64)
+    np.add.at(counts, (date_index, hours), 1)
+    np.add.at(sums, (date_index, hours), np.abs(errors))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_absolute_error = sums / counts
+
+    return {
+        "dates": dates.astype(str).tolist(),
+        "hours": list(range(24)),
+        "mean_absolute_error": nan_to_none(mean_absolute_error),
+        "counts": counts.tolist(),
+    }
+
+
+def lead_hour_errors(leads, errors) -> dict:
+    """
+    Returns the MAE, RMSE and bias (mean error) of the predictions of each
+    lead hour from 1 to 12. A lead hour without predictions in the rows has
+    a count of 0 and None statistics.
+
+    Args:
+        leads: float64 array of hours_in_advance
+        errors: float64 array of prediction errors
+
+    Returns:
+        {"lead_hours": 1 to 12, "counts", "mae", "rmse", "bias": 12 values}
+    """
+    lead_hours = np.rint(leads).astype(np.int64)
+    kept = (lead_hours >= LEAD_HOURS[0]) & (lead_hours <= LEAD_HOURS[-1])
+    lead_hours, errors = lead_hours[kept], errors[kept]
+
+    size = LEAD_HOURS[-1] + 1
+    counts = np.bincount(lead_hours, minlength=size)[LEAD_HOURS[0]:]
+    sums = np.bincount(lead_hours, errors, size)[LEAD_HOURS[0]:]
+    absolute_sums = np.bincount(
+        lead_hours, np.abs(errors), size)[LEAD_HOURS[0]:]
+    square_sums = np.bincount(lead_hours, errors ** 2, size)[LEAD_HOURS[0]:]
+    return lead_hour_statistics(counts, sums, absolute_sums, square_sums)
+
+
+def lead_hour_errors_from_sums(lead_hour_sums) -> dict:
+    """
+    Returns the statistics of lead_hour_errors from the error sums of each
+    lead hour, e.g. those of every prediction made over a date range, read
+    with lead_hour_error_sums.
+
+    Args:
+        lead_hour_sums: List of (lead hour, count, sum of errors, sum of
+            absolute errors, sum of squared errors) tuples
+
+    Returns:
+        {"lead_hours": 1 to 12, "counts", "mae", "rmse", "bias": 12 values}
+    """
+    columns = np.zeros((4, len(LEAD_HOURS)), dtype=np.float64)
+    for lead_hour, *values in lead_hour_sums:
+        if LEAD_HOURS[0] <= lead_hour <= LEAD_HOURS[-1]:
+            columns[:, lead_hour - LEAD_HOURS[0]] = values
+    counts, sums, absolute_sums, square_sums = columns
+    return lead_hour_statistics(counts.astype(np.int64), sums,
+                                absolute_sums, square_sums)
+
+
+def lead_hour_statistics(counts, sums, absolute_sums, square_sums) -> dict:
+    """
+    Returns the MAE, RMSE and bias of each lead hour from the count and the
+    sums of the errors, absolute errors and squared errors of each.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mae = absolute_sums / counts
+        rmse = np.sqrt(square_sums / counts)
+        bias = sums / counts
+
+    return {
+        "lead_hours": list(LEAD_HOURS),
+        "counts": counts.tolist(),
+        "mae": nan_to_none(mae),
+        "rmse": nan_to_none(rmse),
+        "bias": nan_to_none(bias),
+    }
+
+
+def error_statistics(forecast_tuples, bins=HISTOGRAM_BINS,
+                     lead_hour_sums=None) -> dict:
+    """
+    Returns the histogram, heatmap and per lead hour statistics of the
+    prediction errors of the chart query rows.
+
+    Args:
+        forecast_tuples: List of tuples of the chart query
+        bins: number of bins of the histogram
+        lead_hour_sums: Error sums of every lead hour, see
+            lead_hour_errors_from_sums; without them the per lead hour
+            statistics only cover the leads of the chart rows (10 to 12)
+
+    Returns:
+        JSON-serializable dictionary of the statistics
+    """
+    columns = to_columns(forecast_tuples)
+    errors = columns["prediction_error"]
+    if lead_hour_sums is None:
+        lead_hours = lead_hour_errors(columns["hours_in_advance"], errors)
+    else:
+        lead_hours = lead_hour_errors_from_sums(lead_hour_sums)
+    return {
+        "count": int(errors.size),
+        "histogram": error_histogram(errors, bins),
+        "heatmap": error_heatmap(columns["forecast_for_hour"], errors),
+        "lead_hours": lead_hours,
+    }
@@ -1,7 +1,13 @@
 from db.data_r import (
     get_value_single_where, get_value_double_where_with_between,
+    stream_value_double_where_with_between,
     get_predictions_vs_actual_with_error_by_location_id_with_date_range
     )
+from db.location_cache import location_directory
+from db.partition_router import forecast_for_hour_range
+from db.federation import (
+    is_federated, federated_chart_data, stream_federated_download,
+    lead_hour_error_sums)
 
 def location_validation(location_id):
     #TODO
@@ -16,22 +22,11 @@ def get_all_temperature_data_by_city(city):
         start_date (str): The start date of the data range.
         end_date (str): The end date of the data range.
     """
-    # Get location ID for the city
-    location_result = get_value_single_where(
-        "locations", "location_id", city, "location_name")
-    
-    # Check if location lookup failed
-    if location_result is False or not location_result:
+    # Get location ID for the city from the cached location directory
+    location_id = location_directory.get_id(city)
+    if location_id is None:
         print(f"Failed to get location_id for city: {city}")
-        print("Trying again...")
-        location_result = get_value_single_where(
-            "locations", "location_id", city, "location_name")
-        if location_result is False or not location_result:
-            print(f"Failed to get location_id for city: {city} again")
-            return []
-        print("Success!")
-        
-    location_id = location_result[0]
+        return []
     
     # Get the temperature data from the database
     temperature_data = get_value_single_where(
@@ -49,32 +44,66 @@ def get_date_range_temperature_data_by_city(city, start_date, end_date):
         start_date (str): The start date of the data range.
         end_date (str): The end date of the data range.
     """
-    # Get location ID for the city
-    location_result = get_value_single_where(
-        "locations", "location_id", city, "location_name")
-    
-    # Check if location lookup failed
-    if location_result is False or not location_result:
+    # Get location ID for the city from the cached location directory
+    location_id = location_directory.get_id(city)
+    if location_id is None:
         print(f"Failed to get location_id for city: {city}")
-        print("Trying again...")
-        location_result = get_value_single_where(
-            "locations", "location_id", city, "location_name")
-        if location_result is False or not location_result:
-            print(f"Failed to get location_id for city: {city} again")
-            return []
-        print("Success!")
-        
-    location_id = location_result[0]
+        return []
     
+    # Missing or invalid dates match no data
+    try:
+        partition_range = forecast_for_hour_range(start_date, end_date)
+    except ValueError as e:
+        print(f"Invalid date range {start_date} - {end_date}: {e}")
+        return []
+
     # Get the temperature data from the database
     temperature_data = get_value_double_where_with_between(
         "temperature_predictions", "*", location_id,
         "location_id", start_date, end_date,
-        "forecast_made_at"
+        "forecast_made_at",
+        partition_range=partition_range
         )
     return temperature_data if temperature_data else []
 
 
+def stream_date_range_temperature_data_by_city(city, start_date, end_date):
+    """
+    Streaming version of get_date_range_temperature_data_by_city.
+    Returns a generator of row batches, or None if the city is unknown or
+    the dates are missing or invalid.
+
+    Parameters:
+        city (str): The city for which the data is to be fetched.
+        start_date (str): The start date of the data range.
+        end_date (str): The end date of the data range.
+    """
+    # Get location ID for the city from the cached location directory
+    location_id = location_directory.get_id(city)
+    if location_id is None:
+        print(f"Failed to get location_id for city: {city}")
+        return None
+
+    # Missing or invalid dates match no data
+    try:
+        partition_range = forecast_for_hour_range(start_date, end_date)
+    except ValueError as e:
+        print(f"Invalid date range {start_date} - {end_date}: {e}")
+        return None
+
+    # History in the archived monthly databases is read from each of them
+    if is_federated(start_date, end_date):
+        return stream_federated_download(city, start_date, end_date)
+
+    # Batches of the temperature data, read from the database on demand
+    return stream_value_double_where_with_between(
+        "temperature_predictions", "*", location_id,
+        "location_id", start_date, end_date,
+        "forecast_made_at",
+        partition_range=partition_range
+        )
+
+
 def chart_data_by_city_and_date_range(city, start_date, end_date):
     """
     Returns the temperature data for the specified city and date range.
@@ -84,23 +113,16 @@ def chart_data_by_city_and_date_range(city, start_date, end_date):
         start_date (str): The start date of the data range.
         end_date (str): The end date of the data range.
     """
-    # Get location ID for the city
-    location_result = get_value_single_where(
-        "locations", "location_id", city, "location_name")
-    
-    # Check if location lookup failed
-    if location_result is False or not location_result:
+    # Get location ID for the city from the cached location directory
+    location_id = location_directory.get_id(city)
+    if location_id is None:
         print(f"Failed to get location_id for city: {city}")
-        print("Trying again...")
-        location_result = get_value_single_where(
-            "locations", "location_id", city, "location_name")
-        if location_result is False or not location_result:
-            print(f"Failed to get location_id for city: {city} again")
-            return []
-        print("Success!")
-        
-    location_id = location_result[0]
-    
+        return []
+
+    # History in the archived monthly databases is read from each of them
+    if is_federated(start_date, end_date):
+        return federated_chart_data(city, start_date, end_date)
+
     # Get the temperature data from the database
     temperature_data = (
         get_predictions_vs_actual_with_error_by_location_id_with_date_range(
@@ -109,3 +131,22 @@ def chart_data_by_city_and_date_range(city, start_date, end_date):
         )
     )
     return temperature_data if temperature_data else []
+
+
+def lead_hour_errors_by_city_and_date_range(city, start_date, end_date):
+    """
+    Returns the error sums of each lead hour (1 to 12) of the predictions
+    of the specified city and date range, see lead_hour_error_sums.
+
+    Parameters:
+        city (str): The city for which the data is to be fetched.
+        start_date (str): The start date of the data range.
+        end_date (str): The end date of the data range.
+    """
+    # Unknown cities have no predictions
+    if location_directory.get_id(city) is None:
+        print(f"Failed to get location_id for city: {city}")
+        return []
+
+    # Read from every database the range overlaps, the master one included
+    return lead_hour_error_sums(city, start_date, end_date)
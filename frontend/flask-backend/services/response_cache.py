@@ -0,0 +1,171 @@
+import os
+import shelve
+import threading
+import time
+from collections import OrderedDict
+from db.data_r import get_max_value_single_where
+
+# Maximum number of responses kept in memory
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "128"))
+# Optional file backing the memory cache, so responses survive restarts
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")
+# Seconds between two checks for a newly completed populate run
+RESPONSE_CACHE_CHECK_INTERVAL = float(
+    os.getenv("RESPONSE_CACHE_CHECK_INTERVAL", "60"))
+
+
+def latest_populate_id() -> any:
+    """
+    Returns the populate_id of the latest successful populate run, which
+    versions the cached responses. False if the query failed.
+    """
+    return get_max_value_single_where("populate_logs", "populate_id",
+                                      "Success", "status")
+
+
+class ResponseCache:
+    """
+    A thread-safe LRU cache of the chart responses, keyed by
+    (city, start date, end date), with an optional on-disk store behind it.
+
+    The data only changes when a populate run completes, so the cache is
+    versioned by the latest successful populate_id: it is checked at most
+    every check_interval seconds and a new run clears every entry.
+
+    Methods:
+        - get(key) -> returns the cached response or None.
+        - set(key, value) -> caches a response.
+        - invalidate(none) -> drops every cached response.
+        - stats(none) -> returns the hit/miss counters.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE,
+                 disk_path=RESPONSE_CACHE_PATH,
+                 check_interval=RESPONSE_CACHE_CHECK_INTERVAL,
+                 version_source=latest_populate_id) -> None:
+        """
+        Initializes the cache with its size bound, the optional file of the
+        on-disk store and how the data version is checked.
+        """
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.check_interval = check_interval
+        self.version_source = version_source
+
+        self.entries = OrderedDict()
+        self.version = None
+        self.checked_at = None
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0,
+                         "invalidations": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key) -> any:
+        """
+        Returns the cached response for the key, or None on a miss.
+
+        Parameters:
+            key (tuple): e.g. ("Najafgarh", "2025-02-01", "2025-03-01")
+        """
+        self._check_version()
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return self.entries[key]
+
+            value = self._disk_get(key)
+            if value is not None:
+                self.counters["disk_hits"] += 1
+                self._remember(key, value)
+                return value
+
+            self.counters["misses"] += 1
+            return None
+
+    def set(self, key, value) -> None:
+        """
+        Caches the response for the key, evicting the least recently used
+        entry beyond max_entries.
+
+        Parameters:
+            key (tuple): e.g. ("Najafgarh", "2025-02-01", "2025-03-01")
+            value (any): The response, e.g. the list of chart rows.
+        """
+        with self._lock:
+            self._remember(key, value)
+            self._disk_set(key, value)
+
+    def invalidate(self) -> None:
+        """
+        Drops every cached response, in memory and on disk.
+
+        Parameters:
+            none
+        """
+        with self._lock:
+            self.entries.clear()
+            self.counters["invalidations"] += 1
+            if self.disk_path:
+                with shelve.open(self.disk_path, flag="n"):
+                    pass
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters, the number of cached entries and the
+        data version they belong to.
+
+        Parameters:
+            none
+        """
+        with self._lock:
+            lookups = (self.counters["hits"] + self.counters["disk_hits"]
+                       + self.counters["misses"])
+            return {
+                **self.counters,
+                "hit_rate": (
+                    (lookups - self.counters["misses"]) / lookups
+                    if lookups else 0.0),
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "populate_id": self.version,
+            }
+
+    def _check_version(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if (self.checked_at is not None
+                    and now - self.checked_at < self.check_interval):
+                return
+            self.checked_at = now
+        version = self.version_source()
+        if version is False:
+            return  # keep serving the cache if the check failed
+        if version != self.version:
+            # On the first check the on-disk entries are kept, they carry
+            # the version they were cached for
+            if self.version is not None:
+                self.invalidate()
+            with self._lock:
+                self.version = version
+
+    def _remember(self, key, value) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _disk_get(self, key) -> any:
+        if not self.disk_path:
+            return None
+        with shelve.open(self.disk_path) as store:
+            version, value = store.get(repr(key), (None, None))
+        return value if version == self.version else None
+
+    def _disk_set(self, key, value) -> None:
+        if self.disk_path:
+            with shelve.open(self.disk_path) as store:
+                store[repr(key)] = (self.version, value)
+
+
+# Shared cache of the /home chart responses
+chart_cache = ResponseCache()
@@ -0,0 +1,10 @@
+from app import app, request_context
+from db.conn import slow_query_log
+
+
+def test_slow_queries_are_logged_with_their_request():
+    assert slow_query_log.context is request_context
+    with app.test_request_context("/home?format=columns"):
+        assert request_context() == "/home?format=columns"
+    # e.g. a query run at startup
+    assert request_context() is None
@@ -0,0 +1,49 @@
+import json
+import datetime
+from decimal import Decimal
+import pytest
+from services import data_formatter
+from services.data_formatter import (
+    CHART_COLUMNS, convert_db_data_to_frontend_columns, dumps_json)
+
+ROWS = [
+    (1, datetime.datetime(2025, 2, 26, 0), 16945, 16853,
+     datetime.datetime(2025, 2, 25, 14, 10, 10), Decimal("9.8303"),
+     17.1, 17.1, 0.0, 0.0),
+    (1, datetime.datetime(2025, 2, 26, 2), 16993, 16901,
+     datetime.datetime(2025, 2, 25, 16, 13, 4), Decimal("9.7821"),
+     15.9, 16.9, -1.0, 1.0),
+]
+
+
+def test_columns_transpose_the_rows():
+    payload = convert_db_data_to_frontend_columns(ROWS)
+    assert payload["columns"] == CHART_COLUMNS
+    assert payload["data"]["prediction_id"] == [16853, 16901]
+    assert payload["data"]["forecast_for_hour"] == [
+        "2025-02-26T00:00:00", "2025-02-26T02:00:00"]
+
+
+def test_columns_of_no_rows():
+    payload = convert_db_data_to_frontend_columns([])
+    assert payload["data"] == {column: [] for column in CHART_COLUMNS}
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dumps_json_encodes_decimals(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(data_formatter, "orjson", None)
+    elif data_formatter.orjson is None:
+        pytest.skip("orjson is not installed")
+    body = dumps_json(convert_db_data_to_frontend_columns(ROWS))
+    assert json.loads(body)["data"]["hours_in_advance"] == [9.8303, 9.7821]
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dumps_json_rejects_unknown_types(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(data_formatter, "orjson", None)
+    elif data_formatter.orjson is None:
+        pytest.skip("orjson is not installed")
+    with pytest.raises(TypeError):
+        dumps_json({"value": object()})
@@ -0,0 +1,102 @@
+import datetime
+import numpy as np
+import pytest
+from db import federation
+from services.error_stats import (
+    to_columns, error_histogram, error_heatmap, lead_hour_errors,
+    lead_hour_errors_from_sums, error_statistics)
+
+
+def chart_row(for_hour, hours_in_advance, error):
+    # A chart query row, see convert_db_data_to_frontend_json
+    return (1, for_hour, 10, 11, for_hour, hours_in_advance, 20.0 + error,
+            20.0, error, abs(error))
+
+
+ROWS = [
+    chart_row(datetime.datetime(2025, 2, 1, 3), 10.9, 1.0),
+    chart_row(datetime.datetime(2025, 2, 1, 3), 11.2, -3.0),
+    chart_row(datetime.datetime(2025, 2, 1, 4), 12.1, 2.0),
+    chart_row(datetime.datetime(2025, 2, 2, 3), 11.0, 4.0),
+]
+
+
+def test_to_columns():
+    columns = to_columns(ROWS)
+    assert columns["prediction_error"].tolist() == [1.0, -3.0, 2.0, 4.0]
+    assert columns["forecast_for_hour"].dtype == np.dtype("datetime64[s]")
+    assert to_columns([])["prediction_error"].size == 0
+
+
+def test_error_histogram():
+    histogram = error_histogram(np.array([-1.0, 0.0, 1.0, 1.0]), bins=2)
+    assert histogram == {"edges": [-1.0, 0.0, 1.0], "counts": [1, 3]}
+    assert error_histogram(np.array([])) == {"edges": [], "counts": []}
+
+
+def test_error_heatmap():
+    columns = to_columns(ROWS)
+    heatmap = error_heatmap(columns["forecast_for_hour"],
+                            columns["prediction_error"])
+    assert heatmap["dates"] == ["2025-02-01", "2025-02-02"]
+    assert heatmap["mean_absolute_error"][0][3] == 2.0
+    assert heatmap["mean_absolute_error"][0][4] == 2.0
+    assert heatmap["mean_absolute_error"][1][3] == 4.0
+    assert heatmap["mean_absolute_error"][0][0] is None
+    assert heatmap["counts"][0][3] == 2
+
+
+def test_lead_hour_errors_of_the_chart_rows():
+    columns = to_columns(ROWS)
+    stats = lead_hour_errors(columns["hours_in_advance"],
+                             columns["prediction_error"])
+    assert stats["lead_hours"] == list(range(1, 13))
+    assert stats["counts"] == [0] * 10 + [3, 1]
+    assert stats["mae"][10] == pytest.approx(8 / 3)
+    assert stats["bias"][10] == pytest.approx(2 / 3)
+    assert stats["rmse"][11] == pytest.approx(2.0)
+    assert stats["mae"][0] is None
+
+
+def test_lead_hour_errors_from_sums():
+    # Errors 1 and -3 one hour ahead, 2 twelve hours ahead
+    stats = lead_hour_errors_from_sums([(1, 2, -2.0, 4.0, 10.0),
+                                        (12, 1, 2.0, 2.0, 4.0),
+                                        (13, 5, 1.0, 1.0, 1.0)])
+    assert stats["counts"] == [2] + [0] * 10 + [1]
+    assert stats["mae"][0] == 2.0
+    assert stats["bias"][0] == -1.0
+    assert stats["rmse"][0] == pytest.approx(5 ** 0.5)
+    assert stats["mae"][1:11] == [None] * 10
+    assert stats["rmse"][11] == 2.0
+
+
+def test_error_statistics_with_every_lead_hour():
+    statistics = error_statistics(ROWS, bins=4,
+                                  lead_hour_sums=[(3, 1, 0.5, 0.5, 0.25)])
+    assert statistics["count"] == 4
+    assert sum(statistics["histogram"]["counts"]) == 4
+    assert statistics["lead_hours"]["counts"][2] == 1
+    assert statistics["lead_hours"]["counts"][10] == 0
+
+
+def test_lead_hour_error_sums_add_up_the_databases(monkeypatch):
+    monkeypatch.setattr(federation, "database_spans", federation.parse_spans(
+        "4:2025-02-01:2025-03-01,3:2025-03-01:"))
+    results = {4: [(1, 2, -2.0, 4.0, 10.0), (11, 1, 1.0, 1.0, 1.0)],
+               3: [(1, 1, 1.0, 1.0, 1.0)]}
+    queried = []
+
+    def fetch_all(DB, query, params):
+        queried.append((DB, params["start_date"], params["span_end"]))
+        return results[DB]
+
+    monkeypatch.setattr(federation, "fetch_all", fetch_all)
+    monkeypatch.setattr(federation, "database_urls",
+                        [None, None, None, "master", "february", None])
+    assert federation.lead_hour_error_sums(
+        "Dwarka", "2025-02-20", "2025-03-05") == [
+            (1, 3, -1.0, 5.0, 11.0), (11, 1, 1.0, 1.0, 1.0)]
+    assert sorted(queried) == [
+        (3, datetime.datetime(2025, 3, 1), datetime.datetime.max),
+        (4, datetime.datetime(2025, 2, 20), datetime.datetime(2025, 3, 1))]
@@ -0,0 +1,128 @@
+import datetime
+import psycopg2
+import pytest
+from flask import Flask
+from db import federation
+from db.partition_router import to_datetime
+from routes import views as views_module
+
+
+@pytest.fixture
+def spans(monkeypatch):
+    monkeypatch.setattr(federation, "database_spans", federation.parse_spans(
+        "4:2025-02-01:2025-03-01,5:2025-03-01:2025-04-01,3:2025-04-01:"))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = Flask(__name__)
+    app.register_blueprint(views_module.views, url_prefix="/")
+    return app.test_client()
+
+
+def test_to_datetime_reads_the_dashboard_dates():
+    # toISOString() of the React client
+    assert (to_datetime("2025-02-01T00:00:00.000Z")
+            == datetime.datetime(2025, 2, 1))
+    assert (to_datetime("2025-02-01T05:30:00+05:30")
+            == datetime.datetime(2025, 2, 1))
+    assert to_datetime("2025-02-01") == datetime.datetime(2025, 2, 1)
+    assert (to_datetime(datetime.date(2025, 2, 1))
+            == datetime.datetime(2025, 2, 1))
+
+
+@pytest.mark.parametrize("value", [None, "", "yesterday", "2025-13-01"])
+def test_to_datetime_rejects_invalid_dates(value):
+    with pytest.raises(ValueError):
+        to_datetime(value)
+
+
+def test_spans_for_range_clips_to_each_database(spans):
+    assert federation.spans_for_range("2025-02-15", "2025-04-10") == [
+        (4, datetime.datetime(2025, 2, 15), datetime.datetime(2025, 4, 10),
+         datetime.datetime(2025, 3, 1)),
+        (5, datetime.datetime(2025, 3, 1), datetime.datetime(2025, 4, 10),
+         datetime.datetime(2025, 4, 1)),
+        (3, datetime.datetime(2025, 4, 1), datetime.datetime(2025, 4, 10),
+         datetime.datetime.max),
+    ]
+
+
+def test_spans_for_range_with_iso_string_dates(spans):
+    spans = federation.spans_for_range("2025-03-10T00:00:00.000Z",
+                                       "2025-03-20T00:00:00.000Z")
+    assert [span[0] for span in spans] == [5]
+    assert federation.is_federated("2025-02-01T00:00:00.000Z",
+                                   "2025-03-01T00:00:00.000Z")
+    assert not federation.is_federated("2025-05-01T00:00:00.000Z",
+                                       "2025-05-02T00:00:00.000Z")
+
+
+def test_spans_for_range_outside_every_span(spans):
+    assert federation.spans_for_range("2024-01-01", "2024-02-01") == []
+
+
+@pytest.fixture
+def archives(monkeypatch, spans):
+    # February's database is down, March's answers, the master one too
+    queried = []
+
+    def fetch_all(DB, query, params):
+        queried.append(DB)
+        if DB == 4:
+            raise psycopg2.OperationalError("could not connect to server")
+        return [(DB, params["start_date"], 0.5)]
+
+    monkeypatch.setattr(federation, "fetch_all", fetch_all)
+    monkeypatch.setattr(federation, "database_urls",
+                        [None, None, None, "master", "february", "march"])
+    monkeypatch.setattr(federation.location_directory, "get_id",
+                        lambda city: 1)
+    monkeypatch.setattr(federation, "master_chart_query",
+                        lambda location_id, start, end: [(3, start, 0.5)])
+    return queried
+
+
+def test_chart_data_skips_an_unreachable_archive(archives):
+    rows = federation.federated_chart_data("Dwarka", "2025-02-15",
+                                           "2025-04-10")
+    assert [row[0] for row in rows] == [5, 3]
+    assert sorted(archives) == [4, 5]
+
+
+def test_chart_data_skips_an_archive_without_url(archives, monkeypatch):
+    monkeypatch.setattr(federation, "database_urls",
+                        [None, None, None, "master", "february", None])
+    rows = federation.federated_chart_data("Dwarka", "2025-03-15",
+                                           "2025-04-10")
+    assert [row[0] for row in rows] == [3]
+    # March's database is not even connected to
+    assert archives == []
+
+
+def test_home_with_iso_string_dates(client, monkeypatch):
+    ranges = []
+
+    def chart_data(city, start_date, end_date):
+        ranges.append((start_date, end_date))
+        return []
+
+    monkeypatch.setattr(views_module, "chart_data_by_city_and_date_range",
+                        chart_data)
+    response = client.post("/home", json={
+        "city": "Dwarka", "start_date": "2025-02-01T00:00:00.000Z",
+        "end_date": "2025-03-01T00:00:00.000Z"})
+    assert response.status_code == 200
+    assert response.get_json() == []
+    assert ranges == [("2025-02-01T00:00:00.000Z",
+                       "2025-03-01T00:00:00.000Z")]
+
+
+@pytest.mark.parametrize("path", ["/home", "/home/stats",
+                                  "/home?format=columns"])
+def test_home_with_invalid_dates(client, path):
+    response = client.post(path, json={
+        "city": "Dwarka", "start_date": "not a date",
+        "end_date": None})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
@@ -0,0 +1,26 @@
+from db import index_advisor
+
+
+def test_every_query_of_a_helper_is_reported(monkeypatch):
+    plans = {
+        "SELECT 1;": {"indexes": ["idx_forecast"], "seq_scans": []},
+        "SELECT 2;": {"indexes": [],
+                      "seq_scans": ["temperature_predictions_y2025m02"]},
+        "SELECT 3;": {"indexes": [], "seq_scans": ["locations"]},
+    }
+    monkeypatch.setattr(index_advisor.data_r, "get_value_single_where",
+                        lambda *args: (1,))
+    monkeypatch.setattr(index_advisor, "data_r_calls", lambda *args: {
+        "two_queries": ["SELECT 1;", "SELECT 2;"],
+        "one_query": ["SELECT 3;"]})
+    monkeypatch.setattr(index_advisor, "capture_queries", lambda queries: [
+        (query, None) for query in queries])
+    monkeypatch.setattr(index_advisor, "explain",
+                        lambda query, params: dict(plans[query]))
+
+    reports = index_advisor.check_indexes(end_date="2025-03-01")
+    assert [(report["query"], report["ok"])
+            for report in reports["two_queries"]] == [
+                ("SELECT 1;", True), ("SELECT 2;", False)]
+    # A small table may be scanned
+    assert [report["ok"] for report in reports["one_query"]] == [True]
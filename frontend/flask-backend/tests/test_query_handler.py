@@ -0,0 +1,36 @@
+import pytest
+from flask import Flask
+from services import query_handler
+from routes import views as views_module
+
+
+@pytest.fixture
+def known_city(monkeypatch):
+    monkeypatch.setattr(query_handler.location_directory, "get_id",
+                        lambda city: 1)
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(views_module.views, url_prefix="/")
+    return app.test_client()
+
+
+@pytest.mark.parametrize("start_date, end_date", [
+    (None, None), ("2025-02-01", None), ("yesterday", "2025-03-01")])
+def test_stream_with_invalid_dates(known_city, start_date, end_date):
+    assert query_handler.stream_date_range_temperature_data_by_city(
+        "Dwarka", start_date, end_date) is None
+    assert query_handler.get_date_range_temperature_data_by_city(
+        "Dwarka", start_date, end_date) == []
+
+
+@pytest.mark.parametrize("query", [
+    "/download?city=Dwarka",
+    "/download?city=Dwarka&start_date=yesterday&end_date=today"])
+def test_download_with_invalid_dates(known_city, client, query):
+    response = client.get(query)
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == (
+        "No data found in the database.")
@@ -0,0 +1,121 @@
+import pytest
+from services.response_cache import ResponseCache
+
+
+class FakeVersion:
+    """
+    Stands for latest_populate_id: returns populate_id, counting the calls.
+    """
+
+    def __init__(self, populate_id=1) -> None:
+        self.populate_id = populate_id
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.populate_id
+
+
+def key(day) -> tuple:
+    return ("Dwarka", f"2025-02-{day:02d}", "2025-03-01")
+
+
+@pytest.fixture
+def version():
+    return FakeVersion()
+
+
+def test_least_recently_used_entries_are_evicted(version):
+    cache = ResponseCache(max_entries=2, disk_path=None,
+                          check_interval=0, version_source=version)
+    cache.set(key(1), [1])
+    cache.set(key(2), [2])
+    assert cache.get(key(1)) == [1]
+    cache.set(key(3), [3])
+
+    # Entry 2 was the least recently used one
+    assert cache.get(key(2)) is None
+    assert cache.get(key(1)) == [1]
+    assert cache.get(key(3)) == [3]
+    assert cache.stats()["entries"] == 2
+
+
+def test_hits_and_misses_are_counted(version):
+    cache = ResponseCache(disk_path=None, check_interval=0,
+                          version_source=version)
+    assert cache.get(key(1)) is None
+    cache.set(key(1), [1])
+    cache.get(key(1))
+    cache.get(key(1))
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+    assert stats["populate_id"] == 1
+
+
+def test_a_new_populate_run_invalidates_the_cache(version):
+    cache = ResponseCache(disk_path=None, check_interval=0,
+                          version_source=version)
+    cache.get(key(1))
+    cache.set(key(1), [1])
+    assert cache.get(key(1)) == [1]
+
+    version.populate_id = 2
+    assert cache.get(key(1)) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["populate_id"] == 2
+
+
+def test_a_failed_version_check_keeps_the_cache(version):
+    cache = ResponseCache(disk_path=None, check_interval=0,
+                          version_source=version)
+    cache.get(key(1))
+    cache.set(key(1), [1])
+
+    version.populate_id = False
+    assert cache.get(key(1)) == [1]
+    assert cache.stats()["invalidations"] == 0
+
+
+def test_the_version_is_checked_once_per_interval(version):
+    cache = ResponseCache(disk_path=None, check_interval=60,
+                          version_source=version)
+    for _ in range(3):
+        cache.get(key(1))
+    assert version.calls == 1
+
+
+def test_responses_survive_a_restart_on_disk(version, tmp_path):
+    path = str(tmp_path / "responses")
+    cache = ResponseCache(disk_path=path, check_interval=0,
+                          version_source=version)
+    cache.get(key(1))
+    cache.set(key(1), [1])
+
+    # A new process, same data version
+    restarted = ResponseCache(disk_path=path, check_interval=0,
+                              version_source=version)
+    assert restarted.get(key(1)) == [1]
+    assert restarted.stats()["disk_hits"] == 1
+    # Now kept in memory
+    assert restarted.get(key(1)) == [1]
+    assert restarted.stats()["hits"] == 1
+
+    # The on-disk entries of an older version are not served
+    version.populate_id = 2
+    outdated = ResponseCache(disk_path=path, check_interval=0,
+                             version_source=version)
+    assert outdated.get(key(1)) is None
+
+
+def test_invalidate_clears_the_disk_too(version, tmp_path):
+    path = str(tmp_path / "responses")
+    cache = ResponseCache(disk_path=path, check_interval=0,
+                          version_source=version)
+    cache.get(key(1))
+    cache.set(key(1), [1])
+    cache.invalidate()
+
+    assert cache.get(key(1)) is None
+    assert cache.stats()["disk_hits"] == 0
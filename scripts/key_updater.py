@@ -4,6 +4,8 @@ from api.key_processor import (load_location_keys, store_location_keys,
 
 def update_keys(locations) -> None:
     """Updates the location keys for the given locations.
+    Raises LocationKeyError (see api/key_processor.py) if a key cannot be
+    fetched, in which case the stored keys are left untouched.
 
     Parameters:
         locations (list): A list of location names.
@@ -17,6 +19,7 @@ def update_keys(locations) -> None:
     print("Location keys updated.")
 
 
-# Load the location keys from the binary file and print them
-loaded_keys = load_location_keys()
-print("Already existing keys: ", loaded_keys)
+if __name__ == "__main__":
+    # Load the location keys from the binary file and print them
+    loaded_keys = load_location_keys()
+    print("Already existing keys: ", loaded_keys)
@@ -0,0 +1,274 @@
+import io
+import os
+import argparse
+import numpy as np
+from numpy.lib import format as npy_format
+from numpy.lib.stride_tricks import sliding_window_view
+from db.data_crud import cpool
+
+"""
+Export of the forecasts as (issue time x lead hour) matrices for the ML
+pipeline (TempCastRNN), written per location to a .npy file that can be
+memory-mapped.
+
+Each file holds one record per issue time (forecast_made_at truncated to
+the hour, every hour from the first run on): the issue time in epoch
+seconds and the 12 temperatures forecast by that run, lead hour 1 first.
+Hours without a run are NaN rows, so that 12 consecutive records are 12
+consecutive hours and forecast_matrices() can return the 12x12 matrices
+as views of the file, without copying.
+
+The export is incremental: a new run only reads the forecasts made after
+the last issue time of each location's file and appends them; a location
+without a file yet is exported from its first forecast.
+    python -m scripts.matrix_export --out exports/matrices
+"""
+
+# Default folder of the exported files
+EXPORT_DIR = os.getenv("MATRIX_EXPORT_DIR", "exports/matrices")
+LEAD_HOURS = 12
+HOUR = 3600
+# Rows fetched per round-trip from the server-side cursor
+FETCH_BATCH_SIZE = 10000
+
+RECORD_DTYPE = np.dtype([("issue_time", "<i8"),
+                         ("temperatures", "<f4", (LEAD_HOURS,))])
+
+# The forecasts of each run, ranked by forecast hour: the lead hour is the
+# rank, as forecast_for_hour and forecast_made_at may be in different
+# time zones. Only the forecasts made since the watermark of their location
+# are read, all of them for a location without one
+EXPORT_QUERY = """SELECT location_id, issue_time, lead_hour, temperature
+FROM (
+    SELECT
+        location_id,
+        EXTRACT(EPOCH FROM date_trunc('hour', forecast_made_at))::BIGINT
+        AS issue_time,
+        forecast_made_at,
+        ROW_NUMBER() OVER (
+            PARTITION BY location_id, forecast_made_at
+            ORDER BY forecast_for_hour) AS lead_hour,
+        temperature
+    FROM temperature_predictions
+    LEFT JOIN (
+        SELECT UNNEST(%s::int[]) AS location_id,
+               UNNEST(%s::bigint[]) AS since
+    ) watermarks USING (location_id)
+    WHERE forecast_made_at >=
+        to_timestamp(COALESCE(watermarks.since, 0)) AT TIME ZONE 'UTC'
+) ranked
+WHERE lead_hour <= %s
+ORDER BY location_id, forecast_made_at, lead_hour;"""
+
+
+def matrix_path(location_id, out_dir=EXPORT_DIR) -> str:
+    """
+    Returns the path of the file of a location.
+    e.g. exports/matrices/location_1.npy
+    """
+    return os.path.join(out_dir, f"location_{location_id}.npy")
+
+
+def load_forecasts(location_id, out_dir=EXPORT_DIR) -> np.ndarray:
+    """
+    Returns the records of a location, memory-mapped read-only, or None if
+    the location has not been exported.
+
+    Parameters:
+        location_id (int): The location id.
+        out_dir (str): The folder of the exported files.
+    """
+    path = matrix_path(location_id, out_dir)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+def forecast_matrices(location_id, out_dir=EXPORT_DIR) -> tuple:
+    """
+    Returns the 12x12 matrices of a location, one per window of 12
+    consecutive issue hours, as a read-only view of shape
+    (windows, 12 issue hours, 12 lead hours), along with the issue time of
+    the first row of each matrix.
+
+    Parameters:
+        location_id (int): The location id.
+        out_dir (str): The folder of the exported files.
+    """
+    records = load_forecasts(location_id, out_dir)
+    if records is None or len(records) < LEAD_HOURS:
+        return (np.empty((0, LEAD_HOURS, LEAD_HOURS), dtype=np.float32),
+                np.empty(0, dtype=np.int64))
+    windows = sliding_window_view(records["temperatures"], LEAD_HOURS,
+                                  axis=0)
+    # (windows, lead hours, issue hours) -> (windows, issue, lead)
+    return (windows.swapaxes(1, 2),
+            records["issue_time"][:len(records) - LEAD_HOURS + 1])
+
+
+def build_records(issue_times, lead_hours, temperatures,
+                  first_issue_time=None) -> np.ndarray:
+    """
+    Returns the records of one location, one per hour from first_issue_time
+    (or the first issue time of the rows) to the last one.
+
+    Parameters:
+        issue_times (np.ndarray): Issue time of each row, epoch seconds.
+        lead_hours (np.ndarray): Lead hour of each row, 1 to 12.
+        temperatures (np.ndarray): Temperature of each row.
+        first_issue_time (int): Issue time of the first record.
+    """
+    if first_issue_time is None:
+        first_issue_time = int(issue_times.min())
+    index = (issue_times - first_issue_time) // HOUR
+    records = np.zeros(int(index.max()) + 1, dtype=RECORD_DTYPE)
+    records["issue_time"] = first_issue_time + HOUR * np.arange(len(records))
+    records["temperatures"] = np.nan
+    # A later run in the same hour overwrites the earlier one
+    records["temperatures"][index, lead_hours - 1] = temperatures
+    return records
+
+
+def append_records(path, records) -> None:
+    """
+    Appends records to a .npy file of records, created if missing.
+    Only the header is rewritten, unless it outgrew its padding.
+
+    Parameters:
+        path (str): The .npy file.
+        records (np.ndarray): The records to be appended.
+    """
+    if not os.path.exists(path):
+        np.save(path, records)
+        return
+
+    with open(path, "r+b") as f:
+        version = npy_format.read_magic(f)
+        read_header = (npy_format.read_array_header_1_0 if version == (1, 0)
+                       else npy_format.read_array_header_2_0)
+        shape, fortran_order, dtype = read_header(f)
+        header_length = f.tell()
+
+        header = io.BytesIO()
+        write_header = (npy_format.write_array_header_1_0
+                        if version == (1, 0)
+                        else npy_format.write_array_header_2_0)
+        write_header(header, {"descr": npy_format.dtype_to_descr(dtype),
+                              "fortran_order": fortran_order,
+                              "shape": (shape[0] + len(records),)})
+        if len(header.getvalue()) == header_length:
+            f.seek(0, os.SEEK_END)
+            f.write(records.astype(dtype).tobytes())
+            # The new length goes in last, once the records are written
+            f.seek(0)
+            f.write(header.getvalue())
+            return
+
+    # The header no longer fits: write the whole file again
+    existing = np.fromfile(path, dtype=dtype, offset=header_length,
+                           count=shape[0])
+    np.save(path, np.concatenate([existing, records.astype(dtype)]))
+
+
+def last_issue_times(out_dir=EXPORT_DIR) -> dict:
+    """
+    Returns {location_id: last exported issue time} of the exported files.
+    """
+    last = {}
+    for name in os.listdir(out_dir):
+        if name.startswith("location_") and name.endswith(".npy"):
+            records = np.load(os.path.join(out_dir, name), mmap_mode="r")
+            if len(records):
+                last[int(name[len("location_"):-len(".npy")])] = int(
+                    records["issue_time"][-1])
+    return last
+
+
+def fetch_forecasts(watermarks) -> dict:
+    """
+    Returns {location_id: (issue times, lead hours, temperatures)} arrays
+    of the forecasts made since the watermark of each location (all of
+    them for the locations without one), read through a server-side cursor.
+
+    Parameters:
+        watermarks (dict): {location_id: epoch time of the first
+        forecast_made_at to read}.
+        e.g. {1: 1738400400, 2: 1738404000}
+    """
+    chunks = []
+    # Get a connection and cursor object
+    conn, cur = cpool.get_connection()
+    named_cur = conn.cursor(name=f"matrix_export_{id(conn)}")
+    try:
+        # Named cursors run a DECLARE, which cannot wrap a prepared statement
+        cpool.execute(named_cur, EXPORT_QUERY,
+                      (list(watermarks), list(watermarks.values()),
+                       LEAD_HOURS), prepare=False)
+        while True:
+            rows = named_cur.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+    finally:
+        # close the cursors and end the read transaction
+        named_cur.close()
+        conn.rollback()
+        cpool.close_connection(conn, cur)
+
+    if not chunks:
+        return {}
+    rows = np.concatenate(chunks)
+    location_ids = rows[:, 0].astype(np.int64)
+    # The rows are ordered by location: split them where the id changes
+    starts = np.flatnonzero(np.diff(location_ids)) + 1
+    forecasts = {}
+    for location_rows in np.split(rows, starts):
+        forecasts[int(location_rows[0, 0])] = (
+            location_rows[:, 1].astype(np.int64),
+            location_rows[:, 2].astype(np.int64),
+            location_rows[:, 3].astype(np.float32))
+    return forecasts
+
+
+def export_matrices(out_dir=EXPORT_DIR) -> dict:
+    """
+    Appends the forecasts made since the last export to the file of each
+    location and returns {location_id: number of records appended}.
+
+    Parameters:
+        out_dir (str): The folder of the exported files.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    last = last_issue_times(out_dir)
+    # The hour after the last issue time of each location; everything for
+    # the locations not exported yet
+    watermarks = {location_id: last_issue_time + HOUR
+                  for location_id, last_issue_time in last.items()}
+
+    appended = {}
+    for location_id, (issue_times, lead_hours, temperatures) in (
+            fetch_forecasts(watermarks).items()):
+        first_issue_time = None
+        if location_id in last:
+            new = issue_times > last[location_id]
+            if not new.any():
+                continue
+            issue_times = issue_times[new]
+            lead_hours = lead_hours[new]
+            temperatures = temperatures[new]
+            first_issue_time = last[location_id] + HOUR
+        records = build_records(issue_times, lead_hours, temperatures,
+                                first_issue_time)
+        append_records(matrix_path(location_id, out_dir), records)
+        appended[location_id] = len(records)
+    return appended
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=EXPORT_DIR)
+    args = parser.parse_args()
+
+    appended = export_matrices(args.out)
+    print(f"{sum(appended.values())} issue hours appended for "
+          f"{len(appended)} locations.")
@@ -1,44 +1,79 @@
-from api.data_fetcher import _12_hour_temperature_forecast
+import os
+from contextlib import nullcontext
+from api.data_fetcher import _12_hour_temperature_forecast_stream
 from utils.transformation import (
     _12_hour_forecast_data_db_format_transformation)
-from db.data_crud import row_existence_check, insert_data
 from api.key_processor import load_location_keys
-from utils.logging import log_db_transaction
+from api.request_scheduler import scheduler
+from utils.logging import log_db_transaction, LogBuffer
+from utils.run_profile import RunProfile, stage
+from utils.pipeline import BatchWriter
+from db.location_cache import location_directory
+from db.partitions import ensure_partitions
+from db.local_archive import forecast_archive, ArchiveSpool
+from db.populate_run import PopulateRun
 
+# Skip the forecasts already inserted by a previous run of the same hour
+# (re-run or retried job), see db/compaction.py
+IDEMPOTENT_INGEST = os.getenv("IDEMPOTENT_INGEST", "true").lower() == "true"
+
+# Column names of the rows copied into "temperature_predictions"
+PREDICTION_COLUMNS = """(location_id, forecast_made_at, forecast_for_hour,
+                     temperature)"""
 
-def populate(DB=0):
 
-    # Start Populate transaction
-    data = (("""(status, error_message)""", ("Pending", "")))
-    insert_data("populate_logs", data)
+def populate(DB=0):
     """
     If the process is completed without any errors
-    the function returns True, otherwise False.
+    the function returns True, otherwise it raises the error.
+
+    The whole run is a single transaction (see db/populate_run.py): its
+    populate log, new locations, predictions and logs are committed along
+    with the Success status, or rolled back and the run logged as Failed.
 
-    Status and error messages are updated outside the function.
+    The run is a pipeline: each location's forecast is transformed as soon
+    as its response arrives and handed to a batched writer thread (see
+    utils/pipeline.py), so the API waits overlap the database writes, and
+    the bounded queues keep the memory flat however many locations there
+    are.
     """
 
-    # Fetch the forecast data from the API
-    # default location argument i.e bin file location keys
-    json_data = _12_hour_temperature_forecast()
-
-    # Load the location keys from the binary file
-    # for syncing the location list with the database
-    location_keys = load_location_keys()
-
-    # location list syncing with the database
-    for location in json_data:
-        if not row_existence_check("locations", "location_name", location):
-            print(f"{location} does not exist in the database.")
-            print("Adding the location into the database...")
-            # If the location does not exist in the "location" table,
-            # add the location to the database
-            data = (("(location_name, unique_key)"),
-                    (location, location_keys[location]))
-            if insert_data("locations", data):
-                print("Data inserted successfully.")
+    # The monthly partitions the rows go to, and the next ones, must exist
+    # before the COPY (otherwise rows land in the default one). They are
+    # created and committed before the run starts, on a connection of their
+    # own: the run's transaction would otherwise hold the lock on
+    # temperature_predictions taken by CREATE TABLE ... PARTITION OF until
+    # it ends, and the run holds a single connection throughout.
+    for partition in ensure_partitions():
+        print(f"Partition {partition} created.")
+
+    # If the local archive is enabled, the rows are spooled to a temporary
+    # file as they are written, and archived once the run is committed; the
+    # spool is deleted however populate ends
+    spool = ArchiveSpool() if forecast_archive.path else None
+    with spool or nullcontext():
+        # Start Populate transaction, and buffer the API and db transaction
+        # logs of the run; they are written in bulk in the run's transaction
+        # along with the timing of each stage of the run
+        with PopulateRun() as run, RunProfile(run), LogBuffer(run.populate_id,
+                                                              run=run):
+            with stage("location_sync"):
+                # Load the location keys from the binary file
+                location_keys = load_location_keys()
+
+                # location list syncing with the database, in a single
+                # statement, before any forecast comes in: the missing
+                # locations are inserted and the name -> id mapping of every
+                # location is returned for the transformation step
+                synced = run.sync_locations(location_keys)
+            if synced is False:
+                location_ids = None
+                added = []
+                print("Error syncing the locations.")
             else:
-                print("Error inserting data.")
+                location_ids, added = synced
+                for location in added:
+                    print(f"{location} added into the database.")
 
             """
             Location db transactions are not logged for less complexity
@@ -50,34 +85,110 @@ def populate(DB=0):
             To avoid this, only the temperature_predictions table is logged.
             """
 
-    # Transform the forecast data into a db-friendly format
-    db_format_data = _12_hour_forecast_data_db_format_transformation(json_data)
-
-    # Dump the forecast data into the "temperature_predictions" table
-    for location in db_format_data:
-        # Feedback print
-        print(f"Inserting data for {location}...")
-
-        # Query tuple for inserting data into the database
-        # The first element is the column names
-        data = (("""(location_id, forecast_made_at, forecast_for_hour,
-                 temperature)"""),)
-        # Append the data to the query tuple
-        for i in db_format_data[location]:
-            data += (i[0:4],)  # 0:4 are the required elements
-
-        # Insert the data into the database
-        if insert_data("temperature_predictions", data):
-            # Log Status
-            status = "Success"
-            error_message = ""
-            print("Data inserted successfully.")
-        else:
-            status = "Failed"
-            error_message = "Error inserting data."
-            print("Error inserting data.")
-
-        # Log the transaction
-        log_db_transaction("insert", status, error_message)
+            # Rows handed to the writer and the range of forecast hours they
+            # cover
+            row_count = 0
+            location_count = 0
+            first_hour = last_hour = None
+
+            def write(batch):
+                # Each batch of rows is copied into the
+                # "temperature_predictions" table in the run's transaction,
+                # from the writer thread; the rows inserted are read back for
+                # the archive (the duplicates skipped are already in it, or
+                # were never committed)
+                archiving = spool is not None and not spool.file.closed
+                inserted_rows = run.copy_predictions(
+                    (PREDICTION_COLUMNS, *batch), IDEMPOTENT_INGEST,
+                    returning=archiving)
+                if archiving:
+                    try:
+                        spool.add(inserted_rows)
+                    except Exception as e:
+                        # The run goes on, without its local copy
+                        print(f"Error spooling the rows locally: {e}")
+                        spool.close()
+
+            # The transformation step of each location's forecast
+            transform = _12_hour_forecast_data_db_format_transformation
+            writer = BatchWriter(write)
+            try:
+                with writer:
+                    # Fetch the forecast data from the API, locations in
+                    # parallel, as the responses arrive; default location
+                    # argument i.e bin file location keys
+                    forecasts = _12_hour_temperature_forecast_stream(
+                        location_keys)
+                    while True:
+                        with stage("fetch"):
+                            forecast = next(forecasts, None)
+                        if forecast is None:
+                            break
+                        location, forecast_data = forecast
+
+                        with stage("transform"):
+                            # Transform the forecast data into a db-friendly
+                            # format, 0:4 are the required elements
+                            db_format_data = transform(
+                                {location: forecast_data}, location_ids,
+                                location_keys)
+                            rows = [i[0:4] for i in db_format_data[location]]
+
+                        hours = [i[2] for i in rows]
+                        if first_hour is not None:
+                            hours += [first_hour, last_hour]
+                        if hours:
+                            first_hour, last_hour = min(hours), max(hours)
+                        row_count += len(rows)
+                        location_count += 1
+
+                        # Blocks while the writer is behind (backpressure)
+                        with stage("write_wait"):
+                            writer.put(rows)
+            except Exception as e:
+                if writer.error is not None:
+                    print("Error inserting data.")
+                    # Logged along with the Failed status of the run, without
+                    # a prediction id as none of the run's rows are kept
+                    log_db_transaction("copy", "Failed", str(writer.error),
+                                       prediction_id=None)
+                raise
+            inserted = run.inserted
+            prediction_id = run.last_prediction_id()
+
+            # Feedback print of the API pacing (throttle waits, retries, quota)
+            print("API request metrics:", scheduler.metrics())
+            print(f"Inserted {row_count} rows for {location_count} locations "
+                  f"in {writer.batches} batches.")
+            if inserted < row_count:
+                print(f"{row_count - inserted} duplicate rows skipped.")
+
+            # Log the transaction, one per run as the rows go in together,
+            # with the run's last prediction id (NULL if it inserted none)
+            log_db_transaction("copy", "Success", "", prediction_id)
+
+            # Recompute the forecast errors of the hours touched by the run
+            # only
+            if row_count:
+                with stage("forecast_errors"):
+                    refreshed = run.refresh_forecast_errors(first_hour,
+                                                            last_hour)
+                if refreshed:
+                    print("Forecast errors refreshed.")
+                else:
+                    print("Error refreshing forecast errors.")
+
+        # The run is committed
+        if added:
+            # The cached location ids miss the new locations
+            location_directory.invalidate()
+
+        # Keep a local copy of the rows inserted for offline analysis, if
+        # enabled
+        if spool is not None and not spool.file.closed:
+            try:
+                forecast_archive.append_spool(spool)
+            except Exception as e:
+                print(f"Error archiving the rows locally: {e}")
 
     return True
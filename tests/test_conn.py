@@ -0,0 +1,331 @@
+import types
+import psycopg2
+import pytest
+from psycopg2 import errors, extensions, pool
+import db.conn as conn_module
+from db.conn import (ConnectionPool, HealthCheckedPool, SlowQueryLog,
+                     TracedCursor, prepared_statement)
+
+
+class FakeConnection:
+    """
+    Stands in for a psycopg2 connection, in the given transaction status;
+    its rollback fails when broken is set.
+    """
+
+    def __init__(self, status=extensions.TRANSACTION_STATUS_IDLE,
+                 broken=False) -> None:
+        self.closed = 0
+        self.broken = broken
+        self.rollbacks = 0
+        self.info = types.SimpleNamespace(transaction_status=status)
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    # The connections opened by the pools, instead of the database
+    opened = []
+
+    def connect(*args, **kwargs):
+        opened.append(FakeConnection())
+        return opened[-1]
+    monkeypatch.setattr(conn_module.psycopg2, "connect", connect)
+    return opened
+
+
+def test_a_returned_connection_is_reused(connections):
+    health_pool = HealthCheckedPool(1, 2, "dsn")
+    conn = health_pool.getconn()
+    health_pool.putconn(conn)
+
+    assert health_pool.getconn() is conn
+    assert len(connections) == 1
+    assert health_pool.stats()["in_use"] == 1
+
+
+def test_an_open_transaction_is_rolled_back_on_return(connections):
+    health_pool = HealthCheckedPool(1, 2, "dsn")
+    conn = health_pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    health_pool.putconn(conn)
+
+    assert conn.rollbacks == 1
+    assert health_pool.stats()["idle"] == 1
+
+
+def test_a_failed_rollback_closes_the_connection_and_frees_the_slot(
+        connections):
+    health_pool = HealthCheckedPool(0, 1, "dsn", timeout=0.1)
+    conn = health_pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INERROR
+    conn.broken = True
+    health_pool.putconn(conn)
+
+    assert conn.closed
+    stats = health_pool.stats()
+    assert (stats["in_use"], stats["idle"]) == (0, 0)
+    # The slot is free again: a new connection is opened
+    assert health_pool.getconn() is not conn
+    assert len(connections) == 2
+
+
+def test_checkout_times_out_when_every_connection_is_in_use(connections):
+    health_pool = HealthCheckedPool(0, 1, "dsn", timeout=0.05)
+    health_pool.getconn()
+
+    with pytest.raises(pool.PoolError):
+        health_pool.getconn()
+    assert health_pool.stats()["timeouts"] == 1
+
+
+def test_expired_and_closed_connections_are_replaced(connections):
+    health_pool = HealthCheckedPool(0, 2, "dsn", max_lifetime=0)
+    conn = health_pool.getconn()
+    health_pool.putconn(conn)
+    assert health_pool.getconn() is not conn
+    assert health_pool.stats()["expired"] == 1
+
+    health_pool = HealthCheckedPool(0, 2, "dsn")
+    conn = health_pool.getconn()
+    health_pool.putconn(conn)
+    conn.closed = 1
+    assert health_pool.getconn() is not conn
+
+
+class FakeCursor:
+    """
+    Records the statements run on a FakeConnection; the next EXECUTE
+    raises the error set in fail_with, if any.
+    """
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self.statements = []
+        self.fail_with = None
+
+    def execute(self, query, params=None):
+        self.statements.append((query, params))
+        if query.startswith("EXECUTE") and self.fail_with is not None:
+            error, self.fail_with = self.fail_with, None
+            raise error
+
+
+def test_prepared_statement_numbers_the_placeholders():
+    name, body, order = prepared_statement(
+        "SELECT * FROM t WHERE a = %s AND b = %s AND c LIKE '1%%';")
+
+    assert body == "SELECT * FROM t WHERE a = $1 AND b = $2 AND c LIKE '1%'"
+    assert order == 2
+    assert name.startswith("stmt_") and len(name) == len("stmt_") + 16
+
+
+def test_prepared_statement_reuses_the_number_of_a_named_parameter():
+    _, body, order = prepared_statement(
+        "SELECT %(city)s, %(day)s WHERE %(city)s IS NOT NULL;")
+
+    assert body == "SELECT $1, $2 WHERE $1 IS NOT NULL"
+    assert order == ["city", "day"]
+
+
+def test_prepared_statement_is_named_after_the_query():
+    query = "SELECT * FROM t WHERE a = %s;"
+    assert prepared_statement(query)[0] == prepared_statement(query)[0]
+    assert (prepared_statement(query)[0]
+            != prepared_statement("SELECT * FROM t WHERE b = %s;")[0])
+
+
+def test_execute_prepares_once_per_connection(monkeypatch):
+    monkeypatch.setattr(conn_module, "USE_PREPARED_STATEMENTS", True)
+    cpool = ConnectionPool()
+    query = "SELECT * FROM t WHERE a = %(a)s AND b = %(b)s;"
+    name = prepared_statement(query)[0]
+
+    cur = FakeCursor(FakeConnection())
+    cpool.execute(cur, query, {"b": 2, "a": 1})
+    cpool.execute(cur, query, {"b": 4, "a": 3})
+    assert cur.statements == [
+        (f"PREPARE {name} AS SELECT * FROM t WHERE a = $1 AND b = $2;",
+         None),
+        (f"EXECUTE {name} (%s, %s);", [1, 2]),
+        (f"EXECUTE {name} (%s, %s);", [3, 4])]
+
+    # Another connection prepares it again
+    other = FakeCursor(FakeConnection())
+    cpool.execute(other, query, {"a": 5, "b": 6})
+    assert other.statements[0][0].startswith(f"PREPARE {name}")
+
+
+def test_execute_prepares_a_stale_statement_again(monkeypatch):
+    monkeypatch.setattr(conn_module, "USE_PREPARED_STATEMENTS", True)
+    cpool = ConnectionPool()
+    query = "SELECT * FROM temperature_predictions WHERE id = %s;"
+    cur = FakeCursor(FakeConnection())
+    cpool.execute(cur, query, (1,))
+
+    # A migration added a column since the statement was prepared
+    cur.fail_with = errors.FeatureNotSupported(
+        "cached plan must not change result type")
+    cur.statements.clear()
+    cpool.execute(cur, query, (2,))
+    assert [statement.split(" ")[0] for statement, _ in cur.statements] == [
+        "EXECUTE", "DEALLOCATE", "PREPARE", "EXECUTE"]
+    assert cur.connection.rollbacks == 1
+
+
+def test_execute_raises_a_stale_statement_inside_a_transaction(
+        monkeypatch):
+    monkeypatch.setattr(conn_module, "USE_PREPARED_STATEMENTS", True)
+    cpool = ConnectionPool()
+    query = "SELECT * FROM temperature_predictions WHERE id = %s;"
+    cur = FakeCursor(FakeConnection())
+    cpool.execute(cur, query, (1,))
+
+    cur.connection.info.transaction_status = (
+        extensions.TRANSACTION_STATUS_INTRANS)
+    cur.fail_with = errors.FeatureNotSupported(
+        "cached plan must not change result type")
+    with pytest.raises(errors.FeatureNotSupported):
+        cpool.execute(cur, query, (2,))
+    # Nothing rolled back under the caller, prepared again next time
+    assert cur.connection.rollbacks == 0
+    assert cpool.prepared_statements[id(cur.connection)][1] == set()
+
+
+class ExplainConnection(FakeConnection):
+    """
+    A FakeConnection in a transaction, whose EXPLAINs fail when
+    explain_fails is set: the failure aborts the transaction until rolled
+    back to a savepoint, as on the server.
+    """
+
+    def __init__(self, explain_fails=False) -> None:
+        super().__init__(status=extensions.TRANSACTION_STATUS_INTRANS)
+        self.autocommit = False
+        self.explain_fails = explain_fails
+        self.statements = []
+
+    def cursor(self, cursor_factory=None):
+        return ExplainCursor(self)
+
+
+class ExplainCursor:
+    """
+    The plain cursor of an ExplainConnection.
+    """
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+
+    def execute(self, query, params=None):
+        conn = self.connection
+        conn.statements.append(query)
+        if conn.info.transaction_status == (
+                extensions.TRANSACTION_STATUS_INERROR) and not (
+                query.startswith("ROLLBACK TO")):
+            raise psycopg2.InternalError("current transaction is aborted")
+        if query.startswith("ROLLBACK TO"):
+            conn.info.transaction_status = (
+                extensions.TRANSACTION_STATUS_INTRANS)
+        elif query.startswith("EXPLAIN") and conn.explain_fails:
+            conn.info.transaction_status = (
+                extensions.TRANSACTION_STATUS_INERROR)
+            raise psycopg2.ProgrammingError("syntax error")
+
+    def fetchall(self):
+        return [("Seq Scan on temperature_predictions",)]
+
+    def close(self):
+        pass
+
+
+def trace(duration, connection=None, **fields) -> dict:
+    # The trace of an execute round-trip, see add_query_tracer
+    statement = "SELECT * FROM temperature_predictions WHERE id = %s;"
+    return {"kind": "execute", "query": " ".join(statement.split()),
+            "statement": statement, "params": (1,), "duration": duration,
+            "rows": 1, "pool_wait": 0.002, "error": None,
+            "cursor": types.SimpleNamespace(
+                connection=connection or ExplainConnection()),
+            **fields}
+
+
+def test_only_the_queries_over_the_threshold_are_logged():
+    slow_log = SlowQueryLog(threshold_ms=100)
+    slow_log(trace(0.099))
+    slow_log(trace(0.250))
+    slow_log(trace(0.300, kind="fetch"))
+    slow_log(trace(0.300, error=psycopg2.OperationalError()))
+
+    entries = slow_log.entries()
+    assert len(entries) == 1
+    assert entries[0]["duration_ms"] == pytest.approx(250)
+    assert entries[0]["pool_wait_ms"] == pytest.approx(2)
+    assert entries[0]["plan"] == "Seq Scan on temperature_predictions"
+
+
+def test_the_slow_query_log_keeps_the_latest_entries():
+    slow_log = SlowQueryLog(threshold_ms=0, max_entries=3)
+    for rows in range(5):
+        slow_log(trace(0.1, rows=rows))
+    assert [entry["rows"] for entry in slow_log.entries()] == [2, 3, 4]
+
+
+def test_the_slow_query_log_records_the_context():
+    slow_log = SlowQueryLog(threshold_ms=0,
+                            context=lambda: "/home?format=columns")
+    slow_log(trace(0.1))
+    assert slow_log.entries()[0]["context"] == "/home?format=columns"
+
+
+def test_a_failed_explain_leaves_the_transaction_usable():
+    conn = ExplainConnection(explain_fails=True)
+    slow_log = SlowQueryLog(threshold_ms=0)
+    slow_log(trace(0.1, connection=conn))
+
+    assert slow_log.entries()[0]["plan"].startswith("EXPLAIN failed")
+    assert [statement.split(" ")[0] for statement in conn.statements] == [
+        "SAVEPOINT", "EXPLAIN", "ROLLBACK", "RELEASE"]
+    assert conn.info.transaction_status == (
+        extensions.TRANSACTION_STATUS_INTRANS)
+
+
+def test_an_aborted_transaction_is_not_explained():
+    conn = ExplainConnection()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INERROR
+    slow_log = SlowQueryLog(threshold_ms=0)
+    slow_log(trace(0.1, connection=conn))
+
+    assert slow_log.entries()[0]["plan"] is None
+    assert conn.statements == []
+
+
+def test_traced_cursor_reports_each_round_trip(monkeypatch):
+    traces = []
+    monkeypatch.setattr(conn_module, "_query_tracers", (traces.append,))
+    monkeypatch.setattr(conn_module.time, "perf_counter", lambda: 10.25)
+    # The attributes of a client-side cursor after a 3 row SELECT
+    cur = types.SimpleNamespace(name=None, rowcount=3, description=(),
+                                connection=FakeConnection())
+    TracedCursor._trace(cur, "execute", "SELECT *\n FROM t;", None,
+                        10.0, None)
+
+    assert traces[0]["query"] == "SELECT * FROM t;"
+    assert traces[0]["duration"] == pytest.approx(0.25)
+    assert traces[0]["rows"] == 3
+
+
+def test_a_bound_method_tracer_can_be_removed(monkeypatch):
+    monkeypatch.setattr(conn_module, "_query_tracers", ())
+    slow_log = SlowQueryLog()
+    conn_module.add_query_tracer(slow_log.entries)
+    conn_module.remove_query_tracer(slow_log.entries)
+    assert conn_module._query_tracers == ()
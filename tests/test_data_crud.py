@@ -0,0 +1,49 @@
+from db.data_crud import copy_data_skip_duplicates_with_cursor
+
+DATA = ("""(location_id, forecast_made_at, forecast_for_hour,
+        temperature)""",
+        (1, "2025-02-01T09:00:00", "2025-02-01T10:00:00+05:30", 21.5),
+        (2, "2025-02-01T09:00:00", "2025-02-01T10:00:00+05:30", 19.0))
+
+
+class FakeCursor:
+    """
+    Records the statements run, and answers the INSERT with the rows of
+    location 2 only (location 1 being a duplicate).
+    """
+
+    def __init__(self) -> None:
+        self.statements = []
+        self.copied = ""
+        self.rowcount = -1
+
+    def execute(self, query, params=None):
+        self.statements.append(" ".join(query.split()))
+        if query.startswith("INSERT"):
+            self.rowcount = 1
+
+    def copy_expert(self, query, file):
+        self.statements.append(query)
+        self.copied = file.read()
+
+    def fetchall(self):
+        return [DATA[2]]
+
+
+def test_copy_skip_duplicates_returns_the_count():
+    cur = FakeCursor()
+    assert copy_data_skip_duplicates_with_cursor(
+        cur, "temperature_predictions", DATA) == 1
+    insert = cur.statements[2]
+    assert insert.endswith("ON CONFLICT DO NOTHING;")
+    assert cur.copied.count("\n") == 2
+    assert cur.statements[-1] == "DROP TABLE temperature_predictions_staging;"
+
+
+def test_copy_skip_duplicates_returns_the_rows_inserted():
+    cur = FakeCursor()
+    assert copy_data_skip_duplicates_with_cursor(
+        cur, "temperature_predictions", DATA, returning=True) == [DATA[2]]
+    assert cur.statements[2].endswith(
+        "ON CONFLICT DO NOTHING RETURNING location_id, forecast_made_at, "
+        "forecast_for_hour, temperature;")
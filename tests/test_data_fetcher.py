@@ -0,0 +1,98 @@
+import time
+import pytest
+import api.data_fetcher as data_fetcher
+from api.request_scheduler import RequestScheduler
+from benchmarks.fake_accuweather import (
+    FakeAccuWeatherServer, fake_location_keys)
+
+
+@pytest.fixture
+def api_logs(monkeypatch):
+    # API interactions logged by the fetchers, instead of the database
+    logs = []
+    monkeypatch.setattr(data_fetcher, "log_api_interaction",
+                        lambda *log: logs.append(log))
+    # No pacing, a single quick retry of the transient failures
+    monkeypatch.setattr(data_fetcher, "scheduler", RequestScheduler(
+        rate=1000, burst=1000, max_retries=1, backoff_base=0.001,
+        backoff_cap=0.001))
+    return logs
+
+
+def serve(monkeypatch, **options) -> FakeAccuWeatherServer:
+    server = FakeAccuWeatherServer(**options)
+    monkeypatch.setattr(data_fetcher, "ACCUWEATHER_BASE_URL",
+                        server.start())
+    return server
+
+
+def test_concurrent_fetch_matches_the_sequential_one(monkeypatch, api_logs):
+    location_keys = fake_location_keys(20)
+    server = serve(monkeypatch, latency=0.01)
+    try:
+        sequential = data_fetcher._12_hour_temperature_forecast(
+            location_keys)
+        concurrent = data_fetcher._12_hour_temperature_forecast_concurrent(
+            location_keys, max_workers=4)
+    finally:
+        server.stop()
+
+    assert list(concurrent) == list(location_keys)
+    assert concurrent == sequential
+    assert all(len(hours) == 12 for hours in concurrent.values())
+    assert [log[2] for log in api_logs] == [200] * 40
+
+
+def test_concurrent_fetch_skips_failed_locations(monkeypatch, api_logs):
+    location_keys = fake_location_keys(6)
+    keys = list(location_keys.values())
+    server = serve(monkeypatch, statuses={keys[1]: 404, keys[4]: 503})
+    try:
+        fetched = data_fetcher._12_hour_temperature_forecast_concurrent(
+            location_keys, max_workers=3)
+    finally:
+        server.stop()
+
+    names = list(location_keys)
+    assert list(fetched) == [names[0], names[2], names[3], names[5]]
+    # One log per location, with the final status and its error message
+    assert sorted(log[2] for log in api_logs) == [200] * 4 + [404, 503]
+    for url, method, status, error_message in api_logs:
+        assert method == "GET"
+        if status == 200:
+            assert error_message == ""
+        else:
+            assert error_message == f"Error fetching forecast: {status}"
+    # The 503 is transient and retried once, the 404 is not
+    assert server.request_count == 7
+
+
+def test_concurrent_fetch_bounds_the_requests_in_flight(monkeypatch,
+                                                       api_logs):
+    server = serve(monkeypatch, latency=0.05)
+    try:
+        fetched = data_fetcher._12_hour_temperature_forecast_concurrent(
+            fake_location_keys(12), max_workers=3)
+    finally:
+        server.stop()
+
+    assert len(fetched) == 12
+    assert server.max_in_flight == 3
+
+
+def test_stream_holds_back_requests_of_a_slow_consumer(monkeypatch,
+                                                       api_logs):
+    server = serve(monkeypatch)
+    try:
+        stream = data_fetcher._12_hour_temperature_forecast_stream(
+            fake_location_keys(30), max_workers=2, max_pending=4)
+        location, hours = next(stream)
+        time.sleep(0.2)
+        # The first response consumed, and at most 4 more requested
+        assert server.request_count <= 5
+        consumed = 1 + sum(1 for _ in stream)
+    finally:
+        server.stop()
+
+    assert consumed == 30
+    assert server.request_count == 30
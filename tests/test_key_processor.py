@@ -0,0 +1,51 @@
+import pytest
+import api.key_processor as key_processor
+from api.request_scheduler import RequestScheduler
+from benchmarks.fake_accuweather import (
+    FakeAccuWeatherServer, location_key_for)
+
+
+@pytest.fixture
+def api_logs(monkeypatch):
+    # API interactions logged by get_location_keys, instead of the database
+    logs = []
+    monkeypatch.setattr(key_processor, "log_api_interaction",
+                        lambda *log: logs.append(log))
+    # No pacing, a single quick retry of the transient failures
+    monkeypatch.setattr(key_processor, "scheduler", RequestScheduler(
+        rate=1000, burst=1000, max_retries=1, backoff_base=0.001,
+        backoff_cap=0.001))
+    return logs
+
+
+def serve(monkeypatch, **options) -> FakeAccuWeatherServer:
+    server = FakeAccuWeatherServer(**options)
+    monkeypatch.setattr(key_processor, "ACCUWEATHER_BASE_URL",
+                        server.start())
+    return server
+
+
+def test_location_keys_are_fetched(monkeypatch, api_logs):
+    server = serve(monkeypatch)
+    try:
+        location_keys = key_processor.get_location_keys(["Dwarka", "Nawada"])
+    finally:
+        server.stop()
+
+    assert location_keys == {"Dwarka": location_key_for("Dwarka"),
+                             "Nawada": location_key_for("Nawada")}
+    assert [log[2] for log in api_logs] == [200, 200]
+
+
+def test_a_failed_location_raises_once_logged(monkeypatch, api_logs):
+    server = serve(monkeypatch, statuses={"Nawada": 503})
+    try:
+        with pytest.raises(key_processor.LocationKeyError) as raised:
+            key_processor.get_location_keys(["Dwarka", "Nawada", "Najafgarh"])
+    finally:
+        server.stop()
+
+    assert raised.value.response.status_code == 503
+    # The failure is logged, the locations after it are not fetched
+    assert [log[2] for log in api_logs] == [200, 503]
+    assert api_logs[-1][3] == "Error fetching location key: 503"
@@ -0,0 +1,99 @@
+import datetime
+from decimal import Decimal
+import numpy as np
+import pytest
+from db.local_archive import (
+    ForecastArchive, ArchiveSpool, RECORD_DTYPE, to_epoch_second)
+
+
+def rows_made_at(made_at, location_ids=(1, 2), hours=3):
+    # (location_id, forecast_made_at, forecast_for_hour, temperature)
+    return [(location_id, made_at, f"{made_at[:11]}{10 + hour:02d}:00:00"
+             "+05:30", 20.0 + hour)
+            for location_id in location_ids for hour in range(hours)]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return ForecastArchive(str(tmp_path / "forecasts.bin"))
+
+
+def test_append_and_query(archive):
+    assert len(archive) == 0
+    assert archive.append(rows_made_at("2025-02-01T09:00:00.123456")) == 6
+    assert archive.append(rows_made_at("2025-02-02T09:00:00")) == 6
+    assert len(archive) == 12
+
+    records = archive.query(location_id=2, start="2025-02-02")
+    assert records.dtype == RECORD_DTYPE
+    assert len(records) == 3
+    assert (records["made_at"] == to_epoch_second("2025-02-02T09:00:00")
+            ).all()
+    # The wall-clock time is kept, the offset dropped
+    assert records["for_hour"][0] == to_epoch_second("2025-02-02T10:00:00")
+    assert records["temperature"].tolist() == [20.0, 21.0, 22.0]
+
+    records = archive.query(for_hour_start="2025-02-01T11:00:00",
+                            for_hour_end="2025-02-01T11:00:00")
+    assert records["location_id"].tolist() == [1, 2]
+
+
+def test_append_rejects_rows_made_before_the_last_record(archive):
+    archive.append(rows_made_at("2025-02-02T09:00:00"))
+    with pytest.raises(ValueError):
+        archive.append(rows_made_at("2025-02-01T09:00:00"))
+    assert len(archive) == 6
+
+
+def test_an_interrupted_append_is_dropped(archive):
+    archive.append(rows_made_at("2025-02-01T09:00:00"))
+    with open(archive.path, "ab") as f:
+        f.write(b"\x00" * (RECORD_DTYPE.itemsize - 1))
+    assert len(archive.records()) == 6
+    archive.append(rows_made_at("2025-02-02T09:00:00"))
+    assert len(archive) == 12
+    assert archive.records()["location_id"][-1] == 2
+
+
+def test_append_the_rows_read_back_from_the_database(archive):
+    # datetimes and numeric temperatures, as returned by the database
+    made_at = datetime.datetime(2025, 2, 1, 9, 0, 0, 500000)
+    rows = [(1, made_at, datetime.datetime(2025, 2, 1, 10), Decimal("21.5"))]
+    archive.append(rows)
+    record = archive.records()[0]
+    assert record["made_at"] == to_epoch_second("2025-02-01T09:00:00")
+    assert record["temperature"] == np.float32(21.5)
+
+
+def test_spool_is_appended_in_one_go(archive):
+    archive.append(rows_made_at("2025-02-01T09:00:00"))
+    spool = ArchiveSpool()
+    assert spool.add(rows_made_at("2025-02-02T09:00:00")) == 6
+    assert spool.add(rows_made_at("2025-02-02T09:00:05", (3,))) == 3
+    assert spool.add([]) == 0
+    with pytest.raises(ValueError):
+        spool.add(rows_made_at("2025-02-02T08:00:00"))
+
+    assert archive.append_spool(spool) == 9
+    spool.close()
+    assert len(archive) == 15
+    assert archive.query(location_id=3)["made_at"].tolist() == [
+        to_epoch_second("2025-02-02T09:00:05")] * 3
+
+
+def test_spool_made_before_the_last_record_is_rejected(archive):
+    archive.append(rows_made_at("2025-02-02T09:00:00"))
+    spool = ArchiveSpool()
+    spool.add(rows_made_at("2025-02-01T09:00:00"))
+    with pytest.raises(ValueError):
+        archive.append_spool(spool)
+    assert len(archive) == 6
+
+
+def test_spool_is_deleted_when_the_run_fails(archive):
+    with pytest.raises(RuntimeError):
+        with ArchiveSpool() as spool:
+            spool.add(rows_made_at("2025-02-02T09:00:00"))
+            raise RuntimeError("copy failed")
+    assert spool.file.closed
+    assert len(archive) == 0
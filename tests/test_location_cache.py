@@ -0,0 +1,82 @@
+import types
+import pytest
+from db import location_cache
+from db.location_cache import MISS_RELOAD_INTERVAL, LocationDirectory
+
+
+@pytest.fixture
+def database(monkeypatch):
+    # The locations table, and the clock of the directory
+    database = types.SimpleNamespace(
+        rows=[("Dwarka", 1), ("Nawada", 2)], down=False, loads=0, now=0.0)
+
+    def get_all_values(table_name, columns):
+        database.loads += 1
+        return False if database.down else list(database.rows)
+
+    monkeypatch.setattr(location_cache, "get_all_values", get_all_values)
+    monkeypatch.setattr(location_cache, "time", types.SimpleNamespace(
+        monotonic=lambda: database.now))
+    return database
+
+
+def test_the_locations_are_loaded_once_per_ttl(database):
+    directory = LocationDirectory(ttl=60)
+    assert directory.get_id("Dwarka") == 1
+    assert directory.get_id("Nawada") == 2
+    assert database.loads == 1
+
+    database.rows.append(("Najafgarh", 3))
+    database.now += 61
+    assert directory.mapping() == {"Dwarka": 1, "Nawada": 2, "Najafgarh": 3}
+    assert database.loads == 2
+
+
+def test_an_unknown_location_reloads_at_most_every_interval(database):
+    directory = LocationDirectory(ttl=60)
+    directory.get_id("Dwarka")
+    database.now += MISS_RELOAD_INTERVAL / 2
+    assert directory.get_id("Bahadurgarh") is None
+    assert database.loads == 1
+
+    # Added since, found by the reload of the next miss
+    database.rows.append(("Bahadurgarh", 4))
+    database.now += MISS_RELOAD_INTERVAL
+    assert directory.get_id("Bahadurgarh") == 4
+    assert database.loads == 2
+
+
+def test_a_failed_load_is_retried_at_most_every_interval(database):
+    directory = LocationDirectory(ttl=60)
+    directory.get_id("Dwarka")
+    database.down = True
+    database.now += 61
+
+    # The old entries are served, one attempt per interval
+    assert directory.get_id("Dwarka") == 1
+    assert directory.get_id("Bahadurgarh") is None
+    assert directory.get_id("Nawada") == 2
+    assert database.loads == 2
+
+    database.down = False
+    database.now += MISS_RELOAD_INTERVAL + 1
+    assert directory.get_id("Dwarka") == 1
+    assert database.loads == 3
+
+
+def test_a_failed_first_load_is_rate_limited(database):
+    database.down = True
+    directory = LocationDirectory(ttl=60)
+    assert directory.get_id("Dwarka") is None
+    assert directory.get_id("Dwarka") is None
+    assert database.loads == 1
+
+
+def test_invalidate_forces_a_reload(database):
+    directory = LocationDirectory(ttl=60)
+    directory.get_id("Dwarka")
+    database.rows = [("Dwarka", 10)]
+    directory.invalidate()
+
+    assert directory.get_id("Dwarka") == 10
+    assert database.loads == 2
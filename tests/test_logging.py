@@ -0,0 +1,97 @@
+import types
+import pytest
+from utils import logging as run_logging
+from utils.logging import LogBuffer, log_db_transaction
+
+
+class FakeRun:
+    """
+    Stands for a PopulateRun: records the inserted logs.
+    """
+
+    def __init__(self, prediction_id=None) -> None:
+        self.prediction_id = prediction_id
+        self.inserted = []
+
+    def last_prediction_id(self):
+        return self.prediction_id
+
+    def insert_logs(self, table_name, data):
+        self.inserted.append((table_name, data[1:]))
+
+
+@pytest.fixture(autouse=True)
+def no_database(monkeypatch):
+    def last_insert_id(*args):
+        raise AssertionError("the sequence was read on another connection")
+
+    def insert_data(*args):
+        raise AssertionError("a log was inserted outside of the run")
+
+    monkeypatch.setattr(run_logging, "last_insert_id", last_insert_id)
+    monkeypatch.setattr(run_logging, "insert_data", insert_data)
+
+
+def test_db_log_of_the_runs_last_prediction():
+    run = FakeRun(prediction_id=42)
+    with LogBuffer(7, run=run):
+        log_db_transaction("copy", "Success", "", run.last_prediction_id())
+    assert run.inserted == [
+        ("db_transaction_logs", (("copy", "Success", "", 7, 42),))]
+
+
+def test_db_log_without_prediction_is_null():
+    run = FakeRun(prediction_id=42)
+    with LogBuffer(7, run=run):
+        log_db_transaction("copy", "Failed", "boom")
+    assert run.inserted == [
+        ("db_transaction_logs", (("copy", "Failed", "boom", 7, None),))]
+
+
+def test_db_log_outside_of_a_run_is_null(monkeypatch):
+    inserted = []
+    monkeypatch.setattr(run_logging, "insert_data",
+                        lambda table_name, data: inserted.append(data[1:]))
+    with LogBuffer(7):
+        log_db_transaction("copy", "Success", "")
+    assert inserted == [(("copy", "Success", "", 7, None),)]
+
+
+def test_logs_are_flushed_once_max_records_are_buffered():
+    run = FakeRun()
+    with LogBuffer(7, max_records=3, run=run) as buffer:
+        for status in (200, 200, 503, 200):
+            buffer.add_api_log("url", "GET", status, "")
+        # The first 3 logs are written, the last one is still buffered
+        assert [len(logs) for _, logs in run.inserted] == [3]
+        assert len(buffer.api_logs) == 1
+    assert [len(logs) for _, logs in run.inserted] == [3, 1]
+
+
+def test_logs_are_flushed_once_the_oldest_is_max_age_old(monkeypatch):
+    clock = types.SimpleNamespace(now=100.0)
+    monkeypatch.setattr(run_logging, "time", types.SimpleNamespace(
+        monotonic=lambda: clock.now))
+    run = FakeRun()
+    with LogBuffer(7, max_age=30.0, run=run) as buffer:
+        buffer.add_api_log("url", "GET", 200, "")
+        clock.now += 29
+        buffer.add_db_log("copy", "Success", "", None)
+        assert run.inserted == []
+        clock.now += 1
+        buffer.add_api_log("url", "GET", 200, "")
+        assert [table for table, _ in run.inserted] == [
+            "api_logs", "db_transaction_logs"]
+        assert buffer.oldest_log_at is None
+
+
+def test_logs_are_flushed_on_an_error_exit():
+    run = FakeRun()
+    with pytest.raises(RuntimeError):
+        with LogBuffer(7, run=run):
+            log_db_transaction("copy", "Failed", "boom")
+            raise RuntimeError("boom")
+    assert run.inserted == [
+        ("db_transaction_logs", (("copy", "Failed", "boom", 7, None),))]
+    # The logs are no longer buffered once the buffer is left
+    assert run_logging._active_buffer is None
@@ -0,0 +1,93 @@
+import numpy as np
+import scripts.matrix_export as matrix_export
+from scripts.matrix_export import (HOUR, LEAD_HOURS, append_records,
+                                   build_records, forecast_matrices,
+                                   load_forecasts, matrix_path)
+
+START = 1738400400  # 2025-02-01 09:00 UTC
+
+
+def forecast_rows(first_issue_time, hours) -> tuple:
+    # The 12 forecasts of one run per hour, temperature = hour + lead / 100
+    issue_times = np.repeat(
+        first_issue_time + HOUR * np.arange(hours), LEAD_HOURS)
+    lead_hours = np.tile(np.arange(1, LEAD_HOURS + 1), hours)
+    temperatures = ((issue_times - START) // HOUR
+                    + lead_hours / 100).astype(np.float32)
+    return issue_times, lead_hours, temperatures
+
+
+def test_build_records_has_one_record_per_hour():
+    issue_times, lead_hours, temperatures = forecast_rows(START, 3)
+    # No run at the second hour
+    kept = (issue_times != START + HOUR)
+    records = build_records(issue_times[kept], lead_hours[kept],
+                            temperatures[kept])
+
+    assert list(records["issue_time"]) == [START, START + HOUR,
+                                           START + 2 * HOUR]
+    assert records["temperatures"][0, 0] == np.float32(0.01)
+    assert np.isnan(records["temperatures"][1]).all()
+    assert records["temperatures"][2, 11] == np.float32(2.12)
+
+
+def test_build_records_from_the_given_first_issue_time():
+    records = build_records(*forecast_rows(START + 2 * HOUR, 1),
+                            first_issue_time=START)
+
+    assert len(records) == 3
+    assert np.isnan(records["temperatures"][:2]).all()
+
+
+def test_append_records_creates_and_extends_the_file(tmp_path):
+    path = str(tmp_path / "location_1.npy")
+    append_records(path, build_records(*forecast_rows(START, 2)))
+    append_records(path, build_records(*forecast_rows(START + 2 * HOUR, 3)))
+
+    records = np.load(path)
+    assert list(records["issue_time"]) == [
+        START + HOUR * hour for hour in range(5)]
+    assert records["temperatures"][4, 0] == np.float32(4.01)
+
+
+def test_append_records_keeps_the_header_in_place(tmp_path):
+    path = str(tmp_path / "location_1.npy")
+    np.save(path, np.zeros(1, dtype=matrix_export.RECORD_DTYPE))
+    size = (tmp_path / "location_1.npy").stat().st_size
+    append_records(path, np.zeros(10 ** 5, dtype=matrix_export.RECORD_DTYPE))
+
+    # Only the records are added: the header kept its length
+    assert ((tmp_path / "location_1.npy").stat().st_size - size
+            == 10 ** 5 * matrix_export.RECORD_DTYPE.itemsize)
+    assert len(np.load(path, mmap_mode="r")) == 10 ** 5 + 1
+
+
+def test_export_reads_new_locations_from_the_start(monkeypatch, tmp_path):
+    out_dir = str(tmp_path)
+    append_records(matrix_path(1, out_dir),
+                   build_records(*forecast_rows(START, 3)))
+    watermarks = []
+
+    def fetch_forecasts(since):
+        watermarks.append(since)
+        return {1: forecast_rows(START + 3 * HOUR, 2),
+                2: forecast_rows(START, 5)}
+    monkeypatch.setattr(matrix_export, "fetch_forecasts", fetch_forecasts)
+
+    assert matrix_export.export_matrices(out_dir) == {1: 2, 2: 5}
+    # Location 2 has no watermark, so its whole history is read
+    assert watermarks == [{1: START + 3 * HOUR}]
+    assert len(load_forecasts(1, out_dir)) == 5
+    assert load_forecasts(2, out_dir)["issue_time"][0] == START
+
+
+def test_forecast_matrices_are_windows_of_12_hours(tmp_path):
+    out_dir = str(tmp_path)
+    append_records(matrix_path(1, out_dir),
+                   build_records(*forecast_rows(START, 14)))
+    matrices, issue_times = forecast_matrices(1, out_dir)
+
+    assert matrices.shape == (3, LEAD_HOURS, LEAD_HOURS)
+    assert list(issue_times) == [START, START + HOUR, START + 2 * HOUR]
+    # Issue hour 1 of the second window, lead hour 3
+    assert matrices[1, 0, 2] == np.float32(1.03)
@@ -0,0 +1,70 @@
+import datetime
+from db.partitions import (DEFAULT_PARTITION, create_partition,
+                           partitions_for_range)
+
+
+class FakeCursor:
+    """
+    Records the statements run, with rows_in_default rows of the month in
+    the default partition.
+    """
+
+    def __init__(self, rows_in_default) -> None:
+        self.statements = []
+        self.rows_in_default = rows_in_default
+        self.rowcount = -1
+
+    def execute(self, query, params=None):
+        self.statements.append(" ".join(query.split()))
+        if query.startswith("DELETE"):
+            self.rowcount = self.rows_in_default
+
+    def fetchone(self):
+        return (1,) if self.rows_in_default else None
+
+
+def test_partitions_for_range_covers_every_month():
+    partitions = partitions_for_range(
+        datetime.datetime(2024, 11, 20, 13), datetime.date(2025, 2, 1))
+
+    assert partitions == [
+        ("temperature_predictions_y2024m11", datetime.date(2024, 11, 1),
+         datetime.date(2024, 12, 1)),
+        ("temperature_predictions_y2024m12", datetime.date(2024, 12, 1),
+         datetime.date(2025, 1, 1)),
+        ("temperature_predictions_y2025m01", datetime.date(2025, 1, 1),
+         datetime.date(2025, 2, 1)),
+        ("temperature_predictions_y2025m02", datetime.date(2025, 2, 1),
+         datetime.date(2025, 3, 1)),
+    ]
+
+
+def test_partitions_for_range_within_a_month():
+    day = datetime.date(2025, 3, 14)
+    assert [p[0] for p in partitions_for_range(day, day)] == [
+        "temperature_predictions_y2025m03"]
+
+
+def test_create_partition_without_rows_in_default():
+    cur = FakeCursor(rows_in_default=0)
+    name, first_day, last_day = partitions_for_range(
+        datetime.date(2025, 3, 1), datetime.date(2025, 3, 1))[0]
+
+    assert create_partition(cur, name, first_day, last_day) == 0
+    assert len(cur.statements) == 2
+    assert cur.statements[-1].startswith(f"CREATE TABLE IF NOT EXISTS {name}")
+
+
+def test_create_partition_moves_the_rows_out_of_default():
+    cur = FakeCursor(rows_in_default=3)
+    name, first_day, last_day = partitions_for_range(
+        datetime.date(2025, 3, 1), datetime.date(2025, 3, 1))[0]
+
+    assert create_partition(cur, name, first_day, last_day) == 3
+    statements = [statement.split(" ")[0] for statement in cur.statements]
+    # Set aside and deleted before the partition exists, inserted after
+    assert statements == ["SELECT", "CREATE", "DELETE", "CREATE", "INSERT",
+                          "DROP"]
+    assert f"FROM {DEFAULT_PARTITION}" in cur.statements[2]
+    assert "PARTITION OF" in cur.statements[3]
+    assert cur.statements[4].endswith(f"FROM {name}_moved;")
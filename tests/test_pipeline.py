@@ -0,0 +1,68 @@
+import threading
+import pytest
+from utils.pipeline import BatchWriter
+
+
+def test_rows_are_written_in_batches():
+    batches = []
+    with BatchWriter(batches.append, batch_rows=4) as writer:
+        for location in range(5):
+            writer.put([(location, hour) for hour in range(2)])
+
+    # The rows left are written on exit
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert (writer.batches, writer.rows_written) == (3, 10)
+    assert [row for batch in batches for row in batch][:3] == [
+        (0, 0), (0, 1), (1, 0)]
+
+
+def test_an_error_of_write_is_raised_by_the_next_put():
+    def write(batch):
+        raise ValueError("copy failed")
+
+    with pytest.raises(ValueError, match="copy failed"):
+        with BatchWriter(write, batch_rows=1) as writer:
+            writer.put([1])
+            # The writer stops on the error
+            writer._thread.join(1)
+            writer.put([2])
+    assert writer.rows_written == 0
+
+
+def test_an_error_of_write_is_raised_on_exit():
+    def write(batch):
+        raise ValueError("copy failed")
+
+    with pytest.raises(ValueError, match="copy failed"):
+        with BatchWriter(write, batch_rows=10) as writer:
+            writer.put([1])
+
+
+def test_an_error_of_the_with_block_drops_the_rows_left():
+    batches = []
+    with pytest.raises(RuntimeError):
+        with BatchWriter(batches.append, batch_rows=10) as writer:
+            writer.put([1, 2])
+            raise RuntimeError("fetch failed")
+    assert batches == []
+    assert not writer._thread.is_alive()
+
+
+def test_put_blocks_while_the_queue_is_full():
+    release = threading.Event()
+    batches = []
+
+    def write(batch):
+        release.wait(1)
+        batches.append(batch)
+
+    with BatchWriter(write, batch_rows=1, queue_size=1) as writer:
+        writer.put([1])  # taken by the writer, which waits
+        writer.put([2])  # fills the queue
+        blocked = threading.Thread(target=writer.put, args=([3],))
+        blocked.start()
+        blocked.join(0.3)
+        assert blocked.is_alive()
+        release.set()
+        blocked.join(1)
+    assert batches == [[1], [2], [3]]
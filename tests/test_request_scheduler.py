@@ -0,0 +1,125 @@
+import datetime
+import email.utils
+import pytest
+from api import request_scheduler
+from api.request_scheduler import (
+    RequestScheduler, TokenBucket, retry_after_seconds)
+
+
+class FakeResponse:
+    def __init__(self, status_code, retry_after=None) -> None:
+        self.status_code = status_code
+        self.headers = {}
+        if retry_after is not None:
+            self.headers["Retry-After"] = retry_after
+        self.content = b"{}"
+
+
+class FakeSession:
+    """
+    Answers the queued responses in order.
+    """
+
+    def __init__(self, *responses) -> None:
+        self.responses = list(responses)
+
+    def get(self, url, params=None):
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Delays slept by the scheduler, without sleeping
+    slept = []
+    monkeypatch.setattr(request_scheduler.time, "sleep", slept.append)
+    return slept
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds("120") == 120.0
+    assert retry_after_seconds("-5") == -5.0
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("soon") is None
+    assert retry_after_seconds("nan") is None
+    assert retry_after_seconds("inf") is None
+    in_a_minute = datetime.datetime.now(
+        datetime.timezone.utc) + datetime.timedelta(seconds=60)
+    seconds = retry_after_seconds(email.utils.format_datetime(
+        in_a_minute, usegmt=True))
+    assert 55 <= seconds <= 60
+
+
+@pytest.mark.parametrize("retry_after, delay", [
+    ("-5", 0.0), ("3600", 2.0), ("1.5", 1.5),
+    ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0)])
+def test_retry_after_is_clamped(sleeps, retry_after, delay):
+    scheduler = RequestScheduler(rate=0, max_retries=1, backoff_cap=2.0)
+    response = scheduler.get("http://api", session=FakeSession(
+        FakeResponse(503, retry_after), FakeResponse(200)))
+    assert response.status_code == 200
+    assert sleeps == [delay]
+    assert scheduler.metrics()["retries"] == 1
+
+
+def test_jittered_backoff_stays_under_the_cap(sleeps):
+    scheduler = RequestScheduler(rate=0, max_retries=3, backoff_base=10.0,
+                                 backoff_cap=1.0)
+    response = scheduler.get("http://api", session=FakeSession(
+        FakeResponse(500), FakeResponse(500, "soon"), FakeResponse(500),
+        FakeResponse(500)))
+    assert response.status_code == 500
+    assert len(sleeps) == 3
+    assert all(0.0 <= delay <= 1.0 for delay in sleeps)
+    assert scheduler.metrics()["failures"] == 1
+
+
+def test_token_bucket_without_a_rate_never_waits(sleeps):
+    bucket = TokenBucket(rate=0, capacity=1)
+    assert [bucket.acquire() for _ in range(5)] == [0.0] * 5
+    assert sleeps == []
+
+
+def test_token_bucket_waits_for_the_refill(sleeps):
+    bucket = TokenBucket(rate=1000, capacity=1)
+    assert bucket.acquire() == 0.0
+    bucket.acquire()
+    assert len(sleeps) >= 1 and all(delay > 0 for delay in sleeps)
+
+
+def test_the_quota_counts_the_calls_logged_earlier_today(sleeps):
+    seeds = []
+
+    def usage_source():
+        seeds.append(1)
+        return 8
+
+    scheduler = RequestScheduler(rate=0, daily_quota=10, max_retries=0,
+                                 usage_source=usage_source)
+    session = FakeSession(*[FakeResponse(200) for _ in range(3)])
+    for _ in range(2):
+        scheduler.get("url", {"apikey": "key"}, session=session)
+    with pytest.raises(request_scheduler.QuotaExceeded):
+        scheduler.get("url", {"apikey": "key"}, session=session)
+
+    # Read once for the key and the day
+    assert seeds == [1]
+    assert scheduler.metrics()["quota_used_today"] == 10
+
+
+def test_a_failed_usage_query_counts_as_no_calls(sleeps):
+    scheduler = RequestScheduler(rate=0, daily_quota=1, max_retries=0,
+                                 usage_source=lambda: False)
+    response = scheduler.get("url", {"apikey": "key"},
+                             session=FakeSession(FakeResponse(200)))
+    assert response.status_code == 200
+    assert scheduler.metrics()["quota_used_today"] == 1
+
+
+def test_the_usage_is_not_read_without_a_quota(sleeps):
+    def usage_source():
+        raise AssertionError("the usage was read without a quota")
+
+    scheduler = RequestScheduler(rate=0, daily_quota=0, max_retries=0,
+                                 usage_source=usage_source)
+    scheduler.get("url", {"apikey": "key"},
+                  session=FakeSession(FakeResponse(200)))
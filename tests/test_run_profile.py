@@ -0,0 +1,111 @@
+import threading
+import types
+import pytest
+import db.conn as conn_module
+from utils import run_profile
+from utils.run_profile import RunProfile, stage
+
+
+class FakeRun:
+    """
+    Stands for a PopulateRun: records the inserted logs.
+    """
+
+    populate_id = 7
+
+    def __init__(self) -> None:
+        self.inserted = []
+
+    def insert_logs(self, table_name, data):
+        self.inserted.append((table_name, data[1:]))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # The clock of the profile, and the API counters of the scheduler
+    clock = types.SimpleNamespace(now=100.0, requests=0, bytes_received=0)
+    monkeypatch.setattr(run_profile, "time", types.SimpleNamespace(
+        perf_counter=lambda: clock.now))
+    monkeypatch.setattr(run_profile, "scheduler", types.SimpleNamespace(
+        metrics=lambda: {"requests": clock.requests,
+                         "bytes_received": clock.bytes_received}))
+    return clock
+
+
+def round_trip(rows) -> None:
+    # A query of a pooled cursor, as traced by db/conn.py
+    run_profile._active_profile._trace({"kind": "execute", "rows": rows})
+
+
+def test_nested_stages_charge_the_innermost_one(clock):
+    with RunProfile() as profile:
+        assert profile._trace in conn_module._query_tracers
+        with stage("fetch"):
+            clock.now += 2
+            clock.requests += 3
+            clock.bytes_received += 300
+            with stage("logging"):
+                clock.now += 1
+                round_trip(rows=0)
+            clock.now += 4
+            clock.requests += 1
+            round_trip(rows=5)
+        with stage("logging"):
+            clock.now += 0.5
+
+    metrics = profile.metrics()
+    assert metrics["fetch"]["wall_ms"] == pytest.approx(6000)
+    assert metrics["fetch"]["api_requests"] == 4
+    assert metrics["fetch"]["bytes_received"] == 300
+    assert metrics["fetch"]["db_round_trips"] == 1
+    assert metrics["fetch"]["rows_received"] == 5
+    assert metrics["logging"]["wall_ms"] == pytest.approx(1500)
+    assert metrics["logging"]["calls"] == 2
+    assert metrics["logging"]["api_requests"] == 0
+    # The query tracer is removed on exit
+    assert profile._trace not in conn_module._query_tracers
+
+
+def test_each_thread_has_its_own_stages(clock):
+    entered, leave = threading.Event(), threading.Event()
+
+    def writer():
+        with stage("insert"):
+            entered.set()
+            leave.wait(1)
+            round_trip(rows=0)
+
+    with RunProfile() as profile:
+        with stage("fetch"):
+            thread = threading.Thread(target=writer)
+            thread.start()
+            entered.wait(1)
+            clock.now += 2
+            clock.requests += 2
+            leave.set()
+            thread.join()
+
+    metrics = profile.metrics()
+    # The stages overlap; the API requests go to the profile's thread
+    assert metrics["fetch"]["wall_ms"] == pytest.approx(2000)
+    assert metrics["insert"]["wall_ms"] == pytest.approx(2000)
+    assert metrics["fetch"]["api_requests"] == 2
+    assert metrics["insert"]["api_requests"] == 0
+    assert metrics["insert"]["db_round_trips"] == 1
+    assert metrics["fetch"]["db_round_trips"] == 0
+
+
+def test_the_metrics_are_written_with_the_run(clock):
+    run = FakeRun()
+    with RunProfile(run):
+        with stage("fetch"):
+            clock.now += 0.25
+            clock.requests += 1
+
+    assert run.inserted == [("populate_stage_metrics", (
+        (7, "fetch", 250.0, 1, 1, 0, 0, 0),))]
+
+
+def test_stage_outside_of_a_profile_does_nothing(clock):
+    with stage("fetch") as metrics:
+        assert metrics is None
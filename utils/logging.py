@@ -1,10 +1,126 @@
-from db.data_crud import insert_data, last_insert_id
+import threading
+import time
+from db.data_crud import cpool, insert_data, last_insert_id
+from api.request_scheduler import scheduler
+from utils.run_profile import stage
+
+# Column names of the log tables, as expected by insert_data
+API_LOG_COLUMNS = """(request_url, request_method,
+                 response_status, error_message, populate_id)"""
+DB_LOG_COLUMNS = """(operation_type, status, error_message,
+                 populate_id, id)"""
+
+# Buffer collecting the logs of the running populate, if any
+_active_buffer = None
+
+
+class LogBuffer:
+    """
+    Accumulates API and database transaction logs in memory during a
+    populate run and writes them with one multi-row INSERT per log table,
+    instead of two round-trips to the database per log.
+
+    The populate_id is looked up once when the buffer is created. Logs are
+    flushed when the buffer holds max_records logs, when the oldest log is
+    older than max_age seconds, and always on exit (errors included).
+
+    With a run (see db/populate_run.py), the logs are inserted in the
+    transaction of the run instead of committed on their own.
+
+    Usage:
+        with LogBuffer():
+            ...  # log_api_interaction / log_db_transaction are buffered
+        with PopulateRun() as run, LogBuffer(run.populate_id, run=run):
+            ...
+
+    Methods:
+        - add_api_log(request_url, request_method, response_status,
+        error_message) -> buffers an api_logs row.
+        - add_db_log(operation_type, status, error_message, id) -> buffers a
+        db_transaction_logs row.
+        - flush(none) -> writes the buffered logs to the database.
+    """
+
+    def __init__(self, populate_id=None, max_records=500,
+                 max_age=30.0, run=None) -> None:
+        """
+        Initializes the buffer for the given populate_id (defaults to the
+        latest populate log), the flush thresholds and the PopulateRun the
+        logs are written with, if any.
+        """
+        self.populate_id = (populate_id if populate_id is not None
+                            else last_insert_id("populate_logs",
+                                                "populate_id"))
+        self.max_records = max_records
+        self.max_age = max_age
+        self.run = run
+        self.api_logs = []
+        self.db_logs = []
+        self.oldest_log_at = None
+        self._lock = threading.Lock()
+
+    def add_api_log(self, request_url, request_method,
+                    response_status, error_message) -> None:
+        """
+        Buffers an API interaction log.
+        """
+        self._add(self.api_logs, (request_url, request_method,
+                                  response_status, error_message,
+                                  self.populate_id))
+
+    def add_db_log(self, operation_type, status, error_message, id) -> None:
+        """
+        Buffers a temperature_predictions transaction log.
+        """
+        self._add(self.db_logs, (operation_type, status, error_message,
+                                 self.populate_id, id))
+
+    def flush(self) -> None:
+        """
+        Writes every buffered log with a single INSERT per log table.
+
+        Parameters:
+            none
+        """
+        with self._lock:
+            api_logs, self.api_logs = self.api_logs, []
+            db_logs, self.db_logs = self.db_logs, []
+            self.oldest_log_at = None
+
+        insert = insert_data if self.run is None else self.run.insert_logs
+        # Timed as the logging stage of the run, whichever stage flushes
+        with stage("logging"):
+            if api_logs:
+                insert("api_logs", (API_LOG_COLUMNS, *api_logs))
+            if db_logs:
+                insert("db_transaction_logs", (DB_LOG_COLUMNS, *db_logs))
+
+    def _add(self, logs, record) -> None:
+        with self._lock:
+            logs.append(record)
+            if self.oldest_log_at is None:
+                self.oldest_log_at = time.monotonic()
+            full = len(self.api_logs) + len(self.db_logs) >= self.max_records
+            stale = time.monotonic() - self.oldest_log_at >= self.max_age
+        if full or stale:
+            self.flush()
+
+    def __enter__(self):
+        global _active_buffer
+        _active_buffer = self
+        return self
+
+    def __exit__(self, *exc):
+        global _active_buffer
+        _active_buffer = None
+        self.flush()
 
 
 def log_api_interaction(request_url, request_method,
                         response_status, error_message) -> None:
     """
     Log API interaction details.
+    Buffered when called inside a LogBuffer (i.e. during populate).
 
     Parameters:
         - request_url: The URL of the API endpoint.
@@ -12,8 +128,12 @@ def log_api_interaction(request_url, request_method,
         - response_status: The status of the response.
         - error_message: The error message if the response status is not 200.
     """
-    log_data = (("""(request_url, request_method,
-                 response_status, error_message, populate_id)"""),
+    if _active_buffer is not None:
+        _active_buffer.add_api_log(request_url, request_method,
+                                   response_status, error_message)
+        return
+
+    log_data = ((API_LOG_COLUMNS),
                 (request_url, request_method,
                  response_status, error_message,
                  last_insert_id("populate_logs", "populate_id")))
@@ -21,14 +141,20 @@ def log_api_interaction(request_url, request_method,
     insert_data("api_logs", log_data)
 
 
-def log_db_transaction(operation_type, status, error_message):
+def log_db_transaction(operation_type, status, error_message,
+                       prediction_id=None):
     """
     Log Temperature Prediction database transaction details.
+    Buffered when called inside a LogBuffer (i.e. during populate).
 
     Parameters:
         - operation_type: The type of operation performed on the database.
         - status: The status of the operation.
         - error_message: The error message if the operation failed.
+        - prediction_id: The id of the last prediction of the operation,
+        e.g. run.last_prediction_id() of a PopulateRun; None is logged as
+        NULL. The sequence is not read from another connection, where
+        other runs could have moved it.
     """
     """
         Location db transactions are not logged for less complexity
@@ -39,11 +165,48 @@ def log_db_transaction(operation_type, status, error_message):
         PolyMorphic Relationships.
         To avoid this, only the temperature_predictions table is logged.
     """
-    log_data = (("""(operation_type, status, error_message,
-                 populate_id, id)"""),
+    if _active_buffer is not None:
+        _active_buffer.add_db_log(
+            operation_type, status, error_message, prediction_id)
+        return
+
+    log_data = ((DB_LOG_COLUMNS),
                 (operation_type, status, error_message,
                  last_insert_id("populate_logs", "populate_id"),
-                 last_insert_id("temperature_predictions", "id")
+                 prediction_id
                  ))
 
     insert_data("db_transaction_logs", log_data)
+
+
+def api_calls_logged_today() -> int:
+    """
+    Returns the number of API calls logged since the start of the (UTC)
+    day, i.e. committed by the populate runs and key updates so far; the
+    retries of a call are not logged, so they are not counted.
+    Returns False if the query failed.
+
+    Parameters:
+        none
+    """
+    try:
+        # Get a connection and cursor object
+        conn, cur = cpool.get_connection()
+
+        cpool.execute(cur, """SELECT COUNT(*) FROM api_logs
+        WHERE timestamp >= date_trunc('day', NOW() AT TIME ZONE 'UTC')
+        AT TIME ZONE 'UTC';""")
+        result = cur.fetchone()
+
+        # close the connection
+        cpool.close_connection(conn, cur)
+
+    except Exception as e:
+        print(e)
+        return False
+    return result[0] if result else 0
+
+
+# The daily quota of the shared scheduler (ACCUWEATHER_DAILY_QUOTA) counts
+# the calls logged by the earlier runs of the day, each a process of its own
+scheduler.usage_source = api_calls_logged_today
@@ -0,0 +1,113 @@
+import os
+import queue
+import threading
+from utils.run_profile import stage
+
+# Rows written per batch by the writer of the populate pipeline
+PIPELINE_BATCH_ROWS = int(os.getenv("PIPELINE_BATCH_ROWS", "1000"))
+# Locations' rows waiting for the writer before the producer blocks
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+
+
+class BatchWriter:
+    """
+    Writes rows on a thread of its own, batch_rows at a time, as they are
+    produced: the rows put in its bounded queue are grouped into batches and
+    passed to write, so the writes overlap the production of the next rows
+    (e.g. the fetch and transformation of the next locations).
+
+    When the queue is full, put blocks until the writer catches up, so the
+    rows held in memory stay bounded however many are produced. An error of
+    write stops the writer and is raised by the next put, or on exit.
+
+    On a clean exit the rows left are written and the thread joined; on an
+    error of the with block the rows not written yet are dropped.
+
+    Usage:
+        with BatchWriter(lambda batch: run.copy_predictions(...)) as writer:
+            for rows in produce():
+                writer.put(rows)
+
+    Methods:
+        - put(rows) -> queues rows for the writer.
+    """
+
+    def __init__(self, write, batch_rows=PIPELINE_BATCH_ROWS,
+                 queue_size=PIPELINE_QUEUE_SIZE, stage_name="insert") -> None:
+        """
+        Initializes the writer with the function writing a batch (a list of
+        rows), the batch size, the queue size and the name of the stage the
+        writes are timed as (see utils/run_profile.py).
+        """
+        self.write = write
+        self.batch_rows = max(1, batch_rows)
+        self.stage_name = stage_name
+        self.batches = 0
+        self.rows_written = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def put(self, rows) -> None:
+        """
+        Queues rows for the writer; blocks while the queue is full.
+
+        Parameters:
+            rows (list): The rows, e.g. those of one location.
+        """
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                # Wake up now and then to notice a failed writer
+                self._queue.put(rows, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self) -> None:
+        # Writer thread: batches the queued rows until the end marker
+        batch = []
+        try:
+            while not self._stop.is_set():
+                rows = self._queue.get()
+                if rows is None:
+                    break
+                batch.extend(rows)
+                if len(batch) >= self.batch_rows:
+                    self._write_batch(batch)
+                    batch = []
+            if batch and not self._stop.is_set():
+                self._write_batch(batch)
+        except Exception as e:
+            self.error = e
+
+    def _write_batch(self, batch) -> None:
+        with stage(self.stage_name):
+            self.write(batch)
+        self.batches += 1
+        self.rows_written += len(batch)
+
+    def _close(self) -> None:
+        # Sends the end marker, unless the writer already stopped
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            # Drop the rows not written yet
+            self._stop.set()
+        self._close()
+        if exc_type is None and self.error is not None:
+            raise self.error
+        return False
@@ -0,0 +1,157 @@
+import threading
+import time
+from contextlib import contextmanager
+from db.conn import add_query_tracer, remove_query_tracer
+from api.request_scheduler import scheduler
+
+# Column names of the stage metrics table, as expected by insert_data
+STAGE_COLUMNS = """(populate_id, stage, wall_ms, calls, api_requests,
+                 db_round_trips, rows_received, bytes_received)"""
+
+# Profile of the running populate, if any
+_active_profile = None
+
+
+class RunProfile:
+    """
+    Times the stages of a populate run (fetch, location sync, transform,
+    insert, logging, ...) and counts, per stage, the API requests and bytes
+    received (from the request scheduler) and the database round-trips and
+    rows received (from the pooled cursors).
+
+    Stages may nest, e.g. a log flush during the fetch: the time and the
+    counters go to the innermost stage only, so the stages of a thread add
+    up to its time. Each thread has its own stages, e.g. the writer thread
+    of the populate pipeline, so the stages of different threads overlap;
+    the API counters go to the stages of the thread that opened the
+    profile, on whose behalf the requests are made.
+
+    On exit the metrics are printed and, with a run, written to the
+    populate_stage_metrics table in the transaction of the run.
+
+    Usage:
+        with PopulateRun() as run, RunProfile(run):
+            with stage("fetch"):
+                ...
+
+    Methods:
+        - stage(name) -> context manager timing a stage.
+        - metrics(none) -> returns the metrics of every stage.
+    """
+
+    def __init__(self, run=None) -> None:
+        """
+        Initializes an empty profile of the given PopulateRun, if any.
+        """
+        self.run = run
+        self.stages = {}  # name -> metrics, in the order first entered
+        # Stage stack of each thread
+        self._stacks = {}
+        # (time, API requests, API bytes) when the current stage of each
+        # thread resumed
+        self._marks = {}
+        self._thread = threading.get_ident()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the statements of the with block as the given stage.
+        """
+        thread = threading.get_ident()
+        with self._lock:
+            self._charge(thread)
+            metrics = self.stages.setdefault(name, {
+                "wall_ms": 0.0, "calls": 0, "api_requests": 0,
+                "db_round_trips": 0, "rows_received": 0,
+                "bytes_received": 0})
+            metrics["calls"] += 1
+            self._stacks.setdefault(thread, []).append(name)
+        try:
+            yield metrics
+        finally:
+            with self._lock:
+                self._charge(thread)
+                self._stacks[thread].pop()
+
+    def metrics(self) -> dict:
+        """
+        Returns {stage: metrics} of the stages run so far.
+
+        Parameters:
+            none
+        """
+        with self._lock:
+            return {name: dict(metrics)
+                    for name, metrics in self.stages.items()}
+
+    def _charge(self, thread) -> None:
+        # Adds the time since the last mark of the thread to its innermost
+        # stage, along with the API counters in the thread of the profile
+        # (called with the lock held)
+        now = time.perf_counter()
+        api = {"requests": 0, "bytes_received": 0}
+        if thread == self._thread:
+            api = scheduler.metrics()
+        stack, mark = self._stacks.get(thread), self._marks.get(thread)
+        if stack and mark is not None:
+            metrics = self.stages[stack[-1]]
+            metrics["wall_ms"] += (now - mark[0]) * 1000
+            metrics["api_requests"] += api["requests"] - mark[1]
+            metrics["bytes_received"] += api["bytes_received"] - mark[2]
+        self._marks[thread] = (now, api["requests"], api["bytes_received"])
+
+    def _trace(self, trace) -> None:
+        # Query tracer: counts the round-trips of the current stage of the
+        # thread running the query
+        with self._lock:
+            stack = self._stacks.get(threading.get_ident())
+            if stack:
+                metrics = self.stages[stack[-1]]
+                metrics["db_round_trips"] += 1
+                metrics["rows_received"] += trace["rows"]
+
+    def __enter__(self):
+        global _active_profile
+        _active_profile = self
+        add_query_tracer(self._trace)
+        return self
+
+    def __exit__(self, *exc):
+        global _active_profile
+        _active_profile = None
+        remove_query_tracer(self._trace)
+
+        # Feedback print of the stages
+        for name, metrics in self.metrics().items():
+            print(f"Stage {name}: {metrics['wall_ms']:.0f} ms, "
+                  f"{metrics['api_requests']} API requests "
+                  f"({metrics['bytes_received']} bytes), "
+                  f"{metrics['db_round_trips']} DB round-trips")
+        if self.run is not None and self.stages:
+            self.run.insert_logs("populate_stage_metrics", (
+                STAGE_COLUMNS,
+                *[(self.run.populate_id, name, round(metrics["wall_ms"], 3),
+                   metrics["calls"], metrics["api_requests"],
+                   metrics["db_round_trips"], metrics["rows_received"],
+                   metrics["bytes_received"])
+                  for name, metrics in self.metrics().items()]))
+
+
+@contextmanager
+def stage(name):
+    """
+    Times the with block as a stage of the running populate's profile; does
+    nothing outside of a RunProfile.
+
+    Parameters:
+        name (str): The name of the stage.
+        e.g. "fetch", "location_sync", "transform", "write_wait", "insert",
+        "logging"
+    """
+    profile = _active_profile
+    if profile is None:
+        yield None
+        return
+    with profile.stage(name) as metrics:
+        yield metrics
@@ -1,9 +1,11 @@
 import datetime
 from api.key_processor import load_location_keys
-from db.data_crud import get_value_single_where
+from db.location_cache import location_directory
 
 
-def _12_hour_forecast_data_db_format_transformation(json_data: dict) -> dict:
+def _12_hour_forecast_data_db_format_transformation(
+        json_data: dict, location_ids: dict = None,
+        location_keys: dict = None) -> dict:
     """
     Transforms the 12-hour forecast data into a database-friendly format.
 
@@ -15,13 +17,25 @@ def _12_hour_forecast_data_db_format_transformation(json_data: dict) -> dict:
             '2025-01-21T16:00:00+05:30', 24.4, '18527')]}
 
     P.S refer to unclean data in api/data_fetcher.py
+
+    Parameters:
+        json_data (dict): The forecast data by location name.
+        location_ids (dict): Optional location name -> location_id mapping,
+        e.g. the one returned by sync_locations; the cached location
+        directory is used for the names it does not contain.
+        location_keys (dict): Optional location name -> key mapping, e.g.
+        when transforming one location at a time; defaults to the keys of
+        the bin file.
     """
 
     nice_format_data = {}
-    location_keys = load_location_keys()
+    if location_keys is None:
+        location_keys = load_location_keys()
     for location in json_data:
-        location_id = get_value_single_where("locations", "location_id",
-                                             location, "location_name")
+        # Synced or cached name -> id lookup, no round-trip either way
+        location_id = (location_ids or {}).get(location)
+        if location_id is None:
+            location_id = location_directory.get_id(location)
         currtime = datetime.datetime.now().isoformat()
         forecast_data = json_data[location]
         nice_format_data[location] = []